@@ -0,0 +1,613 @@
+# Streams a product manifest (CSV, JSON Lines or YAML) into the database in batches.
+#
+#   python CatalogImport.py catalog/products.csv --batch-size 500
+#
+# Manifest columns: product_name, standard_weight, product_description, product_price,
+# product_type, image_path, inventory_location, inventory_total_weight, inventory_value,
+# expiration_days (or inventory_expiration_date) and an optional salad_weight.
+
+import argparse
+import csv
+import hashlib
+import json
+import ntpath
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from ConnectionPool import ConnectionPool
+from DatabaseManager import (DatabaseManager, Inventory, Product, ProductImageDerivative, StandardWeightProduct,
+                             StoredImage)
+from ImageLoader import STREAM_THRESHOLD, ImagePrefetcher, LoadedImage, load_images
+from ImageProcessing import ImageProcessor
+from ImageStore import ImageStore
+from Tracing import tracer
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+@dataclass
+class ManifestRow:
+    product_name: str
+    standard_weight: Optional[float]
+    product_description: str
+    product_price: float
+    product_type: str
+    image_path: str
+    inventory_location: str
+    inventory_total_weight: float
+    inventory_value: float
+    inventory_expiration_date: datetime
+    salad_weight: Optional[float] = None
+
+
+@dataclass
+class ImportStats:
+    products: int = 0
+    rows: int = 0
+    skipped: int = 0
+    failed_batches: int = 0
+    image_bytes: int = 0
+    images_uploaded: int = 0
+    images_deduplicated: int = 0
+    uploaded_bytes: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    started: float = 0.0
+    image_wait: float = 0.0
+    db_time: float = 0.0
+    # Writer threads waiting for a batch, and the reading thread waiting for room to hand one over
+    writer_idle: float = 0.0
+    handoff_wait: float = 0.0
+
+    @classmethod
+    def combine(cls, main: 'ImportStats', others: List['ImportStats']) -> 'ImportStats':
+        combined = cls(started=main.started)
+        for stats in [main] + others:
+            for stats_field in fields(cls):
+                if stats_field.name != 'started':
+                    setattr(combined, stats_field.name,
+                            getattr(combined, stats_field.name) + getattr(stats, stats_field.name))
+        return combined
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        elapsed = self.elapsed
+        rate = self.products / elapsed if elapsed else 0.0
+        mb_rate = self.image_bytes / 1_000_000 / elapsed if elapsed else 0.0
+        return (f"{self.products} products ({self.inserted} inserted, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {self.skipped} skipped; {self.rows} rows written) in {elapsed:.1f}s "
+                f"- {rate:,.0f} products/sec, {mb_rate:.1f} MB/sec of images "
+                f"(database {self.db_time:.1f}s, waiting on images {self.image_wait:.1f}s, "
+                f"writer idle {self.writer_idle:.1f}s, reader blocked on writer {self.handoff_wait:.1f}s); "
+                f"{self.images_uploaded} images uploaded ({self.uploaded_bytes / 1_000_000:.1f} MB), "
+                f"{self.images_deduplicated} already stored")
+
+
+def _optional_float(value) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def parse_row(record: dict, base_dir: str = '') -> ManifestRow:
+    if record.get('inventory_expiration_date'):
+        expiration = record['inventory_expiration_date']
+        if not isinstance(expiration, datetime):
+            expiration = datetime.fromisoformat(str(expiration))
+    else:
+        expiration = datetime.now() + timedelta(days=float(record.get('expiration_days') or 0))
+
+    image_path = str(record['image_path'])
+    if base_dir and not os.path.isabs(image_path) and not ntpath.isabs(image_path):
+        image_path = os.path.join(base_dir, image_path)
+
+    return ManifestRow(
+        product_name=str(record['product_name']),
+        standard_weight=_optional_float(record.get('standard_weight')),
+        product_description=str(record.get('product_description') or ''),
+        product_price=float(record['product_price']),
+        product_type=str(record['product_type']),
+        image_path=image_path,
+        inventory_location=str(record['inventory_location']),
+        inventory_total_weight=float(record['inventory_total_weight']),
+        inventory_value=float(record['inventory_value']),
+        inventory_expiration_date=expiration,
+        salad_weight=_optional_float(record.get('salad_weight'))
+    )
+
+
+def _read_records(path: str) -> Iterator[dict]:
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as f:
+        if extension == '.csv':
+            yield from csv.DictReader(f)
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ImportError("PyYAML is required to read YAML manifests (pip install pyyaml)")
+            # Multi-document streams ("---" per product) are read lazily; a single
+            # top-level list has to be loaded by PyYAML in one go.
+            for document in yaml.safe_load_all(f):
+                if isinstance(document, list):
+                    yield from document
+                elif document:
+                    yield document
+        else:
+            raise ValueError(f"Unsupported manifest format: {path}")
+
+
+def read_manifest(path: str, stats: Optional[ImportStats] = None) -> Iterator[ManifestRow]:
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for line_number, record in enumerate(_read_records(path), start=1):
+        try:
+            yield parse_row(record, base_dir)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping manifest entry {line_number}: {e}")
+            if stats is not None:
+                stats.skipped += 1
+
+
+# Namespace for the stable IDs minted by sync mode from a product's natural key
+CATALOG_NAMESPACE = uuid.UUID('6f1c8c1e-3f5d-4b7e-9a43-2d0c9e7b5a10')
+
+
+def natural_key(row: ManifestRow):
+    return row.product_name, row.product_type
+
+
+def standard_weight_product_id(product_id: str, standard_type: str) -> str:
+    # Derived from the product, so a re-sync updates the same row instead of replacing it
+    return str(uuid.uuid5(CATALOG_NAMESPACE, f"standard_weight/{product_id}/{standard_type}"))
+
+
+def build_catalog_rows(row: ManifestRow, image_hash: str, filling_standard_weight_id: str,
+                       salad_standard_weight_id: str, product_id: Optional[str] = None,
+                       inventory_id: Optional[str] = None):
+    product_id = product_id or str(uuid.uuid4())
+    inventory_id = inventory_id or str(uuid.uuid4())
+
+    inventory = Inventory(
+        inventory_id=inventory_id,
+        total_weight=row.inventory_total_weight,
+        inventory_value=row.inventory_value,
+        inventory_expiration_date=row.inventory_expiration_date,
+        location=row.inventory_location
+    )
+
+    product = Product(
+        product_id=product_id,
+        product_name=row.product_name,
+        product_description=row.product_description,
+        product_price=row.product_price,
+        product_type=row.product_type,
+        product_image=None,
+        inventory_id=inventory_id,
+        image_hash=image_hash
+    )
+
+    standard_weight_products = []
+    if row.standard_weight is not None:
+        standard_weight_products.append(StandardWeightProduct(
+            standard_weight_product_id=standard_weight_product_id(product_id, 'FILLING'),
+            standard_weight=row.standard_weight,
+            standard_weight_id=filling_standard_weight_id,
+            product_id=product_id
+        ))
+    if row.salad_weight is not None:
+        standard_weight_products.append(StandardWeightProduct(
+            standard_weight_product_id=standard_weight_product_id(product_id, 'SALAD'),
+            standard_weight=row.salad_weight,
+            standard_weight_id=salad_standard_weight_id,
+            product_id=product_id
+        ))
+
+    return inventory, product, standard_weight_products
+
+
+@dataclass
+class CatalogBatch:
+    inventories: List[Inventory] = field(default_factory=list)
+    products: List[Product] = field(default_factory=list)
+    standard_weight_products: List[StandardWeightProduct] = field(default_factory=list)
+    image_derivatives: List[ProductImageDerivative] = field(default_factory=list)
+    images: Dict[str, StoredImage] = field(default_factory=dict)
+    image_bytes: int = 0
+
+    def add(self, loaded: LoadedImage, filling_standard_weight_id: str, salad_standard_weight_id: str,
+            product_id: Optional[str] = None, inventory_id: Optional[str] = None) -> Product:
+        inventory, product, weights = build_catalog_rows(loaded.row, loaded.image_hash, filling_standard_weight_id,
+                                                         salad_standard_weight_id, product_id, inventory_id)
+        self.inventories.append(inventory)
+        self.products.append(product)
+        self.standard_weight_products.extend(weights)
+        self.image_bytes += loaded.byte_size
+        self.images[loaded.image_hash] = StoredImage(image_hash=loaded.image_hash, content_type=loaded.content_type,
+                                                     image_data=loaded.image_data, byte_size=loaded.byte_size,
+                                                     source_path=loaded.row.image_path if loaded.streamed else None)
+        for derivative in loaded.derivatives or []:
+            self.images[derivative.image_hash] = StoredImage(image_hash=derivative.image_hash,
+                                                             content_type=derivative.content_type,
+                                                             image_data=derivative.image_data)
+            self.image_derivatives.append(ProductImageDerivative(
+                product_id=product.product_id,
+                size_name=derivative.size_name,
+                width=derivative.width,
+                height=derivative.height,
+                content_type=derivative.content_type,
+                image_hash=derivative.image_hash
+            ))
+        return product
+
+    @property
+    def row_count(self) -> int:
+        return (len(self.inventories) + len(self.products) + len(self.standard_weight_products)
+                + len(self.image_derivatives))
+
+
+def catalog_fingerprint(product: Product, standard_weight_products: List[StandardWeightProduct],
+                        image_derivatives: List[ProductImageDerivative]) -> str:
+    payload = json.dumps([
+        product.product_name,
+        product.product_description,
+        f"{product.product_price:.2f}",
+        product.product_type,
+        product.image_hash,
+        sorted((weight.standard_weight_id, f"{weight.standard_weight:.2f}") for weight in standard_weight_products),
+        sorted((derivative.size_name, derivative.image_hash) for derivative in image_derivatives),
+    ], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _upload_streamed_images(image_store: ImageStore, images: List[StoredImage]) -> List[StoredImage]:
+    # Large files go to the server as chunked large objects in the current transaction;
+    # the rest are returned for the multi-row insert
+    inline_images = []
+    for image in images:
+        if image.source_path is not None:
+            image_store.upload_stream(image)
+        else:
+            inline_images.append(image)
+    return inline_images
+
+
+def _insert_batch(db_manager: DatabaseManager, image_store: ImageStore, stats: ImportStats,
+                  pending: List[LoadedImage], filling_standard_weight_id: str, salad_standard_weight_id: str):
+    batch = CatalogBatch()
+    for loaded in pending:
+        batch.add(loaded, filling_standard_weight_id, salad_standard_weight_id)
+
+    # Images whose hash is already stored are referenced, not uploaded again
+    new_images = image_store.new_images(batch.images.values())
+    inline_images = _upload_streamed_images(image_store, new_images)
+    db_manager.bulk_insert(batch.inventories, batch.products, batch.standard_weight_products,
+                           image_derivatives=batch.image_derivatives, images=inline_images)
+
+    image_store.remember(batch.images.keys())
+    stats.products += len(batch.products)
+    stats.inserted += len(batch.products)
+    stats.rows += batch.row_count + len(new_images)
+    stats.image_bytes += batch.image_bytes
+    stats.images_uploaded += len(new_images)
+    stats.images_deduplicated += len(batch.images) - len(new_images)
+    stats.uploaded_bytes += sum(image.byte_size for image in new_images)
+
+
+def _sync_batch(db_manager: DatabaseManager, image_store: ImageStore, stats: ImportStats,
+                pending: List[LoadedImage], filling_standard_weight_id: str, salad_standard_weight_id: str):
+    # A manifest that repeats a natural key keeps its last entry
+    latest = {natural_key(loaded.row): loaded for loaded in pending}
+
+    existing = db_manager.find_products_by_natural_key(list(latest))
+    batch = CatalogBatch()
+    for key, loaded in latest.items():
+        product_id, inventory_id, _ = existing.get(key, (None, None, None))
+        batch.add(loaded, filling_standard_weight_id, salad_standard_weight_id,
+                  product_id or str(uuid.uuid5(CATALOG_NAMESPACE, f"product/{key[1]}/{key[0]}")),
+                  inventory_id or str(uuid.uuid5(CATALOG_NAMESPACE, f"inventory/{key[1]}/{key[0]}")))
+
+    weights_by_product = defaultdict(list)
+    for weight in batch.standard_weight_products:
+        weights_by_product[weight.product_id].append(weight)
+    derivatives_by_product = defaultdict(list)
+    for derivative in batch.image_derivatives:
+        derivatives_by_product[derivative.product_id].append(derivative)
+
+    changed: Dict[str, Product] = {}
+    unchanged = 0
+    for product in batch.products:
+        product.fingerprint = catalog_fingerprint(product, weights_by_product[product.product_id],
+                                                  derivatives_by_product[product.product_id])
+        stored_fingerprint = existing.get((product.product_name, product.product_type), (None, None, None))[2]
+        if product.fingerprint == stored_fingerprint:
+            unchanged += 1
+        else:
+            changed[product.product_id] = product
+
+    inserted = sum(1 for key in latest if key not in existing)
+    products = list(changed.values())
+    changed_inventory_ids = {product.inventory_id for product in products}
+    inventories = [inventory for inventory in batch.inventories if inventory.inventory_id in changed_inventory_ids]
+    standard_weight_products = [weight for weight in batch.standard_weight_products if weight.product_id in changed]
+    image_derivatives = [derivative for derivative in batch.image_derivatives if derivative.product_id in changed]
+    referenced_hashes = ({product.image_hash for product in products}
+                         | {derivative.image_hash for derivative in image_derivatives})
+    new_images = image_store.new_images(image for image_hash, image in batch.images.items()
+                                        if image_hash in referenced_hashes)
+    if products:
+        inline_images = _upload_streamed_images(image_store, new_images)
+        db_manager.bulk_upsert(inventories, products, standard_weight_products,
+                               image_derivatives=image_derivatives, images=inline_images)
+    else:
+        db_manager.rollback()
+
+    image_store.remember(batch.images.keys() & referenced_hashes)
+    stats.products += len(latest)
+    stats.inserted += inserted
+    stats.updated += len(products) - inserted
+    stats.unchanged += unchanged
+    stats.rows += len(inventories) + len(products) + len(standard_weight_products) + len(image_derivatives)
+    stats.image_bytes += batch.image_bytes
+    stats.images_uploaded += len(new_images)
+    stats.images_deduplicated += len(referenced_hashes) - len(new_images)
+    stats.uploaded_bytes += sum(image.byte_size for image in new_images)
+
+
+def _write_with_retry(write_batch, db_manager: DatabaseManager, image_store: ImageStore, stats: ImportStats,
+                      pending: List[LoadedImage], filling_standard_weight_id: str, salad_standard_weight_id: str,
+                      retries: int = 2, retry_delay: float = 0.5) -> bool:
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            with tracer.span("write batch", 'db', products=len(pending), attempt=attempt):
+                write_batch(db_manager, image_store, stats, pending, filling_standard_weight_id,
+                            salad_standard_weight_id)
+            return True
+        except Exception as e:
+            try:
+                db_manager.rollback()
+            except Exception:
+                pass
+            if attempt == retries:
+                print(f"Error writing batch of {len(pending)} products: {e}")
+                stats.failed_batches += 1
+                stats.skipped += len(pending)
+                return False
+            print(f"Retrying batch of {len(pending)} products after error: {e}")
+            time.sleep(retry_delay * 2 ** attempt)
+        finally:
+            stats.db_time += time.perf_counter() - start
+    return False
+
+
+def _stream_batches(path: str, stats: ImportStats, batch_size: int, readers: int, prefetch: int,
+                    derivatives: bool, processes: Optional[int],
+                    stream_threshold: Optional[int]) -> Iterator[List[LoadedImage]]:
+    rows = read_manifest(path, stats)
+    prefetcher = (ImagePrefetcher(rows, readers=readers, prefetch=prefetch, stream_threshold=stream_threshold)
+                  if readers > 0 else None)
+    loaded_images = prefetcher if prefetcher else load_images(rows, stream_threshold)
+    if derivatives:
+        loaded_images = ImageProcessor(loaded_images, processes=processes, window=prefetch)
+    loaded_images = iter(loaded_images)
+
+    # Only one batch of rows (plus the prefetch window of images) is held per consumer
+    pending: List[LoadedImage] = []
+    while True:
+        wait_start = time.perf_counter()
+        with tracer.span("wait for image", 'disk'):
+            loaded = next(loaded_images, None)
+        stats.image_wait += time.perf_counter() - wait_start
+        if loaded is None:
+            break
+        if loaded.error:
+            print(f"Skipping {loaded.row.product_name}: {loaded.error}")
+            stats.skipped += 1
+            continue
+
+        pending.append(loaded)
+        if len(pending) >= batch_size:
+            yield pending
+            pending = []
+
+    if pending:
+        yield pending
+    if prefetcher:
+        print(prefetcher.report())
+
+
+def import_manifest(db_manager: DatabaseManager, path: str, batch_size: int = 500, readers: int = 0,
+                    prefetch: int = 64, derivatives: bool = False, processes: Optional[int] = None,
+                    sync: bool = False, retries: int = 2, stream_threshold: Optional[int] = STREAM_THRESHOLD,
+                    progress_every: float = 2.0, write_ahead: int = 2) -> ImportStats:
+    # Batches are handed to a dedicated writer thread through a queue of write_ahead
+    # batches, so the next batch's images are read while the current one is written and
+    # the import takes about max(disk, database) rather than their sum. The idle times
+    # in the report show which side was the bottleneck.
+    stats = ImportStats(started=time.perf_counter())
+    writer_stats = ImportStats(started=stats.started)
+    image_store = ImageStore(db_manager)
+    filling_standard_weight_id = db_manager.get_filling_standard_weight().standard_weight_id
+    salad_standard_weight_id = db_manager.get_standard_weight("SALAD").standard_weight_id
+    write_batch = _sync_batch if sync else _insert_batch
+    batches = queue.Queue(maxsize=write_ahead)
+
+    def write():
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                pending = batches.get()
+                writer_stats.writer_idle += time.perf_counter() - wait_start
+                if pending is None:
+                    return
+                _write_with_retry(write_batch, db_manager, image_store, writer_stats, pending,
+                                  filling_standard_weight_id, salad_standard_weight_id, retries)
+        except Exception as e:
+            # Keep draining so the reader never blocks on a dead writer
+            print(f"Writer stopped: {e}")
+            while True:
+                pending = batches.get()
+                if pending is None:
+                    return
+                writer_stats.failed_batches += 1
+                writer_stats.skipped += len(pending)
+
+    writer = threading.Thread(target=write, name='catalog-writer', daemon=True)
+    writer.start()
+    last_report = stats.started
+    try:
+        for pending in _stream_batches(path, stats, batch_size, readers, prefetch, derivatives, processes,
+                                       stream_threshold):
+            put_start = time.perf_counter()
+            batches.put(pending)
+            stats.handoff_wait += time.perf_counter() - put_start
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                print(ImportStats.combine(stats, [writer_stats]).report())
+                last_report = now
+    finally:
+        batches.put(None)
+        writer.join()
+
+    stats = ImportStats.combine(stats, [writer_stats])
+    print(stats.report())
+    return stats
+
+
+def import_manifest_parallel(pool: ConnectionPool, path: str, workers: int = 4, batch_size: int = 500,
+                             readers: int = 4, prefetch: int = 64, derivatives: bool = False,
+                             processes: Optional[int] = None, sync: bool = False, retries: int = 3,
+                             stream_threshold: Optional[int] = STREAM_THRESHOLD,
+                             progress_every: float = 2.0) -> ImportStats:
+    # The manifest is cut into batch-sized shards that N workers take from a bounded queue.
+    # Each worker owns one pooled connection and writes every shard in its own transaction
+    # (inventory before products), retrying a failed shard without disturbing the others.
+    stats = ImportStats(started=time.perf_counter())
+    with pool.database_manager() as db_manager:
+        filling_standard_weight_id = db_manager.get_filling_standard_weight().standard_weight_id
+        salad_standard_weight_id = db_manager.get_standard_weight("SALAD").standard_weight_id
+        db_manager.rollback()
+    write_batch = _sync_batch if sync else _insert_batch
+    shards = queue.Queue(maxsize=workers * 2)
+    worker_stats = [ImportStats(started=stats.started) for _ in range(workers)]
+
+    def work(shard_stats: ImportStats):
+        try:
+            with pool.database_manager() as worker_db_manager:
+                image_store = ImageStore(worker_db_manager)
+                while True:
+                    wait_start = time.perf_counter()
+                    pending = shards.get()
+                    shard_stats.writer_idle += time.perf_counter() - wait_start
+                    if pending is None:
+                        return
+                    _write_with_retry(write_batch, worker_db_manager, image_store, shard_stats, pending,
+                                      filling_standard_weight_id, salad_standard_weight_id, retries)
+        except Exception as e:
+            # Keep draining so the reader never blocks on a dead worker
+            print(f"Loader worker stopped: {e}")
+            while True:
+                pending = shards.get()
+                if pending is None:
+                    return
+                shard_stats.failed_batches += 1
+                shard_stats.skipped += len(pending)
+
+    threads = [threading.Thread(target=work, args=(shard_stats,), daemon=True) for shard_stats in worker_stats]
+    for thread in threads:
+        thread.start()
+
+    last_report = stats.started
+    for pending in _stream_batches(path, stats, batch_size, readers, prefetch, derivatives, processes,
+                                   stream_threshold):
+        put_start = time.perf_counter()
+        shards.put(pending)
+        stats.handoff_wait += time.perf_counter() - put_start
+        now = time.perf_counter()
+        if now - last_report >= progress_every:
+            print(ImportStats.combine(stats, worker_stats).report())
+            last_report = now
+
+    for _ in threads:
+        shards.put(None)
+    for thread in threads:
+        thread.join()
+
+    stats = ImportStats.combine(stats, worker_stats)
+    print(stats.report())
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a product manifest into DeliTelligenceDB")
+    parser.add_argument('manifest', help="CSV, JSON Lines or YAML product manifest")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="database connections loading shards of the manifest in parallel")
+    parser.add_argument('--readers', type=int, default=4,
+                        help="image reader threads running ahead of the database writer (0 reads inline)")
+    parser.add_argument('--prefetch', type=int, default=64, help="maximum images buffered ahead of the writer")
+    parser.add_argument('--derivatives', action='store_true',
+                        help="normalize images and store thumbnail/card/full sizes (requires Pillow)")
+    parser.add_argument('--processes', type=int, default=None, help="image processing worker processes")
+    parser.add_argument('--stream-threshold-mb', type=float, default=STREAM_THRESHOLD / 1024 / 1024,
+                        help="images larger than this are streamed to large objects instead of buffered")
+    parser.add_argument('--sync', action='store_true',
+                        help="match products by name and type and only write rows whose fingerprint changed")
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help="write a Chrome trace (chrome://tracing) of disk and database time to PATH")
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args(argv)
+    stream_threshold = int(args.stream_threshold_mb * 1024 * 1024)
+    if args.trace:
+        tracer.enable()
+
+    pool = ConnectionPool(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                          port=args.port, min_size=1, max_size=args.workers)
+    try:
+        with pool.database_manager() as db_manager:
+            db_manager.create_image_store_tables()
+            if args.sync:
+                db_manager.create_sync_columns()
+            if args.workers <= 1:
+                stats = import_manifest(db_manager, args.manifest, batch_size=args.batch_size,
+                                        readers=args.readers, prefetch=args.prefetch, derivatives=args.derivatives,
+                                        processes=args.processes, sync=args.sync,
+                                        stream_threshold=stream_threshold)
+        if args.workers > 1:
+            stats = import_manifest_parallel(pool, args.manifest, workers=args.workers, batch_size=args.batch_size,
+                                             readers=args.readers, prefetch=args.prefetch,
+                                             derivatives=args.derivatives, processes=args.processes, sync=args.sync,
+                                             stream_threshold=stream_threshold)
+        print(pool.stats())
+    finally:
+        pool.close()
+        if args.trace:
+            tracer.save(args.trace)
+            print(f"Trace written to {args.trace}")
+    return 1 if stats.failed_batches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
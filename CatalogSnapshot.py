@@ -0,0 +1,402 @@
+# Offline catalog snapshots for UI clients. The server exports TBL_PRODUCT, its standard
+# weights, TBL_INVENTORY and the product images into one versioned SQLite file; clients
+# open it lazily and later fetch a delta holding only what changed since their version.
+#
+#   python CatalogSnapshot.py publish --directory snapshots
+#   python CatalogSnapshot.py delta --directory snapshots --since 3
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Iterator, List, Optional
+
+from DatabaseManager import DatabaseManager, ProductImage
+from ImageLoader import detect_content_type
+from ImageStore import ImageStore
+from ProductCatalog import CatalogProduct, _name_key
+
+FORMAT_VERSION = 1
+BLOB_CHUNK_SIZE = 256 * 1024
+SNAPSHOT_PATTERN = re.compile(r'catalog-(\d+)\.sqlite$')
+
+SNAPSHOT_SCHEMA = """
+    CREATE TABLE meta (KEY TEXT PRIMARY KEY, VALUE TEXT NOT NULL);
+    CREATE TABLE products (
+        PRODUCT_ID TEXT PRIMARY KEY,
+        PRODUCT_NAME TEXT,
+        NAME_KEY TEXT,
+        PRODUCT_DESCRIPTION TEXT,
+        PRODUCT_PRICE REAL,
+        PRODUCT_TYPE TEXT,
+        INVENTORY_ID TEXT,
+        IMAGE_HASH TEXT,
+        -- JSON object of STANDARD_TYPE -> grams
+        STANDARD_WEIGHTS TEXT NOT NULL,
+        ROW_HASH TEXT NOT NULL
+    );
+    CREATE TABLE inventory (
+        INVENTORY_ID TEXT PRIMARY KEY,
+        TOTAL_WEIGHT REAL,
+        INVENTORY_VALUE REAL,
+        INVENTORY_EXPIRATION_DATE TEXT,
+        LOCATION TEXT,
+        ROW_HASH TEXT NOT NULL
+    );
+    CREATE TABLE images (
+        IMAGE_HASH TEXT PRIMARY KEY,
+        CONTENT_TYPE TEXT,
+        BYTE_SIZE INTEGER NOT NULL,
+        IMAGE_DATA BLOB NOT NULL
+    );
+    -- Delta snapshots only: rows the client must drop (KIND is product, inventory or image)
+    CREATE TABLE deleted (KIND TEXT NOT NULL, ID TEXT NOT NULL, PRIMARY KEY (KIND, ID));
+    CREATE INDEX IX_PRODUCTS_TYPE ON products (PRODUCT_TYPE);
+    CREATE INDEX IX_PRODUCTS_NAME_KEY ON products (NAME_KEY);
+"""
+
+
+def _row_hash(*values) -> str:
+    return hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+
+def _create(path: str) -> sqlite3.Connection:
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SNAPSHOT_SCHEMA)
+    return conn
+
+
+def _discard(path: str):
+    # Removes a half-written temporary file after a failed export or delta
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_meta(conn: sqlite3.Connection, **values):
+    conn.executemany("INSERT OR REPLACE INTO meta (KEY, VALUE) VALUES (?, ?)",
+                     [(key, str(value)) for key, value in values.items()])
+
+
+def _write_image(conn: sqlite3.Connection, image_hash: str, content_type: Optional[str], byte_size: int,
+                 chunks: Iterator[bytes]):
+    # The blob is sized up front and filled chunk by chunk, so large images are never held whole
+    cur = conn.execute("INSERT INTO images (IMAGE_HASH, CONTENT_TYPE, BYTE_SIZE, IMAGE_DATA) VALUES (?, ?, ?, zeroblob(?))",
+                       (image_hash, content_type, byte_size, byte_size))
+    with conn.blobopen('images', 'IMAGE_DATA', cur.lastrowid) as blob:
+        for chunk in chunks:
+            blob.write(chunk)
+
+
+def export_snapshot(db_manager: DatabaseManager, path: str, version: int) -> dict:
+    # Writes a full snapshot to path (via a temporary file, so readers never see half of one).
+    # Every query runs in one REPEATABLE READ transaction, so products, their weights and
+    # images, and inventory all come from the same point in time even while syncs commit.
+    start = time.perf_counter()
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    conn = _create(temporary)
+    try:
+        cur = db_manager.cur
+        db_manager.rollback()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cur.execute("""
+            SELECT p.PRODUCT_ID, p.PRODUCT_NAME, p.PRODUCT_DESCRIPTION, p.PRODUCT_PRICE, p.PRODUCT_TYPE,
+                   p.INVENTORY_ID, p.IMAGE_HASH, p.PRODUCT_IMAGE IS NOT NULL
+            FROM TBL_PRODUCT p
+        """)
+        products = cur.fetchall()
+        cur.execute("""
+            SELECT swp.PRODUCT_ID, sw.STANDARD_TYPE, swp.STANDARD_WEIGHT
+            FROM TBL_STANDARD_WEIGHT_PRODUCT swp
+            JOIN TBL_STANDARD_WEIGHT sw ON sw.STANDARD_WEIGHT_ID = swp.STANDARD_WEIGHT_ID
+        """)
+        standard_weights = {}
+        for product_id, standard_type, standard_weight in cur.fetchall():
+            standard_weights.setdefault(product_id, {})[standard_type] = float(standard_weight)
+
+        image_store = ImageStore(db_manager)
+        written_images = set()
+        product_rows = []
+        for product_id, name, description, price, product_type, inventory_id, image_hash, has_legacy in products:
+            if image_hash is None and has_legacy:
+                # Legacy inline images are hashed here, so clients only ever see content addresses
+                data = ProductImage.from_database(db_manager, product_id).read()
+                image_hash = hashlib.sha256(data).hexdigest()
+                if image_hash not in written_images:
+                    _write_image(conn, image_hash, detect_content_type(data), len(data), iter([data]))
+                    written_images.add(image_hash)
+            elif image_hash is not None and image_hash not in written_images:
+                image = image_store.describe(image_hash)
+                if image is not None:
+                    _write_image(conn, image_hash, image.content_type, image.byte_size,
+                                 image_store.iter_chunks(image_hash, chunk_size=BLOB_CHUNK_SIZE))
+                    written_images.add(image_hash)
+            price = float(price) if price is not None else None
+            weights = json.dumps(standard_weights.get(product_id, {}), sort_keys=True)
+            product_rows.append((product_id, name, _name_key(name or ''), description, price, product_type,
+                                 inventory_id, image_hash, weights,
+                                 _row_hash(name, description, price, product_type, inventory_id, image_hash, weights)))
+        conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", product_rows)
+
+        cur.execute("""
+            SELECT INVENTORY_ID, TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION FROM TBL_INVENTORY
+        """)
+        inventory_rows = []
+        for inventory_id, total_weight, value, expiration, location in cur.fetchall():
+            total_weight = float(total_weight) if total_weight is not None else None
+            value = float(value) if value is not None else None
+            expiration = expiration.isoformat() if expiration is not None else None
+            inventory_rows.append((inventory_id, total_weight, value, expiration, location,
+                                   _row_hash(total_weight, value, expiration, location)))
+        conn.executemany("INSERT INTO inventory VALUES (?, ?, ?, ?, ?, ?)", inventory_rows)
+
+        _write_meta(conn, format=FORMAT_VERSION, kind='full', version=version, created_at=time.time())
+        conn.commit()
+    except Exception:
+        conn.close()
+        _discard(temporary)
+        raise
+    finally:
+        db_manager.rollback()
+        conn.close()
+    os.replace(temporary, path)
+    return {"path": path, "version": version, "products": len(product_rows), "inventory": len(inventory_rows),
+            "images": len(written_images), "bytes": os.path.getsize(path), "seconds": time.perf_counter() - start}
+
+
+def build_delta(base_path: str, target_path: str, path: str) -> dict:
+    # Diffs two full snapshots inside SQLite: rows whose ROW_HASH changed or that are new,
+    # images the base does not have, and tombstones for everything that went away
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    conn = _create(temporary)
+    try:
+        conn.execute("ATTACH DATABASE ? AS base", (base_path,))
+        conn.execute("ATTACH DATABASE ? AS target", (target_path,))
+        for table, key in (('products', 'PRODUCT_ID'), ('inventory', 'INVENTORY_ID')):
+            conn.execute(f"""
+                INSERT INTO main.{table} SELECT t.* FROM target.{table} t
+                LEFT JOIN base.{table} b ON b.{key} = t.{key}
+                WHERE b.ROW_HASH IS NULL OR b.ROW_HASH != t.ROW_HASH
+            """)
+        conn.execute("""
+            INSERT INTO main.images SELECT t.* FROM target.images t
+            WHERE NOT EXISTS (SELECT 1 FROM base.images b WHERE b.IMAGE_HASH = t.IMAGE_HASH)
+        """)
+        for kind, table, key in (('product', 'products', 'PRODUCT_ID'), ('inventory', 'inventory', 'INVENTORY_ID'),
+                                 ('image', 'images', 'IMAGE_HASH')):
+            conn.execute(f"""
+                INSERT INTO main.deleted SELECT '{kind}', b.{key} FROM base.{table} b
+                WHERE NOT EXISTS (SELECT 1 FROM target.{table} t WHERE t.{key} = b.{key})
+            """)
+        base_version = conn.execute("SELECT VALUE FROM base.meta WHERE KEY = 'version'").fetchone()[0]
+        version = conn.execute("SELECT VALUE FROM target.meta WHERE KEY = 'version'").fetchone()[0]
+        _write_meta(conn, format=FORMAT_VERSION, kind='delta', version=version, base_version=base_version,
+                    created_at=time.time())
+        conn.commit()
+        conn.execute("DETACH DATABASE base")
+        conn.execute("DETACH DATABASE target")
+        counts = {table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                  for table in ('products', 'inventory', 'images', 'deleted')}
+    except Exception:
+        conn.close()
+        _discard(temporary)
+        raise
+    finally:
+        conn.close()
+    os.replace(temporary, path)
+    return {"path": path, "version": int(version), "base_version": int(base_version), **counts,
+            "bytes": os.path.getsize(path)}
+
+
+class SnapshotStore:
+    # Server side: full snapshots as <directory>/catalog-<version>.sqlite plus cached
+    # deltas between them. Only the newest `keep` full snapshots are retained; a client
+    # older than that gets a full snapshot instead of a delta.
+    def __init__(self, directory: str, keep: int = 10):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def versions(self) -> List[int]:
+        versions = []
+        for path in glob.glob(os.path.join(self.directory, 'catalog-*.sqlite')):
+            match = SNAPSHOT_PATTERN.search(os.path.basename(path))
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def latest_version(self) -> Optional[int]:
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def full_path(self, version: int) -> str:
+        return os.path.join(self.directory, f'catalog-{version}.sqlite')
+
+    def delta_path(self, base_version: int, version: int) -> str:
+        return os.path.join(self.directory, f'catalog-{base_version}-{version}.delta.sqlite')
+
+    def publish(self, db_manager: DatabaseManager) -> dict:
+        version = (self.latest_version() or 0) + 1
+        result = export_snapshot(db_manager, self.full_path(version), version)
+        self._prune()
+        return result
+
+    def snapshot_for(self, since: Optional[int] = None) -> Optional[str]:
+        # The file a client at version `since` should download: nothing new, a delta, or a full snapshot
+        latest = self.latest_version()
+        if latest is None or since == latest:
+            return None
+        if since is not None and os.path.exists(self.full_path(since)):
+            path = self.delta_path(since, latest)
+            if not os.path.exists(path):
+                build_delta(self.full_path(since), self.full_path(latest), path)
+            return path
+        return self.full_path(latest)
+
+    def _prune(self):
+        versions = self.versions()
+        for version in versions[:-self.keep]:
+            os.remove(self.full_path(version))
+        for path in glob.glob(os.path.join(self.directory, 'catalog-*-*.delta.sqlite')):
+            if int(os.path.basename(path).split('-')[1]) not in versions[-self.keep:]:
+                os.remove(path)
+
+
+class CatalogSnapshot:
+    # Client side. Opening a snapshot reads nothing but its meta table; products,
+    # inventory and images are looked up through SQLite's indexes when asked for, and
+    # images can be streamed straight out of the file.
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.meta = dict(self.conn.execute("SELECT KEY, VALUE FROM meta"))
+        if int(self.meta["format"]) != FORMAT_VERSION:
+            raise ValueError(f"{path} is snapshot format {self.meta['format']}, expected {FORMAT_VERSION}")
+
+    @property
+    def version(self) -> int:
+        return int(self.meta["version"])
+
+    def close(self):
+        self.conn.close()
+
+    def _product(self, row) -> CatalogProduct:
+        return CatalogProduct(product_id=row[0], product_name=row[1], product_description=row[2],
+                              product_price=row[3], product_type=row[4], inventory_id=row[5], image_hash=row[6],
+                              standard_weights=json.loads(row[7]))
+
+    def _products(self, where: str = '', params: tuple = (), limit: Optional[int] = None) -> List[CatalogProduct]:
+        sql = f"""
+            SELECT PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, INVENTORY_ID,
+                   IMAGE_HASH, STANDARD_WEIGHTS
+            FROM products {where} ORDER BY NAME_KEY, PRODUCT_ID
+        """
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [self._product(row) for row in self.conn.execute(sql, params)]
+
+    def get(self, product_id: str) -> Optional[CatalogProduct]:
+        products = self._products("WHERE PRODUCT_ID = ?", (product_id,))
+        return products[0] if products else None
+
+    def by_type(self, product_type: str) -> List[CatalogProduct]:
+        return self._products("WHERE PRODUCT_TYPE = ?", (product_type,))
+
+    def search(self, prefix: str, limit: Optional[int] = 50) -> List[CatalogProduct]:
+        # A range on the casefolded name key, which the NAME_KEY index answers
+        prefix = _name_key(prefix)
+        return self._products("WHERE NAME_KEY >= ? AND NAME_KEY < ?", (prefix, prefix + '\U0010ffff'), limit)
+
+    def products(self) -> List[CatalogProduct]:
+        return self._products()
+
+    def inventory(self, inventory_id: str) -> Optional[dict]:
+        row = self.conn.execute("""
+            SELECT TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION FROM inventory WHERE INVENTORY_ID = ?
+        """, (inventory_id,)).fetchone()
+        if row is None:
+            return None
+        return {"inventory_id": inventory_id, "total_weight": row[0], "inventory_value": row[1],
+                "inventory_expiration_date": row[2], "location": row[3]}
+
+    def image_info(self, image_hash: str) -> Optional[tuple]:
+        # (content type, byte size)
+        return self.conn.execute("SELECT CONTENT_TYPE, BYTE_SIZE FROM images WHERE IMAGE_HASH = ?",
+                                 (image_hash,)).fetchone()
+
+    def iter_image(self, image_hash: str, chunk_size: int = BLOB_CHUNK_SIZE) -> Iterator[bytes]:
+        row = self.conn.execute("SELECT rowid FROM images WHERE IMAGE_HASH = ?", (image_hash,)).fetchone()
+        if row is None:
+            return
+        with self.conn.blobopen('images', 'IMAGE_DATA', row[0], readonly=True) as blob:
+            yield from iter(lambda: blob.read(chunk_size), b'')
+
+    def image(self, image_hash: str) -> Optional[bytes]:
+        if self.image_info(image_hash) is None:
+            return None
+        return b''.join(self.iter_image(image_hash))
+
+    def apply_delta(self, delta_path: str):
+        # Brings this snapshot up to the delta's version in one transaction
+        delta = sqlite3.connect(delta_path)
+        try:
+            meta = dict(delta.execute("SELECT KEY, VALUE FROM meta"))
+        finally:
+            delta.close()
+        if meta.get("kind") != 'delta':
+            raise ValueError(f"{delta_path} is not a delta snapshot")
+        if int(meta["base_version"]) != self.version:
+            raise ValueError(f"Delta applies to version {meta['base_version']}, this snapshot is {self.version}")
+        with self.conn:
+            self.conn.execute("ATTACH DATABASE ? AS delta", (delta_path,))
+        try:
+            with self.conn:
+                for kind, table, key in (('product', 'products', 'PRODUCT_ID'),
+                                         ('inventory', 'inventory', 'INVENTORY_ID'),
+                                         ('image', 'images', 'IMAGE_HASH')):
+                    self.conn.execute(f"DELETE FROM main.{table} WHERE {key} IN "
+                                      f"(SELECT ID FROM delta.deleted WHERE KIND = '{kind}')")
+                    self.conn.execute(f"INSERT OR REPLACE INTO main.{table} SELECT * FROM delta.{table}")
+                _write_meta(self.conn, version=meta["version"], applied_at=time.time())
+        finally:
+            self.conn.execute("DETACH DATABASE delta")
+        self.meta = dict(self.conn.execute("SELECT KEY, VALUE FROM meta"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish offline catalog snapshots")
+    parser.add_argument('command', choices=['publish', 'delta'])
+    parser.add_argument('--directory', default='snapshots')
+    parser.add_argument('--keep', type=int, default=10, help="full snapshots to retain")
+    parser.add_argument('--since', type=int, default=None, help="client version to build a delta from")
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args(argv)
+    store = SnapshotStore(args.directory, keep=args.keep)
+
+    if args.command == 'publish':
+        db_manager = DatabaseManager(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                                     port=args.port)
+        try:
+            print(store.publish(db_manager))
+        finally:
+            db_manager.close()
+    else:
+        print(store.snapshot_for(args.since) or "Client is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from DatabaseManager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Thread-safe PostgreSQL connection pool shared by the importers and FoodScalesAPI.
+    # Idle connections are health-checked before reuse once they have sat longer than
+    # health_check_interval, and each connection keeps its own set of PREPAREd statements.
+    def __init__(self, dbname, user, password, host, port, min_size: int = 1, max_size: int = 10,
+                 acquire_timeout: float = 5.0, health_check_interval: float = 30.0):
+        self.connect_kwargs = dict(dbname=dbname, user=user, password=password, host=host, port=port)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.size = 0
+        self.in_use = 0
+        self.closed = False
+        self.prepared: Dict[int, set] = {}
+        self.created = time.monotonic()
+
+        self.acquire_count = 0
+        self.timeout_count = 0
+        self.discarded_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+        self.last_change = time.monotonic()
+
+        for _ in range(min_size):
+            self.idle.append((self._connect(), time.monotonic()))
+            self.size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self.prepared[id(conn)] = set()
+        return conn
+
+    def _discard(self, conn):
+        self.prepared.pop(id(conn), None)
+        self.discarded_count += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _track_busy(self):
+        # Integral of connections in use over time, for average utilization
+        now = time.monotonic()
+        self.busy_time += self.in_use * (now - self.last_change)
+        self.last_change = now
+
+    def acquire(self, timeout: Optional[float] = None):
+        # The lock only guards the bookkeeping: an idle connection is taken, or a slot
+        # reserved, under it, and the health check or connect runs after it is released,
+        # so one slow round-trip never stalls every other acquire and release
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            conn = None
+            with self.condition:
+                while True:
+                    if self.closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self.idle:
+                        conn, idle_since = self.idle.pop()
+                        break
+                    if self.size < self.max_size:
+                        # Reserve the slot before connecting so concurrent callers cannot overshoot
+                        self.size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeout_count += 1
+                        raise PoolTimeout(f"No database connection available within {timeout:.1f}s "
+                                          f"({self.max_size} in use)")
+                    self.condition.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(**self.connect_kwargs)
+                except psycopg2.Error:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                    raise
+                with self.condition:
+                    self.prepared[id(conn)] = set()
+            elif not self._healthy(conn, idle_since):
+                logger.warning("Discarding unhealthy pooled connection")
+                with self.condition:
+                    self._discard(conn)
+                    self.size -= 1
+                    self.condition.notify()
+                continue
+
+            with self.condition:
+                waited = time.monotonic() - start
+                self.acquire_count += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                self._track_busy()
+                self.in_use += 1
+            return conn
+
+    def release(self, conn):
+        # Rolling back someone else's open transaction is a round-trip, so it happens
+        # before the lock is taken
+        status = conn.info.transaction_status if not conn.closed else None
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            pass
+        elif status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+            # Never hand the next caller a connection with someone else's open transaction
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                status = None
+        else:
+            status = None
+
+        with self.condition:
+            self._track_busy()
+            self.in_use -= 1
+            if status is None or self.closed:
+                self._discard(conn)
+                self.size -= 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def database_manager(self, timeout: Optional[float] = None):
+        with self.connection(timeout) as conn:
+            yield DatabaseManager.from_connection(conn)
+
+    def execute_prepared(self, cur, name: str, sql: str, params: tuple = ()):
+        # sql uses $1, $2 ... placeholders; it is PREPAREd the first time this
+        # connection sees `name` and EXECUTEd by name afterwards
+        prepared = self.prepared.setdefault(id(cur.connection), set())
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                conn, _ = self.idle.pop()
+                self._discard(conn)
+                self.size -= 1
+            self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            self._track_busy()
+            lifetime = time.monotonic() - self.created
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "max_size": self.max_size,
+                "utilization": self.in_use / self.max_size,
+                "avg_utilization": self.busy_time / (lifetime * self.max_size) if lifetime else 0.0,
+                "acquires": self.acquire_count,
+                "timeouts": self.timeout_count,
+                "discarded": self.discarded_count,
+                "avg_wait_ms": self.total_wait / self.acquire_count * 1000 if self.acquire_count else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
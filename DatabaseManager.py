@@ -0,0 +1,451 @@
+import psycopg2
+import time
+import uuid
+from psycopg2.extras import execute_values
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime
+
+from SchemaMigrations import migrate
+from Tracing import tracer
+
+# ProductCatalog LISTENs here; payloads are comma separated PRODUCT_IDs, or '*' for a full reload
+CATALOG_CHANNEL = 'product_catalog'
+# NOTIFY payloads must stay under 8000 bytes, which is ~200 UUIDs
+CATALOG_NOTIFY_IDS = 200
+IMAGE_CHUNK_SIZE = 256 * 1024
+
+
+class ProductImage:
+    # Lazy handle for a product image. It only records where the bytes live (in memory,
+    # a file, a TBL_IMAGE hash or a TBL_PRODUCT row); file and database bytes are read
+    # or streamed on access and never kept, so lists of products stay small.
+    __slots__ = ('data', 'path', 'db_manager', 'image_hash', 'product_id')
+
+    def __init__(self, data: Optional[bytes] = None, path: Optional[str] = None, db_manager: 'DatabaseManager' = None,
+                 image_hash: Optional[str] = None, product_id: Optional[str] = None):
+        self.data = data
+        self.path = path
+        self.db_manager = db_manager
+        self.image_hash = image_hash
+        self.product_id = product_id
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ProductImage':
+        return cls(data=data)
+
+    @classmethod
+    def from_path(cls, path: str) -> 'ProductImage':
+        return cls(path=path)
+
+    @classmethod
+    def from_database(cls, db_manager: 'DatabaseManager', product_id: str,
+                      image_hash: Optional[str] = None) -> 'ProductImage':
+        # Content-addressed images are read from TBL_IMAGE, legacy ones from PRODUCT_IMAGE
+        return cls(db_manager=db_manager, image_hash=image_hash, product_id=product_id)
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        return b''.join(self.iter_chunks())
+
+    def iter_chunks(self, chunk_size: int = IMAGE_CHUNK_SIZE) -> Iterator[bytes]:
+        if self.data is not None:
+            for start in range(0, len(self.data), chunk_size):
+                yield self.data[start:start + chunk_size]
+        elif self.path is not None:
+            with open(self.path, 'rb') as f:
+                yield from iter(lambda: f.read(chunk_size), b'')
+        elif self.image_hash is not None:
+            from ImageStore import ImageStore
+            yield from ImageStore(self.db_manager).iter_chunks(self.image_hash, chunk_size=chunk_size)
+        elif self.product_id is not None:
+            cur = self.db_manager.cur
+            cur.execute("SELECT octet_length(PRODUCT_IMAGE) FROM TBL_PRODUCT WHERE PRODUCT_ID = %s", (self.product_id,))
+            result = cur.fetchone()
+            byte_size = result[0] if result and result[0] is not None else 0
+            for start in range(0, byte_size, chunk_size):
+                # substring() is 1-based
+                cur.execute("SELECT substring(PRODUCT_IMAGE FROM %s FOR %s) FROM TBL_PRODUCT WHERE PRODUCT_ID = %s",
+                            (start + 1, chunk_size, self.product_id))
+                yield bytes(cur.fetchone()[0])
+
+    def __repr__(self):
+        source = (f"{len(self.data)} bytes" if self.data is not None else self.path or self.image_hash
+                  or f"TBL_PRODUCT {self.product_id}")
+        return f"ProductImage({source})"
+
+
+def _image_param(image: Optional[ProductImage]):
+    return psycopg2.Binary(image.read()) if image is not None else None
+
+
+@dataclass(slots=True)
+class StandardWeight:
+    standard_weight_id: str
+    standard_type: str
+
+
+@dataclass(slots=True)
+class Product:
+    product_id: str
+    product_name: str
+    product_description: str
+    product_price: float
+    product_type: str
+    product_image: Optional[ProductImage]
+    inventory_id: Optional[str] = None
+    standard_weight_products: List['StandardWeightProduct'] = None
+    image_hash: Optional[str] = None
+    fingerprint: Optional[str] = None
+
+    def __post_init__(self):
+        # Raw bytes are still accepted and wrapped
+        if isinstance(self.product_image, (bytes, bytearray, memoryview)):
+            self.product_image = ProductImage.from_bytes(bytes(self.product_image))
+
+
+@dataclass(slots=True)
+class StandardWeightProduct:
+    standard_weight_product_id: str
+    standard_weight: float
+    standard_weight_id: str
+    product_id: str
+
+
+@dataclass(slots=True)
+class StoredImage:
+    image_hash: str
+    content_type: str
+    image_data: Optional[bytes]
+    byte_size: int = 0
+    # Set instead of image_data for images streamed from disk into a large object
+    source_path: Optional[str] = None
+
+    def __post_init__(self):
+        if self.image_data is not None:
+            self.byte_size = len(self.image_data)
+
+
+@dataclass(slots=True)
+class ProductImageDerivative:
+    product_id: str
+    size_name: str
+    width: int
+    height: int
+    content_type: str
+    image_hash: str
+
+
+@dataclass(slots=True)
+class Inventory:
+    inventory_id: str
+    total_weight: float
+    inventory_value: float
+    inventory_expiration_date: datetime
+    location: str
+    products: List[Product] = None
+
+
+class DatabaseManager:
+    def __init__(self, dbname, user, password, host, port, standard_weight_ttl: Optional[float] = None):
+        self._attach(psycopg2.connect(dbname=dbname, user=user, password=password, host=host, port=port),
+                     standard_weight_ttl, owns_connection=True)
+
+    @classmethod
+    def from_connection(cls, conn, standard_weight_ttl: Optional[float] = None) -> 'DatabaseManager':
+        # Wraps a borrowed (e.g. pooled) connection; close() then leaves the connection open
+        manager = cls.__new__(cls)
+        manager._attach(conn, standard_weight_ttl, owns_connection=False)
+        return manager
+
+    def _attach(self, conn, standard_weight_ttl: Optional[float], owns_connection: bool):
+        self.conn = conn
+        self.cur = self.conn.cursor()
+        self.owns_connection = owns_connection
+        # TBL_STANDARD_WEIGHT is a tiny reference table, so it is read once and served from
+        # memory until invalidated or, when a TTL is given, until it goes stale
+        self.standard_weight_ttl = standard_weight_ttl
+        self._standard_weights: Dict[str, StandardWeight] = {}
+        self._standard_weights_loaded_at: Optional[float] = None
+
+    def _execute_values(self, sql: str, argslist, page_size: int = 100):
+        # Multi-row VALUES insert; the extension point for storage backends with another dialect
+        execute_values(self.cur, sql, argslist, page_size=page_size)
+
+    def close(self):
+        self.cur.close()
+        if self.owns_connection:
+            self.conn.close()
+
+    @tracer.traced(category='db')
+    def commit(self):
+        self.conn.commit()
+
+    @tracer.traced(category='db')
+    def rollback(self):
+        self.conn.rollback()
+
+    @tracer.traced(category='db')
+    def notify_products_changed(self, product_ids: List[str]):
+        # Queued inside the current transaction, so listeners only hear about committed rows
+        for i in range(0, len(product_ids), CATALOG_NOTIFY_IDS):
+            self.cur.execute("SELECT pg_notify(%s, %s)",
+                             (CATALOG_CHANNEL, ','.join(product_ids[i:i + CATALOG_NOTIFY_IDS])))
+
+    @tracer.traced(category='db')
+    def preload_standard_weights(self):
+        self.cur.execute("SELECT STANDARD_WEIGHT_ID, STANDARD_TYPE FROM TBL_STANDARD_WEIGHT")
+        self._standard_weights = {
+            standard_type: StandardWeight(standard_weight_id=standard_weight_id, standard_type=standard_type)
+            for standard_weight_id, standard_type in self.cur.fetchall()
+        }
+        self._standard_weights_loaded_at = time.monotonic()
+
+    def invalidate_standard_weights(self):
+        self._standard_weights = {}
+        self._standard_weights_loaded_at = None
+
+    def _standard_weights_stale(self) -> bool:
+        if self._standard_weights_loaded_at is None:
+            return True
+        if self.standard_weight_ttl is None:
+            return False
+        return time.monotonic() - self._standard_weights_loaded_at > self.standard_weight_ttl
+
+    def get_filling_standard_weight(self) -> StandardWeight:
+        return self.get_standard_weight("FILLING")
+
+    def get_standard_weight(self, standard_type: str) -> StandardWeight:
+        if self._standard_weights_stale():
+            self.preload_standard_weights()
+        result = self._standard_weights.get(standard_type)
+        if result:
+            return result
+        else:
+            raise Exception(f"{standard_type} standard weight not found in TBL_STANDARD_WEIGHT")
+
+    @tracer.traced(category='db')
+    def insert_inventory(self, inventory: Inventory):
+        self.cur.execute("""
+            INSERT INTO TBL_INVENTORY (INVENTORY_ID, TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (inventory.inventory_id, inventory.total_weight, inventory.inventory_value,
+              inventory.inventory_expiration_date, inventory.location))
+
+    @tracer.traced(category='db')
+    def insert_product(self, product: Product, standard_weight_product: Optional[StandardWeightProduct] = None,
+                       insert_salad: bool = False):
+        self.cur.execute("""
+            INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, PRODUCT_IMAGE, INVENTORY_ID)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (product.product_id, product.product_name, product.product_description, product.product_price,
+              product.product_type, _image_param(product.product_image), product.inventory_id))
+
+        if standard_weight_product:
+            self.cur.execute("""
+                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
+                VALUES (%s, %s, %s, %s)
+            """, (standard_weight_product.standard_weight_product_id, standard_weight_product.standard_weight,
+                  standard_weight_product.standard_weight_id, standard_weight_product.product_id))
+
+        if insert_salad:
+            salad_standard_weight = self.get_standard_weight("SALAD")
+            salad_standard_weight_product_id = str(uuid.uuid4())
+            self.cur.execute("""
+                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
+                VALUES (%s, %s, %s, %s)
+            """, (salad_standard_weight_product_id,
+                  standard_weight_product.standard_weight if standard_weight_product else 0.0,
+                  salad_standard_weight.standard_weight_id, product.product_id))
+
+        self.notify_products_changed([product.product_id])
+
+    @tracer.traced(category='db')
+    def get_products(self, product_type: Optional[str] = None) -> List[Product]:
+        # Image bytes stay in the database until a product's image handle is read
+        self.cur.execute("""
+            SELECT PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, INVENTORY_ID, IMAGE_HASH
+            FROM TBL_PRODUCT
+            WHERE %s IS NULL OR PRODUCT_TYPE = %s
+            ORDER BY PRODUCT_ID
+        """, (product_type, product_type))
+        return [Product(product_id=product_id, product_name=product_name, product_description=product_description,
+                        product_price=product_price, product_type=row_product_type,
+                        product_image=ProductImage.from_database(self, product_id, image_hash),
+                        inventory_id=inventory_id, image_hash=image_hash)
+                for product_id, product_name, product_description, product_price, row_product_type, inventory_id,
+                image_hash in self.cur.fetchall()]
+
+    @tracer.traced(category='db')
+    def create_image_store_tables(self):
+        # The schema is owned by SchemaMigrations; this brings it up to date
+        migrate(self.conn)
+
+    @tracer.traced(category='db')
+    def bulk_insert(self, inventories: List[Inventory], products: List[Product],
+                    standard_weight_products: List[StandardWeightProduct], page_size: int = 1000,
+                    product_page_size: int = 100, image_derivatives: Optional[List[ProductImageDerivative]] = None,
+                    images: Optional[List[StoredImage]] = None):
+        # Everything goes in one transaction; inventory and images first because products reference them.
+        # Pages carrying image bytes are kept smaller.
+        try:
+            if images:
+                self._execute_values("""
+                    INSERT INTO TBL_IMAGE (IMAGE_HASH, CONTENT_TYPE, BYTE_SIZE, IMAGE_DATA)
+                    VALUES %s
+                    ON CONFLICT (IMAGE_HASH) DO NOTHING
+                """, [(image.image_hash, image.content_type, image.byte_size, psycopg2.Binary(image.image_data))
+                      for image in images],
+                    page_size=product_page_size)
+
+            self._execute_values("""
+                INSERT INTO TBL_INVENTORY (INVENTORY_ID, TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION)
+                VALUES %s
+            """, [(inventory.inventory_id, inventory.total_weight, inventory.inventory_value,
+                   inventory.inventory_expiration_date, inventory.location) for inventory in inventories],
+                page_size=page_size)
+
+            if any(product.image_hash for product in products):
+                self._execute_values("""
+                    INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, PRODUCT_IMAGE, INVENTORY_ID, IMAGE_HASH)
+                    VALUES %s
+                """, [(product.product_id, product.product_name, product.product_description, product.product_price,
+                       product.product_type,
+                       _image_param(product.product_image),
+                       product.inventory_id, product.image_hash)
+                      for product in products],
+                    page_size=product_page_size)
+            else:
+                self._execute_values("""
+                    INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, PRODUCT_IMAGE, INVENTORY_ID)
+                    VALUES %s
+                """, [(product.product_id, product.product_name, product.product_description, product.product_price,
+                       product.product_type, _image_param(product.product_image), product.inventory_id)
+                      for product in products],
+                    page_size=product_page_size)
+
+            self._execute_values("""
+                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
+                VALUES %s
+            """, [(standard_weight_product.standard_weight_product_id, standard_weight_product.standard_weight,
+                   standard_weight_product.standard_weight_id, standard_weight_product.product_id)
+                  for standard_weight_product in standard_weight_products],
+                page_size=page_size)
+
+            if image_derivatives:
+                self._execute_values("""
+                    INSERT INTO TBL_PRODUCT_IMAGE_DERIVATIVE (PRODUCT_ID, SIZE_NAME, WIDTH, HEIGHT, CONTENT_TYPE, IMAGE_HASH)
+                    VALUES %s
+                """, [(derivative.product_id, derivative.size_name, derivative.width, derivative.height,
+                       derivative.content_type, derivative.image_hash)
+                      for derivative in image_derivatives],
+                    page_size=page_size)
+
+            self.notify_products_changed([product.product_id for product in products])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @tracer.traced(category='db')
+    def create_sync_columns(self):
+        migrate(self.conn)
+
+    @tracer.traced(category='db')
+    def find_products_by_natural_key(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[str, str, str]]:
+        # (product name, product type) -> (product id, inventory id, fingerprint); when earlier
+        # non-sync loads left duplicates of a key, the lowest PRODUCT_ID is adopted
+        if not keys:
+            return {}
+        self.cur.execute("""
+            SELECT DISTINCT ON (p.PRODUCT_NAME, p.PRODUCT_TYPE)
+                   p.PRODUCT_NAME, p.PRODUCT_TYPE, p.PRODUCT_ID, p.INVENTORY_ID, p.FINGERPRINT
+            FROM TBL_PRODUCT p
+            JOIN unnest(%s::text[], %s::text[]) AS k(PRODUCT_NAME, PRODUCT_TYPE)
+              ON p.PRODUCT_NAME = k.PRODUCT_NAME AND p.PRODUCT_TYPE = k.PRODUCT_TYPE
+            ORDER BY p.PRODUCT_NAME, p.PRODUCT_TYPE, p.PRODUCT_ID
+        """, ([key[0] for key in keys], [key[1] for key in keys]))
+        return {(name, product_type): (product_id, inventory_id, fingerprint)
+                for name, product_type, product_id, inventory_id, fingerprint in self.cur.fetchall()}
+
+    @tracer.traced(category='db')
+    def bulk_upsert(self, inventories: List[Inventory], products: List[Product],
+                    standard_weight_products: List[StandardWeightProduct], page_size: int = 1000,
+                    image_derivatives: Optional[List[ProductImageDerivative]] = None,
+                    images: Optional[List[StoredImage]] = None):
+        # Sync counterpart of bulk_insert. Inventory is live stock, so existing rows are never
+        # overwritten; products and their standard weights are updated in place (sync mints
+        # stable standard weight ids, and rows of a product missing from the batch are
+        # deleted), while image derivatives are replaced wholesale.
+        product_ids = [product.product_id for product in products]
+        try:
+            if images:
+                self._execute_values("""
+                    INSERT INTO TBL_IMAGE (IMAGE_HASH, CONTENT_TYPE, BYTE_SIZE, IMAGE_DATA)
+                    VALUES %s
+                    ON CONFLICT (IMAGE_HASH) DO NOTHING
+                """, [(image.image_hash, image.content_type, image.byte_size, psycopg2.Binary(image.image_data))
+                      for image in images],
+                    page_size=100)
+
+            self._execute_values("""
+                INSERT INTO TBL_INVENTORY (INVENTORY_ID, TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION)
+                VALUES %s
+                ON CONFLICT (INVENTORY_ID) DO NOTHING
+            """, [(inventory.inventory_id, inventory.total_weight, inventory.inventory_value,
+                   inventory.inventory_expiration_date, inventory.location) for inventory in inventories],
+                page_size=page_size)
+
+            self._execute_values("""
+                INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, PRODUCT_IMAGE, INVENTORY_ID, IMAGE_HASH, FINGERPRINT)
+                VALUES %s
+                ON CONFLICT (PRODUCT_ID) DO UPDATE SET
+                    PRODUCT_NAME = EXCLUDED.PRODUCT_NAME,
+                    PRODUCT_DESCRIPTION = EXCLUDED.PRODUCT_DESCRIPTION,
+                    PRODUCT_PRICE = EXCLUDED.PRODUCT_PRICE,
+                    PRODUCT_TYPE = EXCLUDED.PRODUCT_TYPE,
+                    PRODUCT_IMAGE = EXCLUDED.PRODUCT_IMAGE,
+                    INVENTORY_ID = COALESCE(TBL_PRODUCT.INVENTORY_ID, EXCLUDED.INVENTORY_ID),
+                    IMAGE_HASH = EXCLUDED.IMAGE_HASH,
+                    FINGERPRINT = EXCLUDED.FINGERPRINT
+            """, [(product.product_id, product.product_name, product.product_description, product.product_price,
+                   product.product_type,
+                   _image_param(product.product_image),
+                   product.inventory_id, product.image_hash, product.fingerprint)
+                  for product in products],
+                page_size=page_size)
+
+            # Dropped weights, and rows left with random ids by earlier imports
+            self.cur.execute("""
+                DELETE FROM TBL_STANDARD_WEIGHT_PRODUCT
+                WHERE PRODUCT_ID = ANY(%s) AND NOT STANDARD_WEIGHT_PRODUCT_ID = ANY(%s)
+            """, (product_ids, [standard_weight_product.standard_weight_product_id
+                                for standard_weight_product in standard_weight_products]))
+            self._execute_values("""
+                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
+                VALUES %s
+                ON CONFLICT (STANDARD_WEIGHT_PRODUCT_ID) DO UPDATE SET
+                    STANDARD_WEIGHT = EXCLUDED.STANDARD_WEIGHT,
+                    STANDARD_WEIGHT_ID = EXCLUDED.STANDARD_WEIGHT_ID,
+                    PRODUCT_ID = EXCLUDED.PRODUCT_ID
+            """, [(standard_weight_product.standard_weight_product_id, standard_weight_product.standard_weight,
+                   standard_weight_product.standard_weight_id, standard_weight_product.product_id)
+                  for standard_weight_product in standard_weight_products],
+                page_size=page_size)
+
+            if image_derivatives is not None:
+                self.cur.execute("DELETE FROM TBL_PRODUCT_IMAGE_DERIVATIVE WHERE PRODUCT_ID = ANY(%s)", (product_ids,))
+                self._execute_values("""
+                    INSERT INTO TBL_PRODUCT_IMAGE_DERIVATIVE (PRODUCT_ID, SIZE_NAME, WIDTH, HEIGHT, CONTENT_TYPE, IMAGE_HASH)
+                    VALUES %s
+                """, [(derivative.product_id, derivative.size_name, derivative.width, derivative.height,
+                       derivative.content_type, derivative.image_hash)
+                      for derivative in image_derivatives],
+                    page_size=page_size)
+
+            self.notify_products_changed(product_ids)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
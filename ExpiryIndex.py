@@ -0,0 +1,376 @@
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from DatabaseManager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+ExpiryKey = Tuple[datetime, str]
+EXPIRING_SOON = 1
+EXPIRED = 2
+STAGE_NAMES = {EXPIRING_SOON: 'expiring_soon', EXPIRED: 'expired'}
+
+
+@dataclass(slots=True)
+class ExpiryEntry:
+    inventory_id: str
+    location: str
+    expires_at: Optional[datetime]
+    total_weight: float
+    inventory_value: float
+    product_id: Optional[str] = None
+    product_name: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ExpiryEvent:
+    sequence: int
+    kind: str  # 'expiring_soon' or 'expired'
+    entry: ExpiryEntry
+    emitted_at: datetime
+
+
+class SortedKeys:
+    # Sorted set of (expires_at, inventory_id) keys kept in buckets of at most 2 * load keys.
+    # Finding a key is a bisect over the bucket maxima and then within one bucket, so adds
+    # and removes cost O(log n) comparisons plus a short memmove instead of shifting n items.
+    def __init__(self, load: int = 512):
+        self.load = load
+        self.buckets: List[List[ExpiryKey]] = []
+        self.maxes: List[ExpiryKey] = []
+        self.size = 0
+
+    @classmethod
+    def from_sorted(cls, keys: List[ExpiryKey], load: int = 512) -> 'SortedKeys':
+        result = cls(load)
+        result.buckets = [keys[i:i + load] for i in range(0, len(keys), load)]
+        result.maxes = [bucket[-1] for bucket in result.buckets]
+        result.size = len(keys)
+        return result
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key: ExpiryKey):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        bisect.insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        self.size += 1
+        if len(bucket) > 2 * self.load:
+            self.buckets[i:i + 1] = [bucket[:self.load], bucket[self.load:]]
+            self.maxes[i:i + 1] = [bucket[self.load - 1], bucket[-1]]
+
+    def remove(self, key: ExpiryKey):
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return
+        bucket = self.buckets[i]
+        j = bisect.bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return
+        del bucket[j]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+
+    def first(self) -> Optional[ExpiryKey]:
+        return self.buckets[0][0] if self.buckets else None
+
+    def irange(self, start: Optional[ExpiryKey] = None) -> Iterator[ExpiryKey]:
+        # Keys >= start in order
+        if not self.buckets:
+            return
+        if start is None:
+            i, j = 0, 0
+        else:
+            i = bisect.bisect_left(self.maxes, start)
+            if i == len(self.buckets):
+                return
+            j = bisect.bisect_left(self.buckets[i], start)
+        yield from self.buckets[i][j:]
+        for bucket in self.buckets[i + 1:]:
+            yield from bucket
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    # DATE columns come back as date, which cannot be compared with datetime
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    return datetime.fromisoformat(str(value))
+
+
+class ExpiryIndex:
+    # Inventory ordered by expiration date, one SortedKeys per location, for "what expires
+    # next" and date-range queries without sorting TBL_INVENTORY. Cross-location answers
+    # merge the per-location orders lazily. A sweeper thread sleeps until the next item
+    # enters the warning window or expires and emits one event per item per stage.
+    def __init__(self, warn_before: timedelta = timedelta(days=1), max_sleep: float = 60.0,
+                 max_events: int = 10000):
+        self.warn_before = warn_before
+        self.max_sleep = max_sleep
+        self.condition = threading.Condition()
+        self.entries: Dict[str, ExpiryEntry] = {}
+        self.locations: Dict[str, SortedKeys] = {}
+        # Bumped on every change, so pollers can skip unchanged answers
+        self.version = 0
+
+        self.listeners: List[Callable[[ExpiryEvent], None]] = []
+        self.events = deque(maxlen=max_events)
+        self.sequence = itertools.count(1)
+        # Everything up to this moment has been swept; items upserted behind it wait in pending
+        self.swept_until: Optional[datetime] = None
+        self.pending: List[str] = []
+        # inventory id -> (expires_at, highest stage announced for that expiry)
+        self.announced: Dict[str, Tuple[datetime, int]] = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # Loading
+
+    def load(self, db_manager: DatabaseManager):
+        db_manager.cur.execute("""
+            SELECT DISTINCT ON (i.INVENTORY_ID)
+                   i.INVENTORY_ID, i.LOCATION, i.INVENTORY_EXPIRATION_DATE, i.TOTAL_WEIGHT, i.INVENTORY_VALUE,
+                   p.PRODUCT_ID, p.PRODUCT_NAME
+            FROM TBL_INVENTORY i
+            LEFT JOIN TBL_PRODUCT p ON p.INVENTORY_ID = i.INVENTORY_ID
+            ORDER BY i.INVENTORY_ID, p.PRODUCT_ID
+        """)
+        entries = {row[0]: self._entry(row) for row in db_manager.cur.fetchall()}
+        db_manager.rollback()
+
+        by_location: Dict[str, List[ExpiryKey]] = {}
+        for entry in entries.values():
+            if entry.expires_at is not None:
+                by_location.setdefault(entry.location, []).append((entry.expires_at, entry.inventory_id))
+        locations = {location: SortedKeys.from_sorted(sorted(keys)) for location, keys in by_location.items()}
+        with self.condition:
+            self.entries = entries
+            self.locations = locations
+            self.version += 1
+            # Sweep the reloaded index from the start; `announced` still suppresses repeats
+            self.swept_until = None
+            self.announced = {inventory_id: stage for inventory_id, stage in self.announced.items()
+                              if inventory_id in entries}
+            self.condition.notify_all()
+
+    def refresh_products(self, db_manager: DatabaseManager, product_ids: List[str]):
+        db_manager.cur.execute("""
+            SELECT i.INVENTORY_ID, i.LOCATION, i.INVENTORY_EXPIRATION_DATE, i.TOTAL_WEIGHT, i.INVENTORY_VALUE,
+                   p.PRODUCT_ID, p.PRODUCT_NAME
+            FROM TBL_PRODUCT p
+            JOIN TBL_INVENTORY i ON i.INVENTORY_ID = p.INVENTORY_ID
+            WHERE p.PRODUCT_ID = ANY(%s)
+        """, (list(product_ids),))
+        rows = db_manager.cur.fetchall()
+        db_manager.rollback()
+        for row in rows:
+            self.upsert(self._entry(row))
+
+    @staticmethod
+    def _entry(row) -> ExpiryEntry:
+        return ExpiryEntry(inventory_id=row[0], location=row[1] or '', expires_at=_as_datetime(row[2]),
+                           total_weight=float(row[3] or 0), inventory_value=float(row[4] or 0),
+                           product_id=row[5], product_name=row[6])
+
+    # Updates, O(log n) each
+
+    def upsert(self, entry: ExpiryEntry):
+        entry.expires_at = _as_datetime(entry.expires_at)
+        with self.condition:
+            self._unindex(self.entries.get(entry.inventory_id))
+            self.entries[entry.inventory_id] = entry
+            if entry.expires_at is not None:
+                self.locations.setdefault(entry.location, SortedKeys()).add((entry.expires_at, entry.inventory_id))
+                if self.swept_until is not None and entry.expires_at - self.warn_before <= self.swept_until:
+                    self.pending.append(entry.inventory_id)
+                # The sweeper may now have an earlier deadline
+                self.condition.notify_all()
+            self.version += 1
+
+    def consume(self, inventory_id: str, weight: float, value: Optional[float] = None) -> Optional[ExpiryEntry]:
+        # Takes weight (and value, pro rata by default) off an item; empty items leave the index
+        with self.condition:
+            entry = self.entries.get(inventory_id)
+            if entry is None:
+                return None
+            if value is None:
+                value = entry.inventory_value * weight / entry.total_weight if entry.total_weight else 0.0
+            entry.total_weight -= weight
+            entry.inventory_value -= value
+            if entry.total_weight <= 0:
+                self._unindex(self.entries.pop(inventory_id))
+                self.announced.pop(inventory_id, None)
+            self.version += 1
+            return entry
+
+    def remove(self, inventory_id: str):
+        with self.condition:
+            entry = self.entries.pop(inventory_id, None)
+            if entry is not None:
+                self._unindex(entry)
+                self.announced.pop(inventory_id, None)
+                self.version += 1
+
+    def _unindex(self, entry: Optional[ExpiryEntry]):
+        if entry is None or entry.expires_at is None:
+            return
+        keys = self.locations.get(entry.location)
+        if keys is not None:
+            keys.remove((entry.expires_at, entry.inventory_id))
+            if not keys:
+                del self.locations[entry.location]
+
+    # Queries
+
+    def _ordered(self, location: Optional[str], start: Optional[ExpiryKey] = None) -> Iterator[ExpiryKey]:
+        if location is not None:
+            keys = self.locations.get(location)
+            return keys.irange(start) if keys is not None else iter(())
+        return heapq.merge(*(keys.irange(start) for keys in self.locations.values()))
+
+    def next_expiring(self, limit: int = 10, location: Optional[str] = None,
+                      after: Optional[datetime] = None) -> List[ExpiryEntry]:
+        # The `limit` soonest expirations, optionally only those after a time (e.g. now)
+        start = (after, '') if after is not None else None
+        with self.condition:
+            return [self.entries[key[1]] for key in itertools.islice(self._ordered(location, start), limit)]
+
+    def expiring_between(self, start: datetime, end: datetime, location: Optional[str] = None) -> List[ExpiryEntry]:
+        with self.condition:
+            return [self.entries[key[1]]
+                    for key in itertools.takewhile(lambda key: key[0] <= end, self._ordered(location, (start, '')))]
+
+    def summary(self, limit: int = 10, within: timedelta = timedelta(days=3),
+                now: Optional[datetime] = None) -> dict:
+        # One cheap answer for the UI to poll: the next items per location plus totals in the window
+        now = now or datetime.now()
+        with self.condition:
+            result = {"version": self.version, "generated_at": now.isoformat(), "locations": {}}
+            for location in sorted(self.locations):
+                soon = self.expiring_between(now, now + within, location)
+                result["locations"][location] = {
+                    "next": [_entry_json(entry) for entry in self.next_expiring(limit, location, after=now)],
+                    "expiring_count": len(soon),
+                    "expiring_value": sum(entry.inventory_value for entry in soon),
+                    "expired_count": len(self.expiring_between(datetime.min, now - timedelta(microseconds=1),
+                                                               location)),
+                }
+            return result
+
+    # Sweeper
+
+    def subscribe(self, listener: Callable[[ExpiryEvent], None]):
+        self.listeners.append(listener)
+
+    def events_since(self, sequence: int = 0) -> List[ExpiryEvent]:
+        with self.condition:
+            return [event for event in self.events if event.sequence > sequence]
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            events = self.sweep()
+            for event in events:
+                for listener in self.listeners:
+                    try:
+                        listener(event)
+                    except Exception:
+                        logger.exception("Expiry listener failed")
+            with self.condition:
+                if not self.stop_event.is_set() and not self.pending:
+                    self.condition.wait(self._seconds_until_next())
+
+    def sweep(self, now: Optional[datetime] = None) -> List[ExpiryEvent]:
+        # Announces what crossed a threshold since the last sweep: only keys between the old and
+        # new watermark are visited, plus items upserted behind the watermark in the meantime
+        now = now or datetime.now()
+        events = []
+        with self.condition:
+            last = self.swept_until
+            expired = self._ordered(None, _after(last) if last else None)
+            for key in itertools.takewhile(lambda key: key[0] <= now, expired):
+                events += self._announce(EXPIRED, self.entries[key[1]], now)
+            soon = self._ordered(None, _after(max(last + self.warn_before, now)) if last else _after(now))
+            for key in itertools.takewhile(lambda key: key[0] - self.warn_before <= now, soon):
+                events += self._announce(EXPIRING_SOON, self.entries[key[1]], now)
+            for inventory_id in self.pending:
+                entry = self.entries.get(inventory_id)
+                if entry is not None and entry.expires_at is not None:
+                    if entry.expires_at <= now:
+                        events += self._announce(EXPIRED, entry, now)
+                    elif entry.expires_at - self.warn_before <= now:
+                        events += self._announce(EXPIRING_SOON, entry, now)
+            self.pending = []
+            self.swept_until = now
+        return events
+
+    def _announce(self, stage: int, entry: ExpiryEntry, now: datetime) -> List[ExpiryEvent]:
+        previous = self.announced.get(entry.inventory_id)
+        if previous is not None and previous[0] == entry.expires_at and previous[1] >= stage:
+            return []
+        self.announced[entry.inventory_id] = (entry.expires_at, stage)
+        event = ExpiryEvent(sequence=next(self.sequence), kind=STAGE_NAMES[stage], entry=entry, emitted_at=now)
+        self.events.append(event)
+        return [event]
+
+    def _seconds_until_next(self) -> float:
+        # Sleeps until the next expiry or warning after the watermark; upserts wake it early
+        upcoming = []
+        if self.swept_until is not None:
+            next_expiry = next(self._ordered(None, _after(self.swept_until)), None)
+            if next_expiry is not None:
+                upcoming.append(next_expiry[0])
+            next_warning = next(self._ordered(None, _after(self.swept_until + self.warn_before)), None)
+            if next_warning is not None:
+                upcoming.append(next_warning[0] - self.warn_before)
+        if not upcoming:
+            return self.max_sleep
+        return min(max((min(upcoming) - datetime.now()).total_seconds(), 0.01), self.max_sleep)
+
+
+def _after(moment: datetime) -> ExpiryKey:
+    # Sorts after every key at `moment`
+    return moment, '\U0010ffff'
+
+
+def _entry_json(entry: ExpiryEntry) -> dict:
+    return {
+        "inventory_id": entry.inventory_id,
+        "location": entry.location,
+        "expires_at": entry.expires_at.isoformat() if entry.expires_at else None,
+        "total_weight": entry.total_weight,
+        "inventory_value": entry.inventory_value,
+        "product_id": entry.product_id,
+        "product_name": entry.product_name,
+    }
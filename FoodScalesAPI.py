@@ -5,10 +5,26 @@
 # prompt 'How to build an API service in python using flask library'
 # prompt 'How to make service thread safe scales cant find the scale when a second request to activate is sent'
 
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request, send_file
 import asyncio
+import math
+import os
 import threading
+from dataclasses import asdict
+from datetime import datetime, timedelta
 from pydecentscale import DecentScale
+from ConnectionPool import ConnectionPool
+from ProductCatalog import ProductCatalog
+from CatalogSnapshot import SnapshotStore
+from ProductImageAPI import create_image_blueprint
+from ProductListAPI import create_product_list_blueprint
+from InventoryAnalytics import InventoryAnalytics
+from ExpiryIndex import ExpiryIndex
+from InventoryDepletion import InventoryDepletion
+from PortionStats import PortionStatsEngine
+from PlateRecognition import PlateRecognizer
+from WeighingLogger import WeighingLogger
+from Tracing import tracer
 
 app = Flask(__name__)
 
@@ -17,6 +33,96 @@ weight_lock = threading.Lock()
 operation_lock = threading.Lock()
 latest_weight = None
 
+weighing_logger = WeighingLogger(dbname="DeliTelligenceDB", user="postgres", password="lemon", host="localhost",
+                                 port="5432")
+weighing_logger.start()
+
+# Shared pool for routes that read or write the catalog database
+db_pool = ConnectionPool(dbname="DeliTelligenceDB", user="postgres", password="lemon", host="localhost",
+                         port="5432", min_size=0, max_size=8)
+
+# In-memory product lookups, kept current by NOTIFYs from the catalog writers
+product_catalog = ProductCatalog(dbname="DeliTelligenceDB", user="postgres", password="lemon", host="localhost",
+                                 port="5432")
+product_catalog.start()
+
+app.register_blueprint(create_image_blueprint(db_pool, product_catalog))
+app.register_blueprint(create_product_list_blueprint(db_pool))
+
+# Offline catalog snapshots for UI cold starts, with deltas between published versions
+snapshot_store = SnapshotStore('snapshots')
+snapshot_lock = threading.Lock()
+
+# Running portion statistics per product against its FILLING or SALAD standard weight
+portion_stats = PortionStatsEngine(product_catalog)
+
+# Which known items make up a plate's total weight; indexes rebuild when standard weights change
+plate_recognizer = PlateRecognizer(product_catalog, portion_stats)
+
+# Built on first use (NumPy is optional); product changes heard by the catalog refresh it
+inventory_analytics = None
+analytics_lock = threading.Lock()
+
+def get_inventory_analytics():
+    global inventory_analytics
+    with analytics_lock:
+        if inventory_analytics is None:
+            analytics = InventoryAnalytics()
+            with db_pool.database_manager() as db_manager:
+                analytics.load(db_manager)
+            product_catalog.subscribe(refresh_inventory_analytics)
+            inventory_analytics = analytics
+    return inventory_analytics
+
+def refresh_inventory_analytics(product_ids):
+    with db_pool.database_manager() as db_manager:
+        if product_ids is None:
+            inventory_analytics.load(db_manager)
+        else:
+            inventory_analytics.refresh_products(db_manager, product_ids)
+
+# Expiry-ordered inventory with a sweeper emitting expiring_soon/expired events; built on first use
+expiry_index = None
+expiry_lock = threading.Lock()
+
+def get_expiry_index():
+    global expiry_index
+    with expiry_lock:
+        if expiry_index is None:
+            index = ExpiryIndex()
+            with db_pool.database_manager() as db_manager:
+                index.load(db_manager)
+            index.start()
+            product_catalog.subscribe(refresh_expiry_index)
+            expiry_index = index
+    return expiry_index
+
+def refresh_expiry_index(product_ids):
+    with db_pool.database_manager() as db_manager:
+        if product_ids is None:
+            expiry_index.load(db_manager)
+        else:
+            expiry_index.refresh_products(db_manager, product_ids)
+
+# Weighed portions come off TBL_INVENTORY in batched, journaled updates once a second
+inventory_depletion = InventoryDepletion(db_pool)
+inventory_depletion.start()
+
+def invalidate_depletion_balances(product_ids):
+    if product_ids is None:
+        inventory_depletion.invalidate()
+    else:
+        products = [product_catalog.get(product_id) for product_id in product_ids]
+        inventory_depletion.invalidate(product.inventory_id for product in products if product and product.inventory_id)
+
+def refresh_analytics_after_depletion(balances):
+    if inventory_analytics is not None:
+        with db_pool.database_manager() as db_manager:
+            inventory_analytics.refresh(db_manager, balances.keys())
+
+product_catalog.subscribe(invalidate_depletion_balances)
+inventory_depletion.subscribe(refresh_analytics_after_depletion)
+
 def background_weight_reader():
     global latest_weight
     while ds.connected:
@@ -25,9 +131,40 @@ def background_weight_reader():
                 latest_weight = ds.weight
         asyncio.run(asyncio.sleep(0.1))
 
+# One span per request, from Flask dispatch to teardown; a no-op unless tracing is on
+@app.before_request
+def start_request_span():
+    if tracer.enabled:
+        g.trace_span = tracer.span(f"{request.method} {request.url_rule or request.path}", 'http')
+        g.trace_span.__enter__()
+
+@app.teardown_request
+def end_request_span(error=None):
+    span = g.pop("trace_span", None)
+    if span is not None:
+        span.__exit__(type(error) if error else None, error, None)
+
+@app.route('/trace/start', methods=['POST'])
+def start_trace():
+    body = request.get_json(silent=True) or {}
+    if body.get("clear", True):
+        tracer.clear()
+    tracer.enable(body.get("max_events"))
+    return jsonify(tracer.stats()), 200
+
+@app.route('/trace/stop', methods=['POST'])
+def stop_trace():
+    tracer.disable()
+    return jsonify(tracer.stats()), 200
+
+@app.route('/trace', methods=['GET'])
+def export_trace():
+    # Chrome trace-event JSON; open in chrome://tracing or ui.perfetto.dev
+    return jsonify(tracer.export()), 200, {"Content-Disposition": "attachment; filename=trace.json"}
+
 @app.route('/connect', methods=['POST'])
 def connect():
-    with operation_lock:
+    with tracer.acquire(operation_lock, "operation_lock"):
         if not ds.connected:
             connected = ds.auto_connect()
             if connected:
@@ -39,7 +176,7 @@ def connect():
 
 @app.route('/enable_notify', methods=['POST'])
 def enable_notify():
-    with operation_lock:
+    with tracer.acquire(operation_lock, "operation_lock"):
         if ds.connected:
             ds.enable_notification()
             threading.Thread(target=background_weight_reader, daemon=True).start()
@@ -49,7 +186,7 @@ def enable_notify():
 
 @app.route('/disable_notify', methods=['POST'])
 def disable_notify():
-    with operation_lock:
+    with tracer.acquire(operation_lock, "operation_lock"):
         if ds.connected:
             ds.disable_notification()
             return jsonify({"status": "Notifications disabled"}), 200
@@ -64,9 +201,203 @@ def get_weight():
         else:
             return jsonify({"error": "No weight data available"}), 503
 
+@app.route('/weighing', methods=['POST'])
+def log_weighing():
+    body = request.get_json(silent=True) or {}
+    product_id = body.get("product_id")
+    if not product_id or not isinstance(product_id, str):
+        return jsonify({"error": "product_id is required"}), 400
+    with weight_lock:
+        weight = body.get("weight", latest_weight)
+    if weight is None:
+        return jsonify({"error": "No weight data available"}), 503
+    # Checked before anything is queued: one bad value would fail the logger's whole COPY batch
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        return jsonify({"error": "weight must be a number"}), 400
+    if not math.isfinite(weight):
+        return jsonify({"error": "weight must be a number"}), 400
+    standard_type = body.get("standard_type") or 'FILLING'
+    if not isinstance(standard_type, str):
+        return jsonify({"error": "standard_type must be a string"}), 400
+    # Portion statistics hold an entry per (product, standard type), so only catalog keys
+    # may create one. Before the catalog's first load nothing can be checked: the weighing
+    # is still logged (the logger spills while the database is away) but not counted.
+    catalog_ready = product_catalog.ready.is_set()
+    if catalog_ready and product_catalog.get(product_id) is None:
+        return jsonify({"error": "Unknown product_id"}), 400
+    if catalog_ready and not product_catalog.is_standard_type(standard_type):
+        return jsonify({"error": "Unknown standard_type"}), 400
+    scale_id = body.get("scale_id") or (ds.client.address if ds.client else "unknown")
+    event = weighing_logger.log(scale_id, product_id, weight)
+    if catalog_ready:
+        portion_stats.record(product_id, weight, standard_type)
+    product = product_catalog.get(product_id)
+    if product is not None and product.inventory_id:
+        inventory_depletion.deplete(product.inventory_id, weight)
+        if expiry_index is not None:
+            expiry_index.consume(product.inventory_id, weight)
+    return jsonify({"status": "Weighing queued", "weighing_id": event.weighing_id}), 202
+
+@app.route('/weighing/stats', methods=['GET'])
+def weighing_stats():
+    return jsonify(weighing_logger.stats()), 200
+
+@app.route('/plates/recognize', methods=['POST'])
+def recognize_plate():
+    body = request.get_json(silent=True) or {}
+    with weight_lock:
+        weight = body.get("weight", latest_weight)
+    if weight is None:
+        return jsonify({"error": "No weight data available"}), 503
+    product_ids = body.get("product_ids")
+    if not product_ids and body.get("product_type"):
+        product_ids = [product.product_id for product in product_catalog.by_type(body["product_type"])]
+    if not product_ids:
+        return jsonify({"error": "product_ids or product_type is required"}), 400
+    try:
+        weight = float(weight)
+        tolerance = None if body.get("tolerance") is None else float(body["tolerance"])
+        limit = int(body.get("limit", 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "weight, tolerance and limit must be numbers"}), 400
+    if not math.isfinite(weight) or (tolerance is not None and not (math.isfinite(tolerance) and tolerance >= 0)):
+        return jsonify({"error": "weight and tolerance must be finite, tolerance not negative"}), 400
+    if not 1 <= limit <= 50:
+        return jsonify({"error": "limit must be between 1 and 50"}), 400
+    try:
+        matches = plate_recognizer.recognize(weight, product_ids, body.get("standard_type") or 'FILLING',
+                                             tolerance=tolerance, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"weight": weight, "matches": [asdict(match) for match in matches]}), 200
+
+@app.route('/portions/<product_id>', methods=['GET'])
+def portion_summary(product_id):
+    summary = portion_stats.get(product_id, request.args.get("standard_type", 'FILLING'))
+    if summary is None:
+        return jsonify({"error": "No weighings recorded for product"}), 404
+    return jsonify(summary), 200
+
+@app.route('/portions/over-portioned', methods=['GET'])
+def over_portioned():
+    return jsonify(portion_stats.over_portioned(request.args.get("limit", 10, type=int))), 200
+
+@app.route('/portions/export', methods=['GET'])
+def export_portion_stats():
+    return jsonify(portion_stats.to_dict()), 200
+
+@app.route('/portions/merge', methods=['POST'])
+def merge_portion_stats():
+    # Folds in another scale's or store's /portions/export
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or "stats" not in body:
+        return jsonify({"error": "Expected an exported portion statistics document"}), 400
+    try:
+        incoming = PortionStatsEngine.from_dict(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not product_catalog.ready.is_set():
+        return jsonify({"error": "Product catalog not loaded yet"}), 503
+    # Entries for products or standard types this store does not have are dropped
+    unknown = [key for key in incoming.stats
+               if product_catalog.get(key[0]) is None or not product_catalog.is_standard_type(key[1])]
+    for key in unknown:
+        del incoming.stats[key]
+    portion_stats.merge(incoming)
+    return jsonify({"status": "Merged", "products": len(incoming.stats), "skipped": len(unknown)}), 200
+
+@app.route('/inventory/<inventory_id>/balance', methods=['GET'])
+def inventory_balance(inventory_id):
+    balance = inventory_depletion.balance(inventory_id)
+    if balance is None:
+        return jsonify({"error": "Inventory not found"}), 404
+    return jsonify(asdict(balance)), 200
+
+@app.route('/inventory/depletion/stats', methods=['GET'])
+def depletion_stats():
+    return jsonify(inventory_depletion.stats()), 200
+
+@app.route('/db/stats', methods=['GET'])
+def db_stats():
+    return jsonify(db_pool.stats()), 200
+
+@app.route('/catalog/products/<product_id>', methods=['GET'])
+def catalog_product(product_id):
+    product = product_catalog.get(product_id)
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify(asdict(product)), 200
+
+@app.route('/catalog/search', methods=['GET'])
+def catalog_search():
+    if request.args.get("type"):
+        products = product_catalog.by_type(request.args["type"])
+    else:
+        products = product_catalog.search(request.args.get("prefix", ""), limit=request.args.get("limit", 50, type=int))
+    return jsonify([asdict(product) for product in products]), 200
+
+@app.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    return jsonify(product_catalog.stats()), 200
+
+@app.route('/catalog/snapshot', methods=['GET'])
+def catalog_snapshot():
+    # ?since=<version> gets a delta when that version is still kept, otherwise the full snapshot.
+    # The file is opened under the lock: a publish pruning it afterwards only unlinks the
+    # name, and this response keeps reading the open handle.
+    with snapshot_lock:
+        path = snapshot_store.snapshot_for(request.args.get("since", type=int))
+        version = snapshot_store.latest_version() or 0
+        snapshot = open(path, 'rb') if path is not None else None
+    if snapshot is None:
+        return "", 204, {"X-Catalog-Version": str(version)}
+    response = send_file(snapshot, mimetype="application/vnd.sqlite3", as_attachment=True,
+                         download_name=os.path.basename(path))
+    response.headers["X-Catalog-Version"] = str(version)
+    return response
+
+@app.route('/catalog/snapshot', methods=['POST'])
+def publish_catalog_snapshot():
+    with snapshot_lock, db_pool.database_manager() as db_manager:
+        result = snapshot_store.publish(db_manager)
+    return jsonify(result), 201
+
+@app.route('/analytics/inventory', methods=['GET'])
+def inventory_dashboard():
+    try:
+        analytics = get_inventory_analytics()
+    except ImportError as e:
+        return jsonify({"error": str(e)}), 501
+    days = request.args.get("expiring_within_days", 3.0, type=float)
+    return jsonify(analytics.dashboard(expiring_within_days=days)), 200
+
+@app.route('/inventory/expiring', methods=['GET'])
+def inventory_expiring():
+    index = get_expiry_index()
+    # The index version is the ETag, so polling an unchanged index costs a 304
+    etag = f'"{index.version}-{request.query_string.decode()}"'
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304, {"ETag": etag}
+    location = request.args.get("location")
+    limit = request.args.get("limit", 10, type=int)
+    if location:
+        body = {"version": index.version,
+                "next": [asdict(entry) for entry in index.next_expiring(limit, location, after=datetime.now())]}
+    else:
+        body = index.summary(limit, within=timedelta(days=request.args.get("within_days", 3.0, type=float)))
+    return jsonify(body), 200, {"ETag": etag}
+
+@app.route('/inventory/expiry-events', methods=['GET'])
+def inventory_expiry_events():
+    events = get_expiry_index().events_since(request.args.get("after", 0, type=int))
+    return jsonify([{"sequence": event.sequence, "kind": event.kind, "emitted_at": event.emitted_at.isoformat(),
+                     "entry": asdict(event.entry)} for event in events]), 200
+
 @app.route('/tare', methods=['POST'])
 def tare():
-    with operation_lock:
+    with tracer.acquire(operation_lock, "operation_lock"):
         if ds.connected:
             ds.tare()
             return jsonify({"status": "Scale tared"}), 200
@@ -75,7 +406,7 @@ def tare():
 
 @app.route('/disconnect', methods=['POST'])
 def disconnect():
-    with operation_lock:
+    with tracer.acquire(operation_lock, "operation_lock"):
         if ds.connected:
             ds.disable_notification()
             ds.disconnect()
@@ -1,34 +1,40 @@
 import psycopg2
+from ConnectionPool import ConnectionPool
+from DatabaseManager import CATALOG_CHANNEL
+
+pool = ConnectionPool(dbname="DeliTelligenceDB", user="postgres", password="lemon", host="localhost", port="5432",
+                      min_size=1, max_size=2)
+
 
 def insert_product(product_id, product_name, standard_weight, product_description, product_price, product_type, image_path):
     try:
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(dbname="DeliTelligenceDB", user="postgres", password="lemon", host="localhost", port="5432")
-        cur = conn.cursor()
-
         # Open image file in binary mode
         with open(image_path, 'rb') as f:
             image_data = f.read()  # Read the image as binary data
 
-        # Insert product details into the database
-        cur.execute("""
-            INSERT INTO TBL_PRODUCT (
-                PRODUCT_ID, PRODUCT_NAME, STANDARD_WEIGHT, 
-                PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, 
-                PRODUCT_IMAGE
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            product_id,                   # PRODUCT_ID
-            product_name,                 # PRODUCT_NAME
-            standard_weight,              # STANDARD_WEIGHT
-            product_description,          # PRODUCT_DESCRIPTION
-            product_price,                # PRODUCT_PRICE
-            product_type,                 # PRODUCT_TYPE
-            psycopg2.Binary(image_data)   # PRODUCT_IMAGE (binary data)
-        ))
+        # Borrow a pooled connection; the INSERT is prepared once per connection and reused
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                pool.execute_prepared(cur, "insert_product", """
+                    INSERT INTO TBL_PRODUCT (
+                        PRODUCT_ID, PRODUCT_NAME, STANDARD_WEIGHT,
+                        PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE,
+                        PRODUCT_IMAGE
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7)
+                """, (
+                    product_id,                   # PRODUCT_ID
+                    product_name,                 # PRODUCT_NAME
+                    standard_weight,              # STANDARD_WEIGHT
+                    product_description,          # PRODUCT_DESCRIPTION
+                    product_price,                # PRODUCT_PRICE
+                    product_type,                 # PRODUCT_TYPE
+                    psycopg2.Binary(image_data)   # PRODUCT_IMAGE (binary data)
+                ))
+                # Tell running ProductCatalogs to pick up the new row once committed
+                cur.execute("SELECT pg_notify(%s, %s)", (CATALOG_CHANNEL, product_id))
 
-        # Commit the transaction
-        conn.commit()
+            # Commit the transaction
+            conn.commit()
 
         # Print success message
         print("Product inserted successfully!")
@@ -36,13 +42,6 @@ def insert_product(product_id, product_name, standard_weight, product_descriptio
     except Exception as e:
         print(f"Error inserting product: {e}")
 
-    finally:
-        # Close the cursor and connection
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
 # Example usage
 insert_product(
     product_id='f41578b2-06a0-43c6-959e-abb0a51ea75a7',
@@ -336,6 +335,4 @@ insert_product(
     image_path=r'C:\Users\I586662\Downloads\Sweetcorn.webp'
 )
 
-
-
-
+pool.close()
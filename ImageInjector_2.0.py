@@ -1,105 +1,8 @@
-import psycopg2
 import uuid
-from dataclasses import dataclass
-from typing import List, Optional
+from typing import Optional
 from datetime import datetime, timedelta
 
-
-@dataclass
-class StandardWeight:
-    standard_weight_id: str
-    standard_type: str
-
-
-@dataclass
-class Product:
-    product_id: str
-    product_name: str
-    product_description: str
-    product_price: float
-    product_type: str
-    product_image: bytes
-    inventory_id: Optional[str] = None
-    standard_weight_products: List['StandardWeightProduct'] = None
-
-
-@dataclass
-class StandardWeightProduct:
-    standard_weight_product_id: str
-    standard_weight: float
-    standard_weight_id: str
-    product_id: str
-
-
-@dataclass
-class Inventory:
-    inventory_id: str
-    total_weight: float
-    inventory_value: float
-    inventory_expiration_date: datetime
-    location: str
-    products: List[Product] = None
-
-
-class DatabaseManager:
-    def __init__(self, dbname, user, password, host, port):
-        self.conn = psycopg2.connect(dbname=dbname, user=user, password=password, host=host, port=port)
-        self.cur = self.conn.cursor()
-
-    def close(self):
-        self.cur.close()
-        self.conn.close()
-
-    def commit(self):
-        self.conn.commit()
-
-    def get_filling_standard_weight(self) -> StandardWeight:
-        self.cur.execute("SELECT * FROM TBL_STANDARD_WEIGHT WHERE STANDARD_TYPE = 'FILLING'")
-        result = self.cur.fetchone()
-        if result:
-            return StandardWeight(standard_weight_id=result[0], standard_type=result[1])
-        else:
-            raise Exception("FILLING standard weight not found in TBL_STANDARD_WEIGHT")
-
-    def get_standard_weight(self, standard_type: str) -> StandardWeight:
-        self.cur.execute("SELECT * FROM TBL_STANDARD_WEIGHT WHERE STANDARD_TYPE = %s", (standard_type,))
-        result = self.cur.fetchone()
-        if result:
-            return StandardWeight(standard_weight_id=result[0], standard_type=result[1])
-        else:
-            raise Exception(f"{standard_type} standard weight not found in TBL_STANDARD_WEIGHT")
-
-    def insert_inventory(self, inventory: Inventory):
-        self.cur.execute("""
-            INSERT INTO TBL_INVENTORY (INVENTORY_ID, TOTAL_WEIGHT, INVENTORY_VALUE, INVENTORY_EXPIRATION_DATE, LOCATION)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (inventory.inventory_id, inventory.total_weight, inventory.inventory_value,
-              inventory.inventory_expiration_date, inventory.location))
-
-    def insert_product(self, product: Product, standard_weight_product: Optional[StandardWeightProduct] = None,
-                       insert_salad: bool = False):
-        self.cur.execute("""
-            INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, PRODUCT_IMAGE, INVENTORY_ID)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (product.product_id, product.product_name, product.product_description, product.product_price,
-              product.product_type, psycopg2.Binary(product.product_image), product.inventory_id))
-
-        if standard_weight_product:
-            self.cur.execute("""
-                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
-                VALUES (%s, %s, %s, %s)
-            """, (standard_weight_product.standard_weight_product_id, standard_weight_product.standard_weight,
-                  standard_weight_product.standard_weight_id, standard_weight_product.product_id))
-
-        if insert_salad:
-            salad_standard_weight = self.get_standard_weight("SALAD")
-            salad_standard_weight_product_id = str(uuid.uuid4())
-            self.cur.execute("""
-                INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
-                VALUES (%s, %s, %s, %s)
-            """, (salad_standard_weight_product_id,
-                  standard_weight_product.standard_weight if standard_weight_product else 0.0,
-                  salad_standard_weight.standard_weight_id, product.product_id))
+from DatabaseManager import DatabaseManager, Inventory, Product, ProductImage, StandardWeightProduct
 
 
 def insert_product_with_inventory(db_manager: DatabaseManager, product_name: str, standard_weight: Optional[float],
@@ -108,9 +11,6 @@ def insert_product_with_inventory(db_manager: DatabaseManager, product_name: str
                                   inventory_value: float, inventory_expiration_date: datetime,
                                   insert_salad: Optional[float] = None):
     try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-
         product_id = str(uuid.uuid4())
         inventory_id = str(uuid.uuid4())
 
@@ -128,7 +28,7 @@ def insert_product_with_inventory(db_manager: DatabaseManager, product_name: str
             product_description=product_description,
             product_price=product_price,
             product_type=product_type,
-            product_image=image_data,
+            product_image=ProductImage.from_path(image_path),
             inventory_id=inventory_id
         )
 
@@ -160,6 +60,8 @@ def insert_product_with_inventory(db_manager: DatabaseManager, product_name: str
         print(f"Product {product_name} with Inventory inserted successfully!")
 
     except Exception as e:
+        # The image is only read at insert time, so drop the inventory row already sent
+        db_manager.rollback()
         print(f"Error inserting product with inventory: {e}")
 
 
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Optional
+
+from Tracing import tracer
+
+
+@dataclass
+class LoadedImage:
+    row: Any
+    image_data: Optional[bytes] = None
+    content_type: Optional[str] = None
+    image_hash: Optional[str] = None
+    byte_size: int = 0
+    error: Optional[str] = None
+    derivatives: Optional[List[Any]] = None
+
+    @property
+    def streamed(self) -> bool:
+        # Files above the stream threshold are only hashed here; their bytes are
+        # copied from disk to the server in chunks at insert time
+        return self.error is None and self.image_data is None
+
+
+def detect_content_type(data: bytes) -> Optional[str]:
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return None
+
+
+CHUNK_SIZE = 64 * 1024
+STREAM_THRESHOLD = 4 * 1024 * 1024
+
+
+@tracer.traced(category='disk')
+def load_image(row, stream_threshold: Optional[int] = STREAM_THRESHOLD) -> LoadedImage:
+    # The SHA-256 is computed chunk by chunk while the file is read, not in a second pass.
+    # Bytes are only kept for files up to stream_threshold, so memory per image stays bounded.
+    hasher = hashlib.sha256()
+    buffer = bytearray()
+    content_type = None
+    byte_size = 0
+    try:
+        with open(row.image_path, 'rb') as f:
+            keep = stream_threshold is None or os.fstat(f.fileno()).st_size <= stream_threshold
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                if byte_size == 0:
+                    content_type = detect_content_type(chunk)
+                    if content_type is None:
+                        return LoadedImage(row=row, error=f"{row.image_path} is not a JPEG, PNG, WebP or GIF image")
+                hasher.update(chunk)
+                byte_size += len(chunk)
+                if keep:
+                    buffer += chunk
+    except OSError as e:
+        return LoadedImage(row=row, error=str(e))
+    if byte_size == 0:
+        return LoadedImage(row=row, error=f"{row.image_path} is empty")
+    return LoadedImage(row=row, image_data=bytes(buffer) if keep else None, content_type=content_type,
+                       image_hash=hasher.hexdigest(), byte_size=byte_size)
+
+
+def load_images(rows: Iterable, stream_threshold: Optional[int] = STREAM_THRESHOLD) -> Iterator[LoadedImage]:
+    for row in rows:
+        yield load_image(row, stream_threshold)
+
+
+class ImagePrefetcher:
+    # Reads images on a thread pool ahead of the consumer. Futures travel through a
+    # bounded queue in manifest order, so at most `prefetch` images are in memory and
+    # the database writer never waits on disk unless the readers fall behind.
+    def __init__(self, rows: Iterable, readers: int = 4, prefetch: int = 64,
+                 stream_threshold: Optional[int] = STREAM_THRESHOLD):
+        self.rows = rows
+        self.readers = readers
+        self.stream_threshold = stream_threshold
+        self.queue = queue.Queue(maxsize=prefetch)
+        self.stop_event = threading.Event()
+        self.stats_lock = threading.Lock()
+        self.read_time = 0.0
+        self.reader_blocked_time = 0.0
+        self.consumer_wait_time = 0.0
+        self.started = None
+        self.finished = None
+
+    def _timed_load(self, row) -> LoadedImage:
+        start = time.perf_counter()
+        loaded = load_image(row, self.stream_threshold)
+        with self.stats_lock:
+            self.read_time += time.perf_counter() - start
+        return loaded
+
+    def _put(self, item) -> bool:
+        start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                self.reader_blocked_time += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, executor: ThreadPoolExecutor):
+        try:
+            for row in self.rows:
+                if not self._put(executor.submit(self._timed_load, row)):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def __iter__(self) -> Iterator[LoadedImage]:
+        self.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='image-reader') as executor:
+            producer = threading.Thread(target=self._produce, args=(executor,), daemon=True)
+            producer.start()
+            try:
+                while True:
+                    start = time.perf_counter()
+                    item = self.queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    loaded = item.result()
+                    self.consumer_wait_time += time.perf_counter() - start
+                    yield loaded
+            finally:
+                self.stop_event.set()
+                producer.join()
+                self.finished = time.perf_counter()
+
+    def report(self) -> str:
+        wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        reader_capacity = wall * self.readers
+        reader_idle = max(reader_capacity - self.read_time, 0.0)
+        return (f"readers busy {self.read_time:.1f}s / idle {reader_idle:.1f}s across {self.readers} threads "
+                f"(blocked on full queue {self.reader_blocked_time:.1f}s), "
+                f"writer waited {self.consumer_wait_time:.1f}s for images")
@@ -0,0 +1,105 @@
+import hashlib
+import io
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+from ImageLoader import LoadedImage
+
+# Bounding boxes for each stored size; images are never upscaled
+DERIVATIVE_SIZES: Dict[str, Tuple[int, int]] = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1600, 1600),
+}
+JPEG_QUALITY = 85
+
+
+@dataclass
+class ImageDerivative:
+    size_name: str
+    width: int
+    height: int
+    content_type: str
+    image_data: bytes
+    image_hash: str
+
+
+def _encode(image, has_alpha: bool) -> Tuple[bytes, str]:
+    output = io.BytesIO()
+    # Saving a fresh image without exif/icc arguments drops all source metadata
+    if has_alpha:
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue(), 'image/png'
+    image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue(), 'image/jpeg'
+
+
+def process_image(image_source: Union[bytes, str],
+                  sizes: Dict[str, Tuple[int, int]] = DERIVATIVE_SIZES) -> List[ImageDerivative]:
+    # image_source is the image bytes, or a path for files too large to have been buffered
+    if Image is None:
+        raise ImportError("Pillow is required to process product images (pip install pillow)")
+    with Image.open(io.BytesIO(image_source) if isinstance(image_source, bytes) else image_source) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+
+    derivatives = []
+    # Largest first so each smaller size is resampled from an already reduced image
+    for size_name, box in sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+        image = source.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        data, content_type = _encode(image, has_alpha)
+        derivatives.append(ImageDerivative(size_name=size_name, width=image.width, height=image.height,
+                                           content_type=content_type, image_data=data,
+                                           image_hash=hashlib.sha256(data).hexdigest()))
+        source = image
+    return derivatives
+
+
+class ImageProcessor:
+    # Runs process_image on a process pool over a stream of LoadedImage, keeping at most
+    # `window` images in flight and yielding results in input order
+    def __init__(self, loaded_images: Iterable[LoadedImage], processes: int = None, window: int = 32):
+        if Image is None:
+            raise ImportError("Pillow is required to process product images (pip install pillow)")
+        self.loaded_images = loaded_images
+        self.processes = processes
+        self.window = window
+
+    def __iter__(self) -> Iterator[LoadedImage]:
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            for loaded in self.loaded_images:
+                source = loaded.row.image_path if loaded.streamed else loaded.image_data
+                future = executor.submit(process_image, source) if loaded.error is None else None
+                pending.append((loaded, future))
+                if len(pending) >= self.window:
+                    yield self._finish(*pending.popleft())
+            while pending:
+                yield self._finish(*pending.popleft())
+
+    @staticmethod
+    def _finish(loaded: LoadedImage, future) -> LoadedImage:
+        if future is None:
+            return loaded
+        try:
+            loaded.derivatives = future.result()
+        except Exception as e:
+            loaded.error = f"could not process {loaded.row.image_path}: {e}"
+            return loaded
+        full = next((d for d in loaded.derivatives if d.size_name == 'full'), None)
+        if full is not None:
+            loaded.image_data = full.image_data
+            loaded.content_type = full.content_type
+            loaded.image_hash = full.image_hash
+            loaded.byte_size = len(full.image_data)
+        return loaded
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Set
+
+import psycopg2
+
+from DatabaseManager import DatabaseManager, StoredImage
+
+CHUNK_SIZE = 256 * 1024
+# Hashes remembered as stored; a 300k-product import repeats images across nearby
+# batches, not across the whole manifest, so a window this size catches the repeats
+MAX_KNOWN_HASHES = 50000
+
+
+class ImageStore:
+    # Content-addressed images in TBL_IMAGE, keyed by SHA-256. The most recently seen
+    # hashes known to be on the server are remembered (least recently used first out), so
+    # repeated loads neither query nor upload them again while memory stays flat.
+    def __init__(self, db_manager: DatabaseManager, max_known_hashes: int = MAX_KNOWN_HASHES):
+        self.db_manager = db_manager
+        self.max_known_hashes = max_known_hashes
+        self.known_hashes: "OrderedDict[str, None]" = OrderedDict()
+
+    def existing_hashes(self, image_hashes: Iterable[str]) -> Set[str]:
+        image_hashes = set(image_hashes)
+        known = {image_hash for image_hash in image_hashes if image_hash in self.known_hashes}
+        unknown = list(image_hashes - known)
+        if unknown:
+            self.db_manager.cur.execute("SELECT IMAGE_HASH FROM TBL_IMAGE WHERE IMAGE_HASH = ANY(%s)", (unknown,))
+            known.update(row[0] for row in self.db_manager.cur.fetchall())
+        self.remember(known)
+        return known
+
+    def new_images(self, images: Iterable[StoredImage]) -> List[StoredImage]:
+        images = list(images)
+        existing = self.existing_hashes(image.image_hash for image in images)
+        return [image for image in images if image.image_hash not in existing]
+
+    def remember(self, image_hashes: Iterable[str]):
+        for image_hash in image_hashes:
+            self.known_hashes[image_hash] = None
+            self.known_hashes.move_to_end(image_hash)
+        while len(self.known_hashes) > self.max_known_hashes:
+            self.known_hashes.popitem(last=False)
+
+    def put(self, image: StoredImage):
+        # Inline counterpart of upload_stream for bytes already in memory; runs inside the
+        # caller's transaction
+        self.db_manager.cur.execute("""
+            INSERT INTO TBL_IMAGE (IMAGE_HASH, CONTENT_TYPE, BYTE_SIZE, IMAGE_DATA)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (IMAGE_HASH) DO NOTHING
+        """, (image.image_hash, image.content_type, image.byte_size, psycopg2.Binary(image.image_data)))
+        self.remember([image.image_hash])
+
+    def upload_stream(self, image: StoredImage, chunk_size: int = CHUNK_SIZE):
+        # Copies the file into a new large object one chunk at a time, so neither the
+        # file nor an escaped copy of it is ever held in memory. Runs inside the caller's
+        # transaction; a rollback also discards the large object.
+        lobject = self.db_manager.conn.lobject(0, 'wb')
+        try:
+            with open(image.source_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    lobject.write(chunk)
+            oid = lobject.oid
+        finally:
+            lobject.close()
+        self.db_manager.cur.execute("""
+            INSERT INTO TBL_IMAGE (IMAGE_HASH, CONTENT_TYPE, BYTE_SIZE, IMAGE_OID)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (IMAGE_HASH) DO NOTHING
+        """, (image.image_hash, image.content_type, image.byte_size, oid))
+        if self.db_manager.cur.rowcount == 0:
+            # Another loader stored the same content first
+            self.db_manager.conn.lobject(oid, 'n').unlink()
+
+    def describe(self, image_hash: str) -> Optional[StoredImage]:
+        self.db_manager.cur.execute("SELECT CONTENT_TYPE, BYTE_SIZE FROM TBL_IMAGE WHERE IMAGE_HASH = %s",
+                                    (image_hash,))
+        result = self.db_manager.cur.fetchone()
+        if result:
+            return StoredImage(image_hash=image_hash, content_type=result[0], image_data=None, byte_size=result[1])
+        return None
+
+    def iter_chunks(self, image_hash: str, start: int = 0, end: Optional[int] = None,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        # Yields bytes [start, end) of the image, at most chunk_size at a time
+        self.db_manager.cur.execute("SELECT BYTE_SIZE, IMAGE_OID FROM TBL_IMAGE WHERE IMAGE_HASH = %s",
+                                    (image_hash,))
+        result = self.db_manager.cur.fetchone()
+        if not result:
+            return
+        byte_size, oid = result
+        end = byte_size if end is None else min(end, byte_size)
+        if oid is not None:
+            lobject = self.db_manager.conn.lobject(oid, 'rb')
+            try:
+                lobject.seek(start)
+                position = start
+                while position < end:
+                    chunk = lobject.read(min(chunk_size, end - position))
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    yield chunk
+            finally:
+                lobject.close()
+            return
+        position = start
+        while position < end:
+            length = min(chunk_size, end - position)
+            # substring() is 1-based
+            self.db_manager.cur.execute("SELECT substring(IMAGE_DATA FROM %s FOR %s) FROM TBL_IMAGE WHERE IMAGE_HASH = %s",
+                                        (position + 1, length, image_hash))
+            chunk = bytes(self.db_manager.cur.fetchone()[0])
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+
+    def get(self, image_hash: str) -> Optional[StoredImage]:
+        image = self.describe(image_hash)
+        if image is None:
+            return None
+        image.image_data = b''.join(self.iter_chunks(image_hash))
+        return image
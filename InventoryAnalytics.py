@@ -0,0 +1,259 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from DatabaseManager import DatabaseManager
+
+NO_PRODUCT_TYPE = '(no product)'
+FETCH_SIZE = 50000
+
+# One row per inventory, with the linked product's type and price and its FILLING standard weight
+INVENTORY_QUERY = """
+    SELECT DISTINCT ON (i.INVENTORY_ID)
+           i.INVENTORY_ID, i.LOCATION, p.PRODUCT_TYPE, i.TOTAL_WEIGHT, i.INVENTORY_VALUE,
+           EXTRACT(EPOCH FROM i.INVENTORY_EXPIRATION_DATE), p.PRODUCT_PRICE, swp.STANDARD_WEIGHT
+    FROM TBL_INVENTORY i
+    LEFT JOIN TBL_PRODUCT p ON p.INVENTORY_ID = i.INVENTORY_ID
+    LEFT JOIN TBL_STANDARD_WEIGHT_PRODUCT swp ON swp.PRODUCT_ID = p.PRODUCT_ID
+         AND swp.STANDARD_WEIGHT_ID = (SELECT STANDARD_WEIGHT_ID FROM TBL_STANDARD_WEIGHT WHERE STANDARD_TYPE = 'FILLING')
+    {where}
+    ORDER BY i.INVENTORY_ID, p.PRODUCT_ID
+"""
+
+# (inventory id, location, product type, total weight, inventory value, expiration as epoch
+#  seconds, product price, FILLING standard weight). Expiration comes from EXTRACT(EPOCH ...),
+#  which is far cheaper to fetch and convert than a datetime per row.
+InventoryRow = Tuple[str, str, Optional[str], float, float, Optional[float], Optional[float], Optional[float]]
+EPOCH = datetime(1970, 1, 1)
+
+
+class InventoryAnalytics:
+    # Column store of TBL_INVENTORY joined to its product. Each column is a NumPy array
+    # and locations and product types are small integer codes, so every dashboard figure
+    # is one vectorized pass (mostly np.bincount) over the live rows. Rows are updated
+    # in place by inventory id; removed rows are masked out and compacted away later.
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise ImportError("NumPy is required for inventory analytics (pip install numpy)")
+        self.lock = threading.Lock()
+        self.index: Dict[str, int] = {}
+        self.size = 0
+        self.dead = 0
+        self.locations: List[str] = []
+        self.location_codes: Dict[str, int] = {}
+        self.product_types: List[str] = []
+        self.product_type_codes: Dict[str, int] = {}
+        self._allocate(capacity)
+        self.loaded_at = None
+        self.refreshed_rows = 0
+
+    def _allocate(self, capacity: int):
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.location = np.zeros(capacity, dtype=np.int32)
+        self.product_type = np.zeros(capacity, dtype=np.int32)
+        self.weight = np.zeros(capacity, dtype=np.float64)
+        self.value = np.zeros(capacity, dtype=np.float64)
+        self.expiration = np.full(capacity, np.nan, dtype=np.float64)
+        self.price = np.full(capacity, np.nan, dtype=np.float64)
+        self.standard_weight = np.full(capacity, np.nan, dtype=np.float64)
+
+    def _columns(self) -> List[str]:
+        return ['alive', 'location', 'product_type', 'weight', 'value', 'expiration', 'price', 'standard_weight']
+
+    def _grow(self, needed: int):
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        old = {name: getattr(self, name) for name in self._columns()}
+        self._allocate(capacity)
+        for name, column in old.items():
+            getattr(self, name)[:len(column)] = column
+
+    @staticmethod
+    def _code(codes: Dict[str, int], names: List[str], name: str) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    # Loading and incremental refresh
+
+    def load(self, db_manager: DatabaseManager):
+        # Built off to the side and swapped in, so the dashboard keeps answering from the
+        # previous load meanwhile. A server-side cursor converts the rows a chunk at a time.
+        fresh = InventoryAnalytics(capacity=len(self.alive))
+        with db_manager.conn.cursor(name='inventory_analytics') as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(INVENTORY_QUERY.format(where=''))
+            while True:
+                rows = cur.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                fresh.upsert(rows)
+        db_manager.rollback()
+        self.replace(fresh)
+
+    def replace(self, other: 'InventoryAnalytics'):
+        with self.lock:
+            for name in self._columns() + ['index', 'size', 'dead', 'locations', 'location_codes', 'product_types',
+                                           'product_type_codes']:
+                setattr(self, name, getattr(other, name))
+            self.refreshed_rows += other.refreshed_rows
+            self.loaded_at = time.time()
+
+    def refresh(self, db_manager: DatabaseManager, inventory_ids: Iterable[str]):
+        # Re-reads the given inventory rows; ids that no longer exist are removed
+        inventory_ids = list(inventory_ids)
+        db_manager.cur.execute(INVENTORY_QUERY.format(where="WHERE i.INVENTORY_ID = ANY(%s)"), (inventory_ids,))
+        rows = db_manager.cur.fetchall()
+        db_manager.rollback()
+        self.upsert(rows)
+        self.remove(set(inventory_ids) - {row[0] for row in rows})
+
+    def refresh_products(self, db_manager: DatabaseManager, product_ids: Iterable[str]):
+        # Price, type or standard weight changes reach analytics through the product's inventory
+        db_manager.cur.execute("SELECT INVENTORY_ID FROM TBL_PRODUCT WHERE PRODUCT_ID = ANY(%s) AND INVENTORY_ID IS NOT NULL",
+                               (list(product_ids),))
+        inventory_ids = [row[0] for row in db_manager.cur.fetchall()]
+        if inventory_ids:
+            self.refresh(db_manager, inventory_ids)
+
+    def upsert(self, rows: Sequence[InventoryRow]):
+        if not rows:
+            return
+        with self.lock:
+            positions = np.empty(len(rows), dtype=np.int64)
+            for k, row in enumerate(rows):
+                position = self.index.get(row[0])
+                if position is None:
+                    position = self.index[row[0]] = self.size
+                    self.size += 1
+                positions[k] = position
+            self._grow(self.size)
+            self.alive[positions] = True
+            self.location[positions] = [self._code(self.location_codes, self.locations, row[1] or '')
+                                        for row in rows]
+            self.product_type[positions] = [self._code(self.product_type_codes, self.product_types,
+                                                       row[2] or NO_PRODUCT_TYPE) for row in rows]
+            # float64 conversion turns NULLs (None) into NaN
+            self.weight[positions] = np.array([row[3] or 0.0 for row in rows], dtype=np.float64)
+            self.value[positions] = np.array([row[4] or 0.0 for row in rows], dtype=np.float64)
+            self.expiration[positions] = np.array([row[5] for row in rows], dtype=np.float64)
+            self.price[positions] = np.array([row[6] for row in rows], dtype=np.float64)
+            self.standard_weight[positions] = np.array([row[7] for row in rows], dtype=np.float64)
+            self.refreshed_rows += len(rows)
+
+    def remove(self, inventory_ids: Iterable[str]):
+        with self.lock:
+            for inventory_id in inventory_ids:
+                position = self.index.pop(inventory_id, None)
+                if position is not None:
+                    self.alive[position] = False
+                    self.dead += 1
+            if self.dead > max(self.size // 2, 1024):
+                self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive[:self.size])
+        remap = np.full(self.size, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        for name in self._columns():
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self.alive[len(keep):self.size] = False
+        self.index = {inventory_id: int(remap[position]) for inventory_id, position in self.index.items()}
+        self.size = len(keep)
+        self.dead = 0
+
+    # Dashboard
+
+    def dashboard(self, expiring_within_days: float = 3.0, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.now()
+        with self.lock:
+            n = self.size
+            alive = self.alive[:n]
+            location = self.location[:n][alive]
+            product_type = self.product_type[:n][alive]
+            weight = self.weight[:n][alive]
+            value = self.value[:n][alive]
+            expiration = self.expiration[:n][alive]
+            price_per_gram = self.price[:n][alive] / self.standard_weight[:n][alive]
+            locations = list(self.locations)
+            product_types = list(self.product_types)
+
+        n_locations, n_types = len(locations), len(product_types)
+        value_by_type = np.bincount(product_type, weights=value, minlength=n_types)
+        weight_by_type = np.bincount(product_type, weights=weight, minlength=n_types)
+        value_by_location = np.bincount(location, weights=value, minlength=n_locations)
+        weight_by_location = np.bincount(location, weights=weight, minlength=n_locations)
+        value_by_type_location = np.bincount(product_type * n_locations + location, weights=value,
+                                             minlength=n_types * n_locations).reshape(n_types, n_locations)
+
+        now_seconds = (now - EPOCH).total_seconds()
+        cutoff = now_seconds + timedelta(days=expiring_within_days).total_seconds()
+        expired = expiration < now_seconds
+        expiring = (expiration >= now_seconds) & (expiration <= cutoff)
+        expiring_by_location = np.bincount(location[expiring], weights=value[expiring], minlength=n_locations)
+
+        # Inventory value per gram against what the product sells for per gram at its
+        # FILLING standard weight; rows without a price or standard weight are left out
+        priced = np.isfinite(price_per_gram) & (weight > 0)
+        priced_value = np.bincount(product_type[priced], weights=value[priced], minlength=n_types)
+        priced_weight = np.bincount(product_type[priced], weights=weight[priced], minlength=n_types)
+        price_per_gram_sum = np.bincount(product_type[priced], weights=price_per_gram[priced], minlength=n_types)
+        priced_rows = np.bincount(product_type[priced], minlength=n_types)
+        value_per_gram_by_type = _ratio(priced_value, priced_weight)
+        price_per_gram_by_type = _ratio(price_per_gram_sum, priced_rows)
+
+        return {
+            "inventory_rows": int(len(value)),
+            "total_value": float(value.sum()),
+            "weight_on_hand": float(weight.sum()),
+            "value_by_product_type": _named(product_types, value_by_type),
+            "weight_by_product_type": _named(product_types, weight_by_type),
+            "value_by_location": _named(locations, value_by_location),
+            "weight_by_location": _named(locations, weight_by_location),
+            "value_by_product_type_and_location": {
+                product_types[t]: _named(locations, value_by_type_location[t]) for t in range(n_types)
+            },
+            "expiring_within_days": expiring_within_days,
+            "expiring_value": float(value[expiring].sum()),
+            "expiring_value_by_location": _named(locations, expiring_by_location),
+            "expired_value": float(value[expired].sum()),
+            "value_per_gram_by_product_type": _named(product_types, value_per_gram_by_type),
+            "price_per_gram_by_product_type": _named(product_types, price_per_gram_by_type),
+            "value_to_price_ratio_by_product_type": _named(product_types,
+                                                           _ratio(value_per_gram_by_type, price_per_gram_by_type)),
+        }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "rows": self.size - self.dead,
+                "removed_pending_compaction": self.dead,
+                "capacity": len(self.alive),
+                "locations": len(self.locations),
+                "product_types": len(self.product_types),
+                "refreshed_rows": self.refreshed_rows,
+                "loaded_at": self.loaded_at,
+            }
+
+
+def _ratio(numerator, denominator):
+    result = np.full(len(numerator), np.nan)
+    np.divide(numerator, denominator, out=result, where=(denominator != 0) & np.isfinite(denominator))
+    return result
+
+
+def _named(names: List[str], values) -> Dict[str, Optional[float]]:
+    # JSON-friendly: NaN becomes None
+    return {name: (float(value) if np.isfinite(value) else None) for name, value in zip(names, values)}
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from ConnectionPool import ConnectionPool, PoolTimeout
+from SchemaMigrations import migrate
+
+logger = logging.getLogger(__name__)
+
+# Value leaves pro rata with weight, so the remaining stock keeps its value per gram
+DEPLETE_QUERY = """
+    UPDATE TBL_INVENTORY i
+    SET TOTAL_WEIGHT = GREATEST(i.TOTAL_WEIGHT - d.GRAMS, 0),
+        INVENTORY_VALUE = CASE WHEN i.TOTAL_WEIGHT > 0
+                               THEN i.INVENTORY_VALUE * GREATEST(i.TOTAL_WEIGHT - d.GRAMS, 0) / i.TOTAL_WEIGHT
+                               ELSE i.INVENTORY_VALUE END
+    FROM (VALUES %s) AS d (INVENTORY_ID, GRAMS)
+    WHERE i.INVENTORY_ID = d.INVENTORY_ID
+    RETURNING i.INVENTORY_ID, i.TOTAL_WEIGHT, i.INVENTORY_VALUE
+"""
+
+
+@dataclass(slots=True)
+class InventoryBalance:
+    inventory_id: str
+    total_weight: float
+    inventory_value: float
+    pending_grams: float
+
+
+class InventoryDepletion:
+    # Write-behind depletion of TBL_INVENTORY. Weighings only add grams to an in-memory
+    # delta per inventory (and a line to the journal); a background thread turns all the
+    # deltas gathered in an interval into one UPDATE ... FROM (VALUES ...), so hot rows
+    # are locked once per interval instead of once per portion. Balances are the last
+    # flushed figures less whatever is still pending, so reads never wait for a flush.
+    #
+    # The journal is rotated to <journal>.flushing for each flush and removed once it
+    # commits. Each flush records its batch id (the first depletion id in the file) in
+    # TBL_INVENTORY_DEPLETION_BATCH in the same transaction, so a journal replayed after
+    # a crash is applied exactly once.
+    def __init__(self, db_pool: ConnectionPool, flush_interval: float = 1.0,
+                 journal_path: str = 'depletion_journal.jsonl', fsync: bool = False):
+        self.db_pool = db_pool
+        self.flush_interval = flush_interval
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + '.flushing'
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.journal = None
+        self.table_ready = False
+
+        self.pending: Dict[str, float] = {}
+        # Deltas in the rotated journal, retried until they commit
+        self.flushing: Dict[str, float] = {}
+        self.flushing_batch_id: Optional[str] = None
+        # Last committed (total weight, inventory value) per inventory
+        self.balances: Dict[str, tuple] = {}
+        # Called from the flush thread with {inventory id: InventoryBalance} after each commit
+        self.listeners: List[Callable[[Dict[str, InventoryBalance]], None]] = []
+
+        self.depletions = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.recovered_inventories = 0
+        self.last_flush_latency = None
+
+        self._recover()
+
+    def create_table(self):
+        with self.db_pool.connection() as conn:
+            migrate(conn)
+        self.table_ready = True
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def subscribe(self, listener: Callable[[Dict[str, InventoryBalance]], None]):
+        self.listeners.append(listener)
+
+    def deplete(self, inventory_id: str, grams: float) -> InventoryBalance:
+        grams = float(grams)
+        with self.lock:
+            self._journal_write({"depletion_id": str(uuid.uuid4()), "inventory_id": inventory_id, "grams": grams})
+            self.pending[inventory_id] = self.pending.get(inventory_id, 0.0) + grams
+            self.depletions += 1
+            balance = self._balance(inventory_id)
+        return balance
+
+    def balance(self, inventory_id: str) -> Optional[InventoryBalance]:
+        # The first read of an inventory fetches its committed figures; later reads are in memory
+        with self.lock:
+            known = inventory_id in self.balances
+        if not known:
+            with self.db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT TOTAL_WEIGHT, INVENTORY_VALUE FROM TBL_INVENTORY WHERE INVENTORY_ID = %s",
+                                (inventory_id,))
+                    row = cur.fetchone()
+                conn.rollback()
+            if row is None:
+                return None
+            with self.lock:
+                self.balances.setdefault(inventory_id, (float(row[0] or 0), float(row[1] or 0)))
+        with self.lock:
+            return self._balance(inventory_id)
+
+    def invalidate(self, inventory_ids=None):
+        # Inventory changed by another writer; its committed figures are re-read on next use
+        with self.lock:
+            if inventory_ids is None:
+                self.balances.clear()
+            else:
+                for inventory_id in inventory_ids:
+                    self.balances.pop(inventory_id, None)
+
+    def _balance(self, inventory_id: str) -> InventoryBalance:
+        pending = self.pending.get(inventory_id, 0.0) + self.flushing.get(inventory_id, 0.0)
+        weight, value = self.balances.get(inventory_id, (None, None))
+        if weight is None:
+            return InventoryBalance(inventory_id, None, None, pending)
+        remaining = max(weight - pending, 0.0)
+        return InventoryBalance(inventory_id, remaining, value * remaining / weight if weight > 0 else value, pending)
+
+    def flush(self) -> bool:
+        # Retries the rotated batch first, then rotates and applies whatever is pending
+        with self.flush_lock:
+            if self.flushing and not self._apply_flushing():
+                return False
+            with self.lock:
+                if not self.pending:
+                    return True
+                self._rotate()
+            return self._apply_flushing()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "depletions": self.depletions,
+                "pending_inventories": len(self.pending),
+                "pending_grams": sum(self.pending.values()),
+                "flushing_inventories": len(self.flushing),
+                "flushed_rows": self.flushed_rows,
+                "flush_count": self.flush_count,
+                "failed_flushes": self.failed_flushes,
+                "recovered_inventories": self.recovered_inventories,
+                "cached_balances": len(self.balances),
+                "last_flush_latency_ms": None if self.last_flush_latency is None else self.last_flush_latency * 1000,
+            }
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+        # Flush on a clean shutdown; anything that cannot reach the database stays journaled
+        self.flush()
+
+    def _journal_write(self, record: dict):
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+
+    def _rotate(self):
+        # Called with the lock held: the pending deltas and their journal become the next batch
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        os.replace(self.journal_path, self.flushing_path)
+        self.flushing, self.pending = self.pending, {}
+        self.flushing_batch_id = _read_journal(self.flushing_path)[0]
+
+    def _apply_flushing(self) -> bool:
+        rows = sorted(self.flushing.items())  # a fixed order keeps concurrent flushers from deadlocking
+        start = time.perf_counter()
+        try:
+            if not self.table_ready:
+                self.create_table()
+            with self.db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("INSERT INTO TBL_INVENTORY_DEPLETION_BATCH (BATCH_ID) VALUES (%s) "
+                                "ON CONFLICT (BATCH_ID) DO NOTHING", (self.flushing_batch_id,))
+                    if cur.rowcount == 0:
+                        logger.info("Depletion batch %s was already applied, skipping", self.flushing_batch_id)
+                        returned = []
+                    else:
+                        returned = execute_values(cur, DEPLETE_QUERY, rows, template="(%s, %s::numeric)",
+                                                  page_size=len(rows), fetch=True)
+                conn.commit()
+        except (psycopg2.Error, PoolTimeout) as e:
+            logger.error(f"Error flushing depletion for {len(rows)} inventories: {e}")
+            with self.lock:
+                self.failed_flushes += 1
+            return False
+
+        with self.lock:
+            for inventory_id in self.flushing:
+                self.balances.pop(inventory_id, None)
+            for inventory_id, weight, value in returned:
+                self.balances[inventory_id] = (float(weight), float(value))
+            self.flushing = {}
+            self.flushing_batch_id = None
+            os.remove(self.flushing_path)
+            self.flushed_rows += len(returned)
+            self.flush_count += 1
+            self.last_flush_latency = time.perf_counter() - start
+            flushed = {inventory_id: self._balance(inventory_id) for inventory_id, _, _ in returned}
+        for listener in self.listeners:
+            try:
+                listener(flushed)
+            except Exception:
+                logger.exception("Depletion listener failed")
+        return True
+
+    def _recover(self):
+        # A batch rotated before a crash is retried as is (its batch id makes that safe);
+        # depletions journaled since then are pending again
+        if os.path.exists(self.flushing_path):
+            self.flushing_batch_id, self.flushing = _read_journal(self.flushing_path)
+            self.recovered_inventories += len(self.flushing)
+        if os.path.exists(self.journal_path):
+            _, self.pending = _read_journal(self.journal_path)
+            self.recovered_inventories += len(self.pending)
+        if self.flushing or self.pending:
+            logger.warning("Recovered unflushed depletion for %d inventories from the journal",
+                           len(set(self.flushing) | set(self.pending)))
+
+
+def _read_journal(path: str):
+    batch_id = None
+    deltas: Dict[str, float] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write
+                logger.warning("Skipping unreadable depletion journal line in %s", path)
+                continue
+            batch_id = batch_id or record["depletion_id"]
+            deltas[record["inventory_id"]] = deltas.get(record["inventory_id"], 0.0) + record["grams"]
+    return batch_id, deltas
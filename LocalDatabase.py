@@ -0,0 +1,302 @@
+import functools
+import logging
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2 import extensions
+
+from DatabaseManager import DatabaseManager
+from SchemaMigrations import MIGRATIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_PATH = 'deli_local.sqlite'
+# The PostgreSQL migration LOCAL_SCHEMA mirrors; kept in PRAGMA user_version
+LOCAL_SCHEMA_VERSION = MIGRATIONS[-1].version
+# Stays well under SQLITE_MAX_VARIABLE_NUMBER
+MAX_BOUND_KEYS = 400
+
+# SchemaMigrations' tables in SQLite types. Foreign keys are declared but, as SQLite
+# does by default, not enforced: pulls land parents and children in separate batches.
+LOCAL_SCHEMA: Tuple[str, ...] = (
+    """
+    CREATE TABLE IF NOT EXISTS TBL_STANDARD_WEIGHT (
+        STANDARD_WEIGHT_ID TEXT PRIMARY KEY,
+        STANDARD_TYPE TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_INVENTORY (
+        INVENTORY_ID TEXT PRIMARY KEY,
+        TOTAL_WEIGHT REAL,
+        INVENTORY_VALUE REAL,
+        INVENTORY_EXPIRATION_DATE TEXT,
+        LOCATION TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_IMAGE (
+        IMAGE_HASH TEXT PRIMARY KEY,
+        CONTENT_TYPE TEXT NOT NULL,
+        BYTE_SIZE INTEGER NOT NULL,
+        IMAGE_DATA BLOB,
+        IMAGE_OID INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_PRODUCT (
+        PRODUCT_ID TEXT PRIMARY KEY,
+        PRODUCT_NAME TEXT NOT NULL,
+        PRODUCT_DESCRIPTION TEXT,
+        PRODUCT_PRICE REAL,
+        PRODUCT_TYPE TEXT,
+        PRODUCT_IMAGE BLOB,
+        INVENTORY_ID TEXT REFERENCES TBL_INVENTORY (INVENTORY_ID),
+        IMAGE_HASH TEXT REFERENCES TBL_IMAGE (IMAGE_HASH),
+        FINGERPRINT TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_STANDARD_WEIGHT_PRODUCT (
+        STANDARD_WEIGHT_PRODUCT_ID TEXT PRIMARY KEY,
+        STANDARD_WEIGHT REAL NOT NULL,
+        STANDARD_WEIGHT_ID TEXT NOT NULL REFERENCES TBL_STANDARD_WEIGHT (STANDARD_WEIGHT_ID),
+        PRODUCT_ID TEXT NOT NULL REFERENCES TBL_PRODUCT (PRODUCT_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_PRODUCT_IMAGE_DERIVATIVE (
+        PRODUCT_ID TEXT NOT NULL,
+        SIZE_NAME TEXT NOT NULL,
+        WIDTH INTEGER NOT NULL,
+        HEIGHT INTEGER NOT NULL,
+        CONTENT_TYPE TEXT NOT NULL,
+        IMAGE_HASH TEXT NOT NULL REFERENCES TBL_IMAGE (IMAGE_HASH),
+        PRIMARY KEY (PRODUCT_ID, SIZE_NAME)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS TBL_WEIGHING (
+        WEIGHING_ID TEXT PRIMARY KEY,
+        SCALE_ID TEXT NOT NULL,
+        PRODUCT_ID TEXT NOT NULL,
+        WEIGHT REAL NOT NULL,
+        WEIGHED_AT TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS IX_STANDARD_WEIGHT_TYPE ON TBL_STANDARD_WEIGHT (STANDARD_TYPE)",
+    "CREATE INDEX IF NOT EXISTS IX_STANDARD_WEIGHT_PRODUCT_PRODUCT ON TBL_STANDARD_WEIGHT_PRODUCT (PRODUCT_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PRODUCT_TYPE ON TBL_PRODUCT (PRODUCT_TYPE, PRODUCT_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PRODUCT_INVENTORY ON TBL_PRODUCT (INVENTORY_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PRODUCT_NAME_TYPE ON TBL_PRODUCT (PRODUCT_NAME, PRODUCT_TYPE)",
+    "CREATE INDEX IF NOT EXISTS IX_PRODUCT_IMAGE_HASH ON TBL_PRODUCT (IMAGE_HASH)",
+    "CREATE INDEX IF NOT EXISTS IX_PRODUCT_IMAGE_DERIVATIVE_HASH ON TBL_PRODUCT_IMAGE_DERIVATIVE (IMAGE_HASH)",
+    "CREATE INDEX IF NOT EXISTS IX_WEIGHING_PRODUCT_TIME ON TBL_WEIGHING (PRODUCT_ID, WEIGHED_AT)",
+    # Rows written locally and not yet pushed, one entry per (table, key) however often
+    # the row changes. SEQ moves on every write, so a push only clears entries it saw.
+    """
+    CREATE TABLE IF NOT EXISTS TBL_SYNC_OUTBOX (
+        TABLE_NAME TEXT NOT NULL,
+        ROW_KEY TEXT NOT NULL,
+        SEQ INTEGER NOT NULL,
+        PRIMARY KEY (TABLE_NAME, ROW_KEY)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS IX_SYNC_OUTBOX_SEQ ON TBL_SYNC_OUTBOX (SEQ)",
+    # Holds a row only inside a pull's own transaction, which the outbox triggers skip
+    "CREATE TABLE IF NOT EXISTS TBL_SYNC_PULL (PULLING INTEGER PRIMARY KEY)",
+)
+
+# Local writes to these tables are pushed to PostgreSQL: table -> column naming the rows
+# one outbox entry covers. Derivatives are replaced per product, as bulk_upsert does.
+OUTBOX_KEYS: Dict[str, str] = {
+    'TBL_INVENTORY': 'INVENTORY_ID',
+    'TBL_IMAGE': 'IMAGE_HASH',
+    'TBL_PRODUCT': 'PRODUCT_ID',
+    'TBL_STANDARD_WEIGHT_PRODUCT': 'STANDARD_WEIGHT_PRODUCT_ID',
+    'TBL_PRODUCT_IMAGE_DERIVATIVE': 'PRODUCT_ID',
+    'TBL_WEIGHING': 'WEIGHING_ID',
+}
+
+
+def _outbox_triggers(table: str, key: str) -> List[str]:
+    triggers = []
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        triggers.append(f"""
+            CREATE TRIGGER IF NOT EXISTS TR_{table}_{event}_OUTBOX AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO TBL_SYNC_OUTBOX (TABLE_NAME, ROW_KEY, SEQ)
+                SELECT '{table}', {row}.{key}, (SELECT IFNULL(MAX(SEQ), 0) + 1 FROM TBL_SYNC_OUTBOX)
+                WHERE NOT EXISTS (SELECT 1 FROM TBL_SYNC_PULL)
+                ON CONFLICT (TABLE_NAME, ROW_KEY) DO UPDATE SET SEQ = excluded.SEQ;
+            END
+        """)
+    return triggers
+
+
+def connect_local(path: str = DEFAULT_LOCAL_PATH, busy_timeout: float = 5.0) -> sqlite3.Connection:
+    # WAL lets readers run while the sync engine writes; synchronous=NORMAL only fsyncs at
+    # checkpoints, which can lose the last commits on power loss but never corrupts the file
+    conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def create_local_schema(conn: sqlite3.Connection):
+    for statement in LOCAL_SCHEMA:
+        conn.execute(statement)
+    for table, key in OUTBOX_KEYS.items():
+        for trigger in _outbox_triggers(table, key):
+            conn.execute(trigger)
+    conn.execute(f"PRAGMA user_version = {LOCAL_SCHEMA_VERSION}")
+    conn.commit()
+
+
+def to_local(value):
+    # psycopg2 parameter and result types -> what sqlite3 binds
+    if isinstance(value, extensions.Binary):
+        return value.adapted
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+_ANY = re.compile(r'=\s*ANY\(\s*%s\s*\)', re.IGNORECASE)
+_SUBSTRING = re.compile(r'substring\((\w+) FROM %s FOR %s\)', re.IGNORECASE)
+_OCTET_LENGTH = re.compile(r'octet_length\(', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def _split_query(sql: str) -> Tuple[str, ...]:
+    # The few PostgreSQL spellings DatabaseManager and ImageStore use, then the text
+    # around each %s placeholder
+    sql = _ANY.sub('IN %s', sql)
+    sql = _SUBSTRING.sub(r'substr(\1, %s, %s)', sql)
+    sql = _OCTET_LENGTH.sub('length(', sql)
+    return tuple(part.replace('%%', '%') for part in sql.split('%s'))
+
+
+def translate(sql: str, params) -> Tuple[str, list]:
+    # pyformat query -> qmark query; list parameters (from = ANY(%s)) expand to (?, ?, ...)
+    if params is None:
+        return sql, []
+    parts = _split_query(sql)
+    if not any(isinstance(param, (list, tuple)) for param in params):
+        return '?'.join(parts), [to_local(param) for param in params]
+    pieces = [parts[0]]
+    bound = []
+    for param, part in zip(params, parts[1:]):
+        if isinstance(param, (list, tuple)):
+            pieces.append('(' + ', '.join('?' * len(param)) + ')')
+            bound.extend(to_local(value) for value in param)
+        else:
+            pieces.append('?')
+            bound.append(to_local(param))
+        pieces.append(part)
+    return ''.join(pieces), bound
+
+
+class SQLiteCursor:
+    # The slice of the psycopg2 cursor interface DatabaseManager and ImageStore use
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    def execute(self, sql: str, params=None):
+        query, bound = translate(sql, params)
+        self.cursor.execute(query, bound)
+
+    def executemany(self, sql: str, seq_of_params):
+        parts = _split_query(sql)
+        self.cursor.executemany('?'.join(parts), ([to_local(param) for param in params] for params in seq_of_params))
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self.cursor.fetchmany(size or self.cursor.arraysize)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def close(self):
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    # DatabaseManager over an embedded SQLite copy of the schema, for counter tablets and
+    # the scale host: reads and writes stay on local disk and LocalSync carries them to
+    # and from PostgreSQL in the background. Local writes are recorded in TBL_SYNC_OUTBOX
+    # by triggers, so every inherited write path is captured without changes.
+    def __init__(self, path: str = DEFAULT_LOCAL_PATH, standard_weight_ttl: Optional[float] = None):
+        self.path = path
+        conn = connect_local(path)
+        create_local_schema(conn)
+        self._attach(conn, standard_weight_ttl, owns_connection=True)
+
+    def _attach(self, conn, standard_weight_ttl: Optional[float], owns_connection: bool):
+        super()._attach(conn, standard_weight_ttl, owns_connection)
+        self.cur = SQLiteCursor(conn.cursor())
+
+    def _execute_values(self, sql: str, argslist, page_size: int = 100):
+        rows = [tuple(row) for row in argslist]
+        if not rows:
+            return
+        self.cur.executemany(sql.replace('VALUES %s', 'VALUES (' + ', '.join(['%s'] * len(rows[0])) + ')', 1), rows)
+
+    def notify_products_changed(self, product_ids: List[str]):
+        # Nothing listens locally; LocalSync notifies PostgreSQL once the change is pushed
+        pass
+
+    def create_image_store_tables(self):
+        create_local_schema(self.conn)
+
+    def create_sync_columns(self):
+        create_local_schema(self.conn)
+
+    def find_products_by_natural_key(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[str, str, str]]:
+        # SQLite takes the other bare columns of a MIN() aggregate from the row holding
+        # the minimum, which stands in for DISTINCT ON
+        found = {}
+        for i in range(0, len(keys), MAX_BOUND_KEYS):
+            chunk = keys[i:i + MAX_BOUND_KEYS]
+            self.cur.cursor.execute(f"""
+                SELECT PRODUCT_NAME, PRODUCT_TYPE, MIN(PRODUCT_ID), INVENTORY_ID, FINGERPRINT
+                FROM TBL_PRODUCT
+                WHERE (PRODUCT_NAME, PRODUCT_TYPE) IN (VALUES {', '.join(['(?, ?)'] * len(chunk))})
+                GROUP BY PRODUCT_NAME, PRODUCT_TYPE
+            """, [value for key in chunk for value in key])
+            found.update({(name, product_type): (product_id, inventory_id, fingerprint)
+                          for name, product_type, product_id, inventory_id, fingerprint in self.cur.fetchall()})
+        return found
+
+    def pending_changes(self) -> int:
+        self.cur.execute("SELECT COUNT(*) FROM TBL_SYNC_OUTBOX")
+        return self.cur.fetchone()[0]
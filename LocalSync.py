@@ -0,0 +1,432 @@
+import argparse
+import logging
+import select
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from DatabaseManager import CATALOG_CHANNEL, DatabaseManager
+from ImageStore import ImageStore
+from LocalDatabase import DEFAULT_LOCAL_PATH, MAX_BOUND_KEYS, connect_local, create_local_schema, to_local
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class SyncTable:
+    name: str
+    # Column an outbox entry names; all rows sharing it are pushed together
+    key: str
+    primary_key: Tuple[str, ...]
+    columns: Tuple[str, ...]
+    # 'upsert': the local row wins, 'insert': the server's copy wins, None: only pulled
+    push: Optional[str]
+
+
+# In dependency order: parents are pushed and pulled before the rows referencing them
+SYNC_TABLES: List[SyncTable] = [
+    SyncTable('TBL_STANDARD_WEIGHT', 'STANDARD_WEIGHT_ID', ('STANDARD_WEIGHT_ID',),
+              ('STANDARD_WEIGHT_ID', 'STANDARD_TYPE'), None),
+    SyncTable('TBL_IMAGE', 'IMAGE_HASH', ('IMAGE_HASH',),
+              ('IMAGE_HASH', 'CONTENT_TYPE', 'BYTE_SIZE', 'IMAGE_DATA'), 'insert'),
+    # Live stock belongs to the server (InventoryDepletion), so only new rows are pushed
+    SyncTable('TBL_INVENTORY', 'INVENTORY_ID', ('INVENTORY_ID',),
+              ('INVENTORY_ID', 'TOTAL_WEIGHT', 'INVENTORY_VALUE', 'INVENTORY_EXPIRATION_DATE', 'LOCATION'), 'insert'),
+    SyncTable('TBL_PRODUCT', 'PRODUCT_ID', ('PRODUCT_ID',),
+              ('PRODUCT_ID', 'PRODUCT_NAME', 'PRODUCT_DESCRIPTION', 'PRODUCT_PRICE', 'PRODUCT_TYPE', 'PRODUCT_IMAGE',
+               'INVENTORY_ID', 'IMAGE_HASH', 'FINGERPRINT'), 'upsert'),
+    SyncTable('TBL_STANDARD_WEIGHT_PRODUCT', 'STANDARD_WEIGHT_PRODUCT_ID', ('STANDARD_WEIGHT_PRODUCT_ID',),
+              ('STANDARD_WEIGHT_PRODUCT_ID', 'STANDARD_WEIGHT', 'STANDARD_WEIGHT_ID', 'PRODUCT_ID'), 'upsert'),
+    SyncTable('TBL_PRODUCT_IMAGE_DERIVATIVE', 'PRODUCT_ID', ('PRODUCT_ID', 'SIZE_NAME'),
+              ('PRODUCT_ID', 'SIZE_NAME', 'WIDTH', 'HEIGHT', 'CONTENT_TYPE', 'IMAGE_HASH'), 'upsert'),
+    SyncTable('TBL_WEIGHING', 'WEIGHING_ID', ('WEIGHING_ID',),
+              ('WEIGHING_ID', 'SCALE_ID', 'PRODUCT_ID', 'WEIGHT', 'WEIGHED_AT'), 'insert'),
+]
+TABLES: Dict[str, SyncTable] = {table.name: table for table in SYNC_TABLES}
+# Pushing any of these changes a product, so ProductCatalog listeners are notified
+PRODUCT_TABLES = ('TBL_PRODUCT', 'TBL_STANDARD_WEIGHT_PRODUCT', 'TBL_PRODUCT_IMAGE_DERIVATIVE')
+# Pulled whole on (re)connect; images follow lazily, weighings are never pulled
+CATALOG_TABLES = ('TBL_STANDARD_WEIGHT', 'TBL_INVENTORY', 'TBL_PRODUCT', 'TBL_STANDARD_WEIGHT_PRODUCT',
+                  'TBL_PRODUCT_IMAGE_DERIVATIVE')
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class LocalSync:
+    # Keeps a SQLiteDatabaseManager file and PostgreSQL in step from a background thread.
+    # Push: outbox entries are drained table by table in dependency order, each batch in
+    # one server transaction, and cleared only once it has committed, so a crash
+    # re-pushes rather than loses. Products, standard weights and derivatives are
+    # upserted (the local write is newer than anything pulled), inventory, images and
+    # weighings are inserted only, and local deletes of upserted tables are pushed last,
+    # children first. Pull: everything after each (re)connect, then only the products
+    # named on CATALOG_CHANNEL, inventory every inventory_interval and missing images a
+    # few at a time. The server wins, except over rows whose local change is still in
+    # the outbox; unchanged rows are not rewritten.
+    def __init__(self, dbname, user, password, host, port, local_path: str = DEFAULT_LOCAL_PATH,
+                 batch_size: int = 500, push_interval: float = 1.0, inventory_interval: float = 30.0,
+                 image_batch: int = 20, retry_interval: float = 5.0):
+        self.connect_kwargs = dict(dbname=dbname, user=user, password=password, host=host, port=port)
+        self.local_path = local_path
+        self.batch_size = batch_size
+        self.push_interval = push_interval
+        self.inventory_interval = inventory_interval
+        self.image_batch = image_batch
+        self.retry_interval = retry_interval
+        self.local = connect_local(local_path)
+        create_local_schema(self.local)
+        self.local_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.conn = None
+        self.server: Optional[DatabaseManager] = None
+        # Referenced images the server does not have either; not asked for again
+        self.missing_images: Set[str] = set()
+
+        self.connected = False
+        self.pushed_rows = 0
+        self.rejected_batches = 0
+        self.pulled_rows = 0
+        self.skipped_conflicts = 0
+        self.full_pulls = 0
+        self.last_push_at = None
+        self.last_pull_at = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='local-sync', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self.local_lock:
+            pending = self.local.execute("SELECT COUNT(*) FROM TBL_SYNC_OUTBOX").fetchone()[0]
+        with self.stats_lock:
+            return {
+                "connected": self.connected,
+                "pending_changes": pending,
+                "pushed_rows": self.pushed_rows,
+                "rejected_batches": self.rejected_batches,
+                "pulled_rows": self.pulled_rows,
+                "skipped_conflicts": self.skipped_conflicts,
+                "full_pulls": self.full_pulls,
+                "missing_images": len(self.missing_images),
+                "seconds_since_push": None if self.last_push_at is None else time.monotonic() - self.last_push_at,
+                "seconds_since_pull": None if self.last_pull_at is None else time.monotonic() - self.last_pull_at,
+            }
+
+    # Thread
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.conn = psycopg2.connect(**self.connect_kwargs)
+                self.server = DatabaseManager.from_connection(self.conn)
+                with self.conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+                self.conn.commit()
+                with self.stats_lock:
+                    self.connected = True
+                # LISTEN first, so nothing committed during the pull is missed
+                self.push()
+                self.pull_all()
+                next_inventory_pull = time.monotonic() + self.inventory_interval
+                while not self.stop_event.is_set():
+                    if select.select([self.conn], [], [], self.push_interval) != ([], [], []):
+                        self.conn.poll()
+                        self._apply_notifications()
+                    self.push()
+                    self.pull_images()
+                    if time.monotonic() >= next_inventory_pull:
+                        self.pull_table(TABLES['TBL_INVENTORY'])
+                        next_inventory_pull = time.monotonic() + self.inventory_interval
+            except (psycopg2.Error, sqlite3.Error) as e:
+                logger.warning("Local sync lost its connection (%s), retrying in %.0fs", e, self.retry_interval)
+                self.stop_event.wait(self.retry_interval)
+            finally:
+                with self.stats_lock:
+                    self.connected = False
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                self.server = None
+
+    def _apply_notifications(self):
+        product_ids: Set[str] = set()
+        full = False
+        while self.conn.notifies:
+            payload = self.conn.notifies.pop(0).payload
+            if payload == '*':
+                full = True
+            else:
+                product_ids.update(product_id for product_id in payload.split(',') if product_id)
+        if full:
+            self.pull_all()
+        elif product_ids:
+            self.pull_products(product_ids)
+
+    # Push
+
+    def push(self) -> int:
+        pushed = 0
+        deleted: Dict[str, List[Tuple[str, int]]] = {}
+        for table in SYNC_TABLES:
+            if table.push is None:
+                continue
+            last_seq = 0
+            while True:
+                with self.local_lock:
+                    entries = self.local.execute("""
+                        SELECT ROW_KEY, SEQ FROM TBL_SYNC_OUTBOX
+                        WHERE TABLE_NAME = ? AND SEQ > ?
+                        ORDER BY SEQ
+                        LIMIT ?
+                    """, (table.name, last_seq, self.batch_size)).fetchall()
+                    if not entries:
+                        break
+                    rows = self._local_rows(table, [key for key, _ in entries])
+                    self.local.rollback()
+                last_seq = entries[-1][1]
+                present = {row[table.columns.index(table.key)] for row in rows}
+                replaced = table.primary_key != (table.key,)
+                if table.push == 'upsert' and not replaced:
+                    # Deleted locally; pushed after every upsert, children first
+                    deleted.setdefault(table.name, []).extend(entry for entry in entries if entry[0] not in present)
+                    done = [entry for entry in entries if entry[0] in present]
+                else:
+                    # Replaced tables delete as they go; insert-only tables never push deletes
+                    done = entries
+                if self._push_batch(table, [key for key, _ in entries] if replaced else None, rows):
+                    self._clear_outbox(table.name, done)
+                    pushed += len(done)
+        for table in reversed(SYNC_TABLES):
+            for entries in _chunks(deleted.get(table.name, []), self.batch_size):
+                if self._push_batch(table, [key for key, _ in entries], []):
+                    self._clear_outbox(table.name, entries)
+                    pushed += len(entries)
+        if pushed:
+            with self.stats_lock:
+                self.pushed_rows += pushed
+                self.last_push_at = time.monotonic()
+        return pushed
+
+    def _local_rows(self, table: SyncTable, keys: List[str]) -> List[tuple]:
+        rows = []
+        for chunk in _chunks(keys, MAX_BOUND_KEYS):
+            rows.extend(self.local.execute(
+                f"SELECT {', '.join(table.columns)} FROM {table.name} "
+                f"WHERE {table.key} IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+        return rows
+
+    def _push_batch(self, table: SyncTable, delete_keys: Optional[List[str]], rows: List[tuple]) -> bool:
+        # One server transaction; False when the server rejects the rows, which stay queued
+        try:
+            with self.conn.cursor() as cur:
+                if delete_keys:
+                    cur.execute(f"DELETE FROM {table.name} WHERE {table.key} = ANY(%s)", (delete_keys,))
+                if rows:
+                    if table.push == 'upsert':
+                        conflict = "DO UPDATE SET " + ', '.join(f"{column} = EXCLUDED.{column}"
+                                                                for column in table.columns
+                                                                if column not in table.primary_key)
+                    else:
+                        conflict = "DO NOTHING"
+                    execute_values(cur, f"""
+                        INSERT INTO {table.name} ({', '.join(table.columns)})
+                        VALUES %s
+                        ON CONFLICT ({', '.join(table.primary_key)}) {conflict}
+                    """, rows, page_size=100 if table.name in ('TBL_IMAGE', 'TBL_PRODUCT') else self.batch_size)
+            if table.name in PRODUCT_TABLES:
+                product_ids = set(delete_keys or []) if table.key == 'PRODUCT_ID' else set()
+                product_ids.update(row[table.columns.index('PRODUCT_ID')] for row in rows)
+                self.server.notify_products_changed(sorted(product_ids))
+            self.conn.commit()
+        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+            self.conn.rollback()
+            logger.error("Server rejected %d %s rows, keeping them queued: %s",
+                         len(rows) or len(delete_keys or []), table.name, e)
+            with self.stats_lock:
+                self.rejected_batches += 1
+            return False
+        return True
+
+    def _clear_outbox(self, table_name: str, entries: List[Tuple[str, int]]):
+        # Entries written again since they were read carry a newer SEQ and stay
+        with self.local_lock:
+            self.local.executemany("DELETE FROM TBL_SYNC_OUTBOX WHERE TABLE_NAME = ? AND ROW_KEY = ? AND SEQ = ?",
+                                   [(table_name, key, seq) for key, seq in entries])
+            self.local.commit()
+
+    # Pull
+
+    def pull_all(self):
+        for name in CATALOG_TABLES:
+            self.pull_table(TABLES[name])
+        with self.stats_lock:
+            self.full_pulls += 1
+
+    def pull_products(self, product_ids: Iterable[str]):
+        for chunk in _chunks(sorted(product_ids), MAX_BOUND_KEYS):
+            self.pull_table(TABLES['TBL_INVENTORY'],
+                            "WHERE INVENTORY_ID IN (SELECT INVENTORY_ID FROM TBL_PRODUCT WHERE PRODUCT_ID = ANY(%s))",
+                            (chunk,), scope=None)
+            for name in PRODUCT_TABLES:
+                self.pull_table(TABLES[name], "WHERE PRODUCT_ID = ANY(%s)", (chunk,), scope=('PRODUCT_ID', chunk))
+
+    def pull_table(self, table: SyncTable, where: str = '', params: tuple = (),
+                   scope: Optional[Tuple[str, List[str]]] = ('*', [])):
+        # Pulls the matching server rows; local rows in scope ((column, values), or '*' for
+        # the whole table) that the server no longer has are deleted. scope=None keeps them.
+        seen: Set[tuple] = set()
+        key_positions = [table.columns.index(column) for column in table.primary_key]
+        # A server-side cursor streams big tables a batch at a time
+        with self.conn.cursor(name=f'local_sync_{table.name.lower()}') as cur:
+            cur.itersize = self.batch_size
+            cur.execute(f"SELECT {', '.join(table.columns)} FROM {table.name} {where}", params)
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                seen.update(tuple(row[i] for i in key_positions) for row in rows)
+                self._apply_rows(table, rows)
+        self.conn.commit()
+        if scope is not None:
+            self._delete_unseen(table, seen, scope)
+        with self.stats_lock:
+            self.last_pull_at = time.monotonic()
+
+    def _begin_pull(self):
+        # Opens the pull's write transaction: the outbox triggers stay quiet while it runs,
+        # and pending keys read inside it cannot change until it commits
+        self.local.execute("INSERT INTO TBL_SYNC_PULL (PULLING) VALUES (1)")
+
+    def _pending_keys(self, table: SyncTable) -> Set[str]:
+        return {row[0] for row in self.local.execute("SELECT ROW_KEY FROM TBL_SYNC_OUTBOX WHERE TABLE_NAME = ?",
+                                                     (table.name,))}
+
+    def _end_pull(self):
+        self.local.execute("DELETE FROM TBL_SYNC_PULL")
+        self.local.commit()
+
+    def _apply_rows(self, table: SyncTable, rows: List[tuple]):
+        key_position = table.columns.index(table.key)
+        others = [column for column in table.columns if column not in table.primary_key]
+        sql = (f"INSERT INTO {table.name} ({', '.join(table.columns)}) "
+               f"VALUES ({', '.join('?' * len(table.columns))}) "
+               f"ON CONFLICT ({', '.join(table.primary_key)}) DO UPDATE SET "
+               + ', '.join(f"{column} = excluded.{column}" for column in others)
+               + " WHERE NOT (" + ' AND '.join(f"{table.name}.{column} IS excluded.{column}" for column in others)
+               + ")")
+        with self.local_lock:
+            try:
+                self._begin_pull()
+                pending = self._pending_keys(table)
+                kept = [[to_local(value) for value in row] for row in rows if row[key_position] not in pending]
+                cur = self.local.executemany(sql, kept)
+                changed = max(cur.rowcount, 0)
+                self._end_pull()
+            except sqlite3.Error:
+                self.local.rollback()
+                raise
+        with self.stats_lock:
+            self.pulled_rows += changed
+            self.skipped_conflicts += len(rows) - len(kept)
+
+    def _delete_unseen(self, table: SyncTable, seen: Set[tuple], scope: Tuple[str, List[str]]):
+        column, values = scope
+        select_sql = f"SELECT {', '.join(table.primary_key)}, {table.key} FROM {table.name}"
+        pk_count = len(table.primary_key)
+        with self.local_lock:
+            try:
+                self._begin_pull()
+                pending = self._pending_keys(table)
+                if column == '*':
+                    local_rows = self.local.execute(select_sql).fetchall()
+                else:
+                    local_rows = []
+                    for chunk in _chunks(values, MAX_BOUND_KEYS):
+                        local_rows.extend(self.local.execute(
+                            f"{select_sql} WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+                gone = [row[:pk_count] for row in local_rows
+                        if row[:pk_count] not in seen and row[pk_count] not in pending]
+                self.local.executemany(f"DELETE FROM {table.name} WHERE "
+                                       + ' AND '.join(f"{column} = ?" for column in table.primary_key), gone)
+                self._end_pull()
+            except sqlite3.Error:
+                self.local.rollback()
+                raise
+        with self.stats_lock:
+            self.pulled_rows += len(gone)
+
+    def pull_images(self) -> int:
+        # Content-addressed, so an image once stored never changes; only missing ones are fetched
+        with self.local_lock:
+            missing = [row[0] for row in self.local.execute("""
+                SELECT IMAGE_HASH FROM TBL_PRODUCT WHERE IMAGE_HASH IS NOT NULL
+                UNION
+                SELECT IMAGE_HASH FROM TBL_PRODUCT_IMAGE_DERIVATIVE
+                EXCEPT
+                SELECT IMAGE_HASH FROM TBL_IMAGE
+            """) if row[0] not in self.missing_images][:self.image_batch]
+        if not missing:
+            return 0
+        image_store = ImageStore(self.server)
+        rows = []
+        for image_hash in missing:
+            image = image_store.get(image_hash)
+            if image is None:
+                self.missing_images.add(image_hash)
+                continue
+            rows.append((image.image_hash, image.content_type, image.byte_size, image.image_data))
+        self.conn.commit()
+        if rows:
+            self._apply_rows(TABLES['TBL_IMAGE'], rows)
+        return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a local SQLite copy of DeliTelligenceDB in sync")
+    parser.add_argument('--path', default=DEFAULT_LOCAL_PATH, help="local SQLite database file")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--push-interval', type=float, default=1.0)
+    parser.add_argument('--inventory-interval', type=float, default=30.0)
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    sync = LocalSync(dbname=args.dbname, user=args.user, password=args.password, host=args.host, port=args.port,
+                     local_path=args.path, batch_size=args.batch_size, push_interval=args.push_interval,
+                     inventory_interval=args.inventory_interval)
+    sync.start()
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("Local sync: %s", sync.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sync.stop(timeout=10)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
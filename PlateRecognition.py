@@ -0,0 +1,251 @@
+import bisect
+import heapq
+import logging
+import math
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from PortionStats import PortionStatsEngine
+from ProductCatalog import ProductCatalog
+
+logger = logging.getLogger(__name__)
+
+# Portion spread assumed for products without enough weighings of their own
+DEFAULT_RELATIVE_STDDEV = 0.1
+MIN_WEIGHINGS_FOR_STDDEV = 30
+
+
+@dataclass(slots=True)
+class PlateItem:
+    product_id: str
+    product_name: str
+    count: int
+    standard_weight: float
+
+
+@dataclass(slots=True)
+class PlateMatch:
+    items: List[PlateItem]
+    total_weight: float
+    difference: float
+    probability: float
+
+
+class CombinationIndex:
+    # Every multiset of the candidate items (each up to max_count times, at most max_items
+    # on a plate) with its total standard weight, sorted by item count and then total. A
+    # weight is answered by bisecting each item count's run to the tolerance window and
+    # scoring at most max_window combinations of each, those with totals nearest the weight.
+    def __init__(self, items: List[Tuple[str, str, float, float]], max_items: int, max_count: int,
+                 max_combinations: int):
+        # items: (product id, product name, standard weight, portion stddev)
+        self.items = items
+        totals: List[float] = []
+        variances: List[float] = []
+        combinations: List[Tuple[Tuple[int, int], ...]] = []
+
+        def extend(start: int, chosen: List[Tuple[int, int]], size: int, total: float, variance: float):
+            for i in range(start, len(items)):
+                weight, stddev = items[i][2], items[i][3]
+                for count in range(1, min(max_count, max_items - size) + 1):
+                    combination = chosen + [(i, count)]
+                    totals.append(total + weight * count)
+                    variances.append(variance + stddev * stddev * count)
+                    combinations.append(tuple(combination))
+                    if len(totals) > max_combinations:
+                        raise ValueError(f"More than {max_combinations} plate combinations; narrow the candidate "
+                                         f"products or lower max_items")
+                    extend(i + 1, combination, size + count, total + weight * count,
+                           variance + stddev * stddev * count)
+
+        extend(0, [], 0, 0.0, 0.0)
+        item_counts = [sum(count for _, count in combination) for combination in combinations]
+        order = sorted(range(len(totals)), key=lambda k: (item_counts[k], totals[k]))
+        self.totals = [totals[k] for k in order]
+        self.variances = [variances[k] for k in order]
+        self.combinations = [combinations[k] for k in order]
+        # Query-independent parts of each combination's score
+        self.item_counts = [item_counts[k] for k in order]
+        self.half_log_variances = [0.5 * math.log(variance or 1.0) for variance in self.variances]
+        # [start, end) of each item count's run, sorted by total within it
+        self.runs = [(bisect.bisect_left(self.item_counts, size), bisect.bisect_right(self.item_counts, size))
+                     for size in range(1, max_items + 1)]
+
+    def __len__(self):
+        return len(self.totals)
+
+    def match(self, weight: float, tolerance: float, limit: int, item_penalty: float,
+              max_window: int = 512) -> List[PlateMatch]:
+        totals, variances, item_counts, half_log_variances = (self.totals, self.variances, self.item_counts,
+                                                              self.half_log_variances)
+        window: List[int] = []
+        for start, end in self.runs:
+            low = bisect.bisect_left(totals, weight - tolerance, start, end)
+            high = bisect.bisect_right(totals, weight + tolerance, low, end)
+            if high - low > max_window:
+                # Wide tolerances over big indexes cover tens of thousands of combinations.
+                # Within one item count the prior is equal and the far totals carry next to
+                # no probability, so keep the max_window nearest the weight
+                low = min(max(low, bisect.bisect_left(totals, weight, low, high) - max_window // 2),
+                          high - max_window)
+                high = low + max_window
+            window.extend(range(low, high))
+        if not window:
+            return []
+        # Gaussian log-likelihood of the difference, with a prior favouring fewer items
+        scores = [-0.5 * (weight - totals[k]) ** 2 / (variances[k] or 1.0) - half_log_variances[k]
+                  - item_penalty * item_counts[k] for k in window]
+        best = max(scores)
+        normaliser = sum(math.exp(score - best) for score in scores)
+        top = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        scored = [(scores[j], window[j], weight - totals[window[j]]) for j in top]
+        return [
+            PlateMatch(items=[PlateItem(product_id=self.items[i][0], product_name=self.items[i][1], count=count,
+                                        standard_weight=self.items[i][2]) for i, count in self.combinations[k]],
+                       total_weight=self.totals[k], difference=difference,
+                       probability=math.exp(score - best) / normaliser)
+            for score, k, difference in scored
+        ]
+
+
+class PlateRecognizer:
+    # Guesses which catalog items are on a plate from its total weight. One
+    # CombinationIndex is built per (candidate products, standard type) on first use and
+    # cached. Catalog notifications about any of its products mark it stale and queue a
+    # rebuild on a background thread; lookups keep getting the stale index until the new
+    # one replaces it, so a price or weight edit never stalls the counter on a rebuild.
+    # Portion spreads come from the PortionStatsEngine when a product has been weighed
+    # often enough.
+    def __init__(self, product_catalog: ProductCatalog, portion_stats: Optional[PortionStatsEngine] = None,
+                 max_items: int = 6, max_count: int = 3, max_combinations: int = 500000,
+                 max_indexes: int = 64, max_candidates: int = 20, max_window: int = 512):
+        self.product_catalog = product_catalog
+        self.portion_stats = portion_stats
+        self.max_items = max_items
+        self.max_count = max_count
+        self.max_combinations = max_combinations
+        self.max_indexes = max_indexes
+        self.max_candidates = max_candidates
+        self.max_window = max_window
+        self.lock = threading.Lock()
+        self.indexes: Dict[Tuple[FrozenSet[str], str], CombinationIndex] = {}
+        # Bumped by every invalidation of a key; a build only replaces the cached index if
+        # its key was not invalidated while it ran
+        self.generations: Dict[Tuple[FrozenSet[str], str], int] = {}
+        # Bumped by every invalidation, for first builds whose key is not cached yet
+        self.generation = 0
+        self.stale: Set[Tuple[FrozenSet[str], str]] = set()
+        self.rebuild_queue: "queue.Queue[Tuple[FrozenSet[str], str]]" = queue.Queue()
+        self.rebuilder: Optional[threading.Thread] = None
+        self.builds = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+        product_catalog.subscribe(self.invalidate)
+
+    def invalidate(self, product_ids: Optional[Set[str]] = None):
+        with self.lock:
+            if product_ids is None:
+                affected = list(self.indexes)
+            else:
+                affected = [key for key in self.indexes if not key[0].isdisjoint(product_ids)]
+            for key in affected:
+                self.generations[key] = self.generations.get(key, 0) + 1
+                self._queue_rebuild(key)
+            self.invalidations += len(affected)
+            self.generation += 1
+
+    def _queue_rebuild(self, key: Tuple[FrozenSet[str], str]):
+        # Called with the lock held
+        if key in self.stale:
+            return
+        self.stale.add(key)
+        self.rebuild_queue.put(key)
+        if self.rebuilder is None:
+            self.rebuilder = threading.Thread(target=self._rebuild_loop, name='plate-index-rebuild', daemon=True)
+            self.rebuilder.start()
+
+    def _rebuild_loop(self):
+        while True:
+            key = self.rebuild_queue.get()
+            with self.lock:
+                # Invalidations from here on queue the key again
+                self.stale.discard(key)
+                if key not in self.indexes:
+                    # Evicted while queued
+                    continue
+                generation = self.generations.get(key, 0)
+            try:
+                index = self._build(key)
+            except Exception:
+                logger.exception("Plate index rebuild failed; serving the previous index")
+                continue
+            with self.lock:
+                self.rebuilds += 1
+                if key in self.indexes and self.generations.get(key, 0) == generation:
+                    self.indexes[key] = index
+
+    def _stddev(self, product_id: str, standard_type: str, standard_weight: float) -> float:
+        if self.portion_stats is not None:
+            summary = self.portion_stats.get(product_id, standard_type)
+            if summary and summary["count"] >= MIN_WEIGHINGS_FOR_STDDEV and summary["stddev"]:
+                return summary["stddev"]
+        return standard_weight * DEFAULT_RELATIVE_STDDEV
+
+    def _build(self, key: Tuple[FrozenSet[str], str]) -> CombinationIndex:
+        product_ids, standard_type = key
+        items = []
+        for product_id in sorted(product_ids):
+            product = self.product_catalog.get(product_id)
+            standard_weight = product.standard_weights.get(standard_type) if product else None
+            if standard_weight:
+                items.append((product_id, product.product_name, standard_weight,
+                              self._stddev(product_id, standard_type, standard_weight)))
+        index = CombinationIndex(items, self.max_items, self.max_count, self.max_combinations)
+        logger.info("Built plate index of %d combinations over %d products", len(index), len(items))
+        return index
+
+    def index_for(self, product_ids: Iterable[str], standard_type: str = 'FILLING') -> CombinationIndex:
+        key = (frozenset(product_ids), standard_type)
+        # Build time grows combinatorially with the candidates; a whole product type is
+        # rarely a sensible candidate set
+        if len(key[0]) > self.max_candidates:
+            raise ValueError(f"More than {self.max_candidates} candidate products; narrow the candidates")
+        with self.lock:
+            index = self.indexes.get(key)
+            generation = self.generation
+        if index is not None:
+            return index
+        # Nothing to serve yet, so the first build for a key runs in the request
+        index = self._build(key)
+        with self.lock:
+            self.builds += 1
+            if key not in self.indexes:
+                if len(self.indexes) >= self.max_indexes:
+                    evicted = next(iter(self.indexes))
+                    del self.indexes[evicted]
+                    self.generations.pop(evicted, None)
+                self.indexes[key] = index
+                # Standard weights changed while it was built: serve it, and rebuild behind it
+                if self.generation != generation:
+                    self._queue_rebuild(key)
+        return index
+
+    def recognize(self, weight: float, product_ids: Iterable[str], standard_type: str = 'FILLING',
+                  tolerance: Optional[float] = None, limit: int = 5, item_penalty: float = 0.5) -> List[PlateMatch]:
+        # tolerance defaults to 5% of the weight, and never less than 10 g
+        tolerance = max(10.0, weight * 0.05) if tolerance is None else tolerance
+        return self.index_for(product_ids, standard_type).match(float(weight), tolerance, limit, item_penalty,
+                                                                self.max_window)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "indexes": len(self.indexes),
+                "combinations": sum(len(index) for index in self.indexes.values()),
+                "stale": len(self.stale),
+                "builds": self.builds,
+                "rebuilds": self.rebuilds,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,289 @@
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ProductCatalog import ProductCatalog
+
+
+@dataclass(slots=True)
+class RunningStats:
+    # Welford's online mean and variance; merge() combines two streams exactly (Chan et al.)
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other: 'RunningStats'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def variance(self) -> Optional[float]:
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stddev(self) -> Optional[float]:
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+
+class QuantileSketch:
+    # Merging t-digest: points are buffered, then sorted together with the centroids and
+    # greedily merged under the arcsine scale function, which keeps centroids small near
+    # the tails. Memory is O(compression) however many weighings are added.
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self.buffer: List[Tuple[float, float]] = []
+        self.count = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float, weight: float = 1.0):
+        self.buffer.append((value, weight))
+        self.count += weight
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: 'QuantileSketch'):
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress()
+
+    def _scale(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _inverse_scale(self, k: float) -> float:
+        return (math.sin(min(max(k * 2 * math.pi / self.compression, -math.pi / 2), math.pi / 2)) + 1) / 2
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(weight for _, weight in points)
+        merged = []
+        mean, weight = points[0]
+        cumulative = 0.0
+        limit = self._inverse_scale(self._scale(0.0) + 1) * total
+        for next_mean, next_weight in points[1:]:
+            if cumulative + weight + next_weight <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                limit = self._inverse_scale(self._scale(cumulative / total) + 1) * total
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # Each centroid's mass is centred on its mean; interpolate between neighbouring centres
+        cumulative = 0.0
+        previous_center, previous_mean = 0.0, self.minimum
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target < center:
+                span = center - previous_center
+                return previous_mean + (mean - previous_mean) * ((target - previous_center) / span if span else 0)
+            cumulative += weight
+            previous_center, previous_mean = center, mean
+        span = self.count - previous_center
+        return previous_mean + (self.maximum - previous_mean) * ((target - previous_center) / span if span else 0)
+
+    def to_dict(self) -> dict:
+        self._compress()
+        return {"compression": self.compression, "centroids": self.centroids, "count": self.count,
+                "min": self.minimum, "max": self.maximum}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuantileSketch':
+        sketch = cls(float(data["compression"]))
+        if not sketch.compression > 0:
+            raise ValueError("compression must be positive")
+        sketch.centroids = [(float(mean), float(weight)) for mean, weight in data["centroids"]]
+        sketch.count = float(data["count"])
+        sketch.minimum = float(data["min"])
+        sketch.maximum = float(data["max"])
+        return sketch
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+@dataclass(slots=True)
+class PortionStats:
+    product_id: str
+    standard_type: str
+    standard_weight: Optional[float] = None
+    price_per_gram: Optional[float] = None
+    weights: RunningStats = field(default_factory=RunningStats)
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    over_count: int = 0
+    over_grams: float = 0.0
+    over_cost: float = 0.0
+    under_grams: float = 0.0
+
+    def add(self, weight: float):
+        self.weights.add(weight)
+        self.sketch.add(weight)
+        if self.standard_weight is None:
+            return
+        difference = weight - self.standard_weight
+        if difference > 0:
+            self.over_count += 1
+            self.over_grams += difference
+            self.over_cost += difference * (self.price_per_gram or 0.0)
+        else:
+            self.under_grams -= difference
+
+    def merge(self, other: 'PortionStats'):
+        self.weights.merge(other.weights)
+        self.sketch.merge(other.sketch)
+        self.over_count += other.over_count
+        self.over_grams += other.over_grams
+        self.over_cost += other.over_cost
+        self.under_grams += other.under_grams
+        if self.standard_weight is None:
+            self.standard_weight, self.price_per_gram = other.standard_weight, other.price_per_gram
+
+    def summary(self) -> dict:
+        count = self.weights.count
+        return {
+            "product_id": self.product_id,
+            "standard_type": self.standard_type,
+            "standard_weight": self.standard_weight,
+            "count": count,
+            "mean": self.weights.mean if count else None,
+            "stddev": self.weights.stddev,
+            "min": self.weights.minimum if count else None,
+            "max": self.weights.maximum if count else None,
+            "p50": self.sketch.quantile(0.5),
+            "p90": self.sketch.quantile(0.9),
+            "p99": self.sketch.quantile(0.99),
+            "mean_over_standard": (self.weights.mean - self.standard_weight
+                                   if count and self.standard_weight is not None else None),
+            "over_portion_rate": self.over_count / count if count else None,
+            "over_portion_grams": self.over_grams,
+            "over_portion_cost": self.over_cost,
+            "under_portion_grams": self.under_grams,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "product_id": self.product_id, "standard_type": self.standard_type,
+            "standard_weight": self.standard_weight, "price_per_gram": self.price_per_gram,
+            "weights": [self.weights.count, self.weights.mean, self.weights.m2, self.weights.minimum,
+                        self.weights.maximum],
+            "sketch": self.sketch.to_dict(),
+            "over": [self.over_count, self.over_grams, self.over_cost, self.under_grams],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PortionStats':
+        # Values are coerced here, so a bad document fails to load rather than in merge()
+        if not isinstance(data["product_id"], str) or not isinstance(data["standard_type"], str):
+            raise ValueError("product_id and standard_type must be strings")
+        count, mean, m2, minimum, maximum = data["weights"]
+        over_count, over_grams, over_cost, under_grams = data["over"]
+        return cls(product_id=data["product_id"], standard_type=data["standard_type"],
+                   standard_weight=_optional_float(data["standard_weight"]),
+                   price_per_gram=_optional_float(data["price_per_gram"]),
+                   weights=RunningStats(int(count), float(mean), float(m2), float(minimum), float(maximum)),
+                   sketch=QuantileSketch.from_dict(data["sketch"]), over_count=int(over_count),
+                   over_grams=float(over_grams), over_cost=float(over_cost), under_grams=float(under_grams))
+
+
+class PortionStatsEngine:
+    # Per (product, standard type) portion statistics fed one weighing at a time. The
+    # standard weight and price per gram (PRODUCT_PRICE / standard weight) come from the
+    # ProductCatalog when a product is first seen. Engines from other scales or stores are
+    # combined with merge(), or shipped as to_dict() JSON and merged with from_dict().
+    def __init__(self, product_catalog: Optional[ProductCatalog] = None, compression: float = 100.0):
+        self.product_catalog = product_catalog
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.stats: Dict[Tuple[str, str], PortionStats] = {}
+
+    def _stats_for(self, product_id: str, standard_type: str) -> PortionStats:
+        key = (product_id, standard_type)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = PortionStats(product_id=product_id, standard_type=standard_type,
+                                                   sketch=QuantileSketch(self.compression))
+        if stats.standard_weight is None and self.product_catalog is not None:
+            product = self.product_catalog.get(product_id)
+            standard_weight = product.standard_weights.get(standard_type) if product else None
+            if standard_weight:
+                stats.standard_weight = standard_weight
+                if product.product_price is not None:
+                    stats.price_per_gram = product.product_price / standard_weight
+        return stats
+
+    def record(self, product_id: str, weight: float, standard_type: str = 'FILLING'):
+        with self.lock:
+            self._stats_for(product_id, standard_type).add(float(weight))
+
+    def get(self, product_id: str, standard_type: str = 'FILLING') -> Optional[dict]:
+        with self.lock:
+            stats = self.stats.get((product_id, standard_type))
+            return stats.summary() if stats else None
+
+    def over_portioned(self, limit: int = 10) -> List[dict]:
+        # Products costing the most in grams given away above their standard weight
+        with self.lock:
+            worst = sorted(self.stats.values(), key=lambda stats: stats.over_cost, reverse=True)[:limit]
+            return [stats.summary() for stats in worst]
+
+    def merge(self, other: 'PortionStatsEngine'):
+        with other.lock:
+            incoming = list(other.stats.values())
+        with self.lock:
+            for stats in incoming:
+                self._stats_for(stats.product_id, stats.standard_type).merge(stats)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {"compression": self.compression, "stats": [stats.to_dict() for stats in self.stats.values()]}
+
+    @classmethod
+    def from_dict(cls, data: dict, product_catalog: Optional[ProductCatalog] = None) -> 'PortionStatsEngine':
+        # Raises ValueError for anything that is not a to_dict() document
+        try:
+            engine = cls(product_catalog, float(data["compression"]))
+            for item in data["stats"]:
+                stats = PortionStats.from_dict(item)
+                engine.stats[(stats.product_id, stats.standard_type)] = stats
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed portion statistics: {e!r}") from e
+        return engine
@@ -0,0 +1,263 @@
+import bisect
+import logging
+import select
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from DatabaseManager import CATALOG_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class CatalogProduct:
+    product_id: str
+    product_name: str
+    product_description: str
+    product_price: float
+    product_type: str
+    inventory_id: Optional[str] = None
+    image_hash: Optional[str] = None
+    # STANDARD_TYPE (FILLING, SALAD, ...) -> grams
+    standard_weights: Dict[str, float] = field(default_factory=dict)
+
+
+def _name_key(name: str) -> str:
+    return name.casefold()
+
+
+class ProductCatalog:
+    # Read-mostly copy of TBL_PRODUCT (everything but the image bytes) and its standard
+    # weights, indexed by id, by PRODUCT_TYPE and by name prefix. A background thread
+    # LISTENs on CATALOG_CHANNEL and re-reads only the products writers NOTIFY about;
+    # after any reconnect it reloads everything, since notifications may have been missed.
+    def __init__(self, dbname, user, password, host, port, retry_interval: float = 5.0, poll_interval: float = 1.0):
+        self.connect_kwargs = dict(dbname=dbname, user=user, password=password, host=host, port=port)
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.ready = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.products: Dict[str, CatalogProduct] = {}
+        self.types: Dict[str, Dict[str, CatalogProduct]] = {}
+        # Sorted (casefolded name, product id) pairs for prefix search with bisect
+        self.names: List[Tuple[str, str]] = []
+        # STANDARD_TYPE values in TBL_STANDARD_WEIGHT
+        self.standard_types: FrozenSet[str] = frozenset()
+        # Called from the listener thread with the changed product ids, or None after a full reload
+        self.listeners: List[Callable[[Optional[Set[str]]], None]] = []
+
+        self.full_loads = 0
+        self.notifications = 0
+        self.refreshed_products = 0
+        self.last_load_seconds = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='product-catalog', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def subscribe(self, listener: Callable[[Optional[Set[str]]], None]):
+        self.listeners.append(listener)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def load(self):
+        # One-off synchronous load, for scripts that do not need live updates
+        conn = psycopg2.connect(**self.connect_kwargs)
+        try:
+            self._load_all(conn)
+        finally:
+            conn.close()
+
+    # Lookups never touch the database
+
+    def get(self, product_id: str) -> Optional[CatalogProduct]:
+        return self.products.get(product_id)
+
+    def by_type(self, product_type: str) -> List[CatalogProduct]:
+        with self.lock:
+            return list(self.types.get(product_type, {}).values())
+
+    def product_types(self) -> List[str]:
+        with self.lock:
+            return sorted(self.types)
+
+    def search(self, prefix: str, limit: Optional[int] = None) -> List[CatalogProduct]:
+        prefix = _name_key(prefix)
+        results = []
+        with self.lock:
+            i = bisect.bisect_left(self.names, (prefix, ''))
+            while i < len(self.names) and self.names[i][0].startswith(prefix):
+                results.append(self.products[self.names[i][1]])
+                if limit is not None and len(results) >= limit:
+                    break
+                i += 1
+        return results
+
+    def is_standard_type(self, standard_type: str) -> bool:
+        return standard_type in self.standard_types
+
+    def standard_weight(self, product_id: str, standard_type: str) -> Optional[float]:
+        product = self.products.get(product_id)
+        return product.standard_weights.get(standard_type) if product else None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "ready": self.ready.is_set(),
+                "products": len(self.products),
+                "product_types": len(self.types),
+                "full_loads": self.full_loads,
+                "notifications": self.notifications,
+                "refreshed_products": self.refreshed_products,
+                "last_load_ms": None if self.last_load_seconds is None else self.last_load_seconds * 1000,
+            }
+
+    # Loading
+
+    def _fetch(self, conn, product_ids: Optional[List[str]] = None) -> List[CatalogProduct]:
+        only = product_ids is not None
+        params = (product_ids,) if only else ()
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT p.PRODUCT_ID, p.PRODUCT_NAME, p.PRODUCT_DESCRIPTION, p.PRODUCT_PRICE, p.PRODUCT_TYPE,
+                       p.INVENTORY_ID, p.IMAGE_HASH
+                FROM TBL_PRODUCT p
+                {"WHERE p.PRODUCT_ID = ANY(%s)" if only else ""}
+            """, params)
+            # Product types repeat across thousands of rows, so each distinct string is kept once
+            products = {
+                row[0]: CatalogProduct(product_id=row[0], product_name=row[1], product_description=row[2],
+                                       product_price=float(row[3]) if row[3] is not None else None,
+                                       product_type=sys.intern(row[4]) if row[4] is not None else None,
+                                       inventory_id=row[5], image_hash=row[6])
+                for row in cur.fetchall()
+            }
+            cur.execute(f"""
+                SELECT swp.PRODUCT_ID, sw.STANDARD_TYPE, swp.STANDARD_WEIGHT
+                FROM TBL_STANDARD_WEIGHT_PRODUCT swp
+                JOIN TBL_STANDARD_WEIGHT sw ON sw.STANDARD_WEIGHT_ID = swp.STANDARD_WEIGHT_ID
+                {"WHERE swp.PRODUCT_ID = ANY(%s)" if only else ""}
+            """, params)
+            for product_id, standard_type, standard_weight in cur.fetchall():
+                product = products.get(product_id)
+                if product is not None:
+                    product.standard_weights[sys.intern(standard_type)] = float(standard_weight)
+            # A handful of rows; re-read with every fetch so new types show up with the products using them
+            cur.execute("SELECT STANDARD_TYPE FROM TBL_STANDARD_WEIGHT")
+            self.standard_types = frozenset(sys.intern(row[0]) for row in cur.fetchall())
+        conn.rollback()
+        return list(products.values())
+
+    def _load_all(self, conn):
+        start = time.perf_counter()
+        products = self._fetch(conn)
+        types: Dict[str, Dict[str, CatalogProduct]] = {}
+        for product in products:
+            types.setdefault(product.product_type, {})[product.product_id] = product
+        names = sorted((_name_key(product.product_name or ''), product.product_id) for product in products)
+        with self.lock:
+            self.products = {product.product_id: product for product in products}
+            self.types = types
+            self.names = names
+            self.full_loads += 1
+            self.last_load_seconds = time.perf_counter() - start
+        self.ready.set()
+        logger.info("Loaded %d products into the catalog in %.0f ms", len(products), self.last_load_seconds * 1000)
+        self._notify_listeners(None)
+
+    def _refresh(self, conn, product_ids: Set[str]):
+        # Re-reads the notified products; ids that no longer exist are dropped
+        fresh = {product.product_id: product for product in self._fetch(conn, list(product_ids))}
+        with self.lock:
+            for product_id in product_ids:
+                self._remove(product_id)
+                if product_id in fresh:
+                    self._add(fresh[product_id])
+            self.refreshed_products += len(product_ids)
+        self._notify_listeners(product_ids)
+
+    def _notify_listeners(self, product_ids: Optional[Set[str]]):
+        for listener in self.listeners:
+            try:
+                listener(product_ids)
+            except Exception:
+                logger.exception("Product catalog listener failed")
+
+    def _add(self, product: CatalogProduct):
+        self.products[product.product_id] = product
+        self.types.setdefault(product.product_type, {})[product.product_id] = product
+        bisect.insort(self.names, (_name_key(product.product_name or ''), product.product_id))
+
+    def _remove(self, product_id: str):
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        same_type = self.types.get(product.product_type)
+        if same_type is not None:
+            same_type.pop(product_id, None)
+            if not same_type:
+                del self.types[product.product_type]
+        key = (_name_key(product.product_name or ''), product_id)
+        i = bisect.bisect_left(self.names, key)
+        if i < len(self.names) and self.names[i] == key:
+            del self.names[i]
+
+    # Listener
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_kwargs)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+                # LISTEN first, so nothing committed during the load is missed
+                self._load_all(conn)
+                while not self.stop_event.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    self._apply(conn, self._drain(conn))
+            except psycopg2.Error as e:
+                logger.warning("Product catalog listener lost its connection (%s), retrying in %.0fs",
+                               e, self.retry_interval)
+                self.stop_event.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _drain(self, conn) -> Iterable[str]:
+        payloads = []
+        while conn.notifies:
+            payloads.append(conn.notifies.pop(0).payload)
+        with self.lock:
+            self.notifications += len(payloads)
+        return payloads
+
+    def _apply(self, conn, payloads: Iterable[str]):
+        product_ids: Set[str] = set()
+        for payload in payloads:
+            if payload == '*':
+                self._load_all(conn)
+                return
+            product_ids.update(product_id for product_id in payload.split(',') if product_id)
+        if product_ids:
+            self._refresh(conn, product_ids)
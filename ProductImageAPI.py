@@ -0,0 +1,238 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from flask import Blueprint, Response, jsonify, request
+
+from ConnectionPool import ConnectionPool
+from DatabaseManager import StoredImage
+from ImageLoader import detect_content_type
+from ImageProcessing import DERIVATIVE_SIZES
+from ImageStore import ImageStore
+from ProductCatalog import ProductCatalog
+
+# Image URLs are content addressed, so a response for a given hash can never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# A product can be given a new image, so product URLs are revalidated (cheaply, via ETag) after a minute
+PRODUCT_CACHE_CONTROL = 'public, max-age=60'
+RESOLVE_TTL = 60.0
+MAX_RESOLVED = 10000
+IMAGE_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+@dataclass
+class CachedImage:
+    content_type: str
+    image_data: bytes
+
+
+class ImageCache:
+    # LRU of image bytes keyed by content hash and bounded by total size. Images larger than
+    # max_item_bytes are never cached; they are streamed from the database per request.
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_item_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, CachedImage]' = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: str) -> Optional[CachedImage]:
+        with self.lock:
+            image = self.entries.get(image_hash)
+            if image is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(image_hash)
+            self.hits += 1
+            return image
+
+    def put(self, image_hash: str, image: CachedImage):
+        size = len(image.image_data)
+        if size > self.max_item_bytes:
+            return
+        with self.lock:
+            if image_hash in self.entries:
+                self.entries.move_to_end(image_hash)
+                return
+            self.entries[image_hash] = image
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.image_data)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "images": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+def create_image_blueprint(db_pool: ConnectionPool, product_catalog: Optional[ProductCatalog] = None,
+                           cache: Optional[ImageCache] = None, sizes: Iterable[str] = DERIVATIVE_SIZES,
+                           max_resolved: int = MAX_RESOLVED) -> Blueprint:
+    blueprint = Blueprint('product_images', __name__)
+    cache = cache or ImageCache()
+    sizes = frozenset(sizes)
+    # LRU of (product id, size name) -> (image hash, is legacy PRODUCT_IMAGE, expires at)
+    resolved: 'OrderedDict[Tuple[str, Optional[str]], Tuple[str, bool, float]]' = OrderedDict()
+    resolved_lock = threading.Lock()
+
+    def load_legacy(product_id: str) -> Optional[Tuple[str, CachedImage]]:
+        # Products written before TBL_IMAGE existed only have the PRODUCT_IMAGE bytea. Its
+        # hash is the ETag clients see, so the bytes are also copied into TBL_IMAGE: that
+        # keeps /images/<hash> resolving after the LRU evicts them or the server restarts.
+        with db_pool.database_manager() as db_manager:
+            db_manager.cur.execute("SELECT PRODUCT_IMAGE FROM TBL_PRODUCT WHERE PRODUCT_ID = %s", (product_id,))
+            result = db_manager.cur.fetchone()
+            if not result or result[0] is None:
+                return None
+            data = bytes(result[0])
+            image = CachedImage(content_type=detect_content_type(data) or 'application/octet-stream', image_data=data)
+            image_hash = hashlib.sha256(data).hexdigest()
+            store = ImageStore(db_manager)
+            if not store.existing_hashes([image_hash]):
+                store.put(StoredImage(image_hash=image_hash, content_type=image.content_type, image_data=data,
+                                      byte_size=len(data)))
+                db_manager.commit()
+        cache.put(image_hash, image)
+        return image_hash, image
+
+    def resolve(product_id: str, size_name: Optional[str]) -> Optional[Tuple[str, bool]]:
+        key = (product_id, size_name)
+        with resolved_lock:
+            entry = resolved.get(key)
+            if entry is not None:
+                if entry[2] > time.monotonic():
+                    resolved.move_to_end(key)
+                    return entry[0], entry[1]
+                del resolved[key]
+
+        image_hash, legacy = None, False
+        product = product_catalog.get(product_id) if product_catalog and product_catalog.ready.is_set() else None
+        if size_name is None and product is not None and product.image_hash:
+            image_hash = product.image_hash
+        else:
+            with db_pool.database_manager() as db_manager:
+                db_manager.cur.execute("""
+                    SELECT d.IMAGE_HASH, p.IMAGE_HASH
+                    FROM TBL_PRODUCT p
+                    LEFT JOIN TBL_PRODUCT_IMAGE_DERIVATIVE d ON d.PRODUCT_ID = p.PRODUCT_ID AND d.SIZE_NAME = %s
+                    WHERE p.PRODUCT_ID = %s
+                """, (size_name, product_id))
+                result = db_manager.cur.fetchone()
+            if not result:
+                return None
+            # Missing derived sizes fall back to the stored original
+            image_hash = result[0] or result[1]
+            if image_hash is None:
+                loaded = load_legacy(product_id)
+                if loaded is None:
+                    return None
+                image_hash, legacy = loaded[0], True
+            image_hash = image_hash.strip()
+
+        with resolved_lock:
+            resolved[key] = (image_hash, legacy, time.monotonic() + RESOLVE_TTL)
+            resolved.move_to_end(key)
+            while len(resolved) > max_resolved:
+                resolved.popitem(last=False)
+        return image_hash, legacy
+
+    def not_modified(etag: str, cache_control: str) -> Response:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def serve(image_hash: str, cache_control: str, product_id: Optional[str] = None) -> Response:
+        if request.if_none_match.contains_weak(image_hash):
+            return not_modified(image_hash, cache_control)
+
+        image = cache.get(image_hash)
+        if image is None and product_id is not None:
+            loaded = load_legacy(product_id)
+            if loaded is None:
+                return jsonify({"error": "Product image not found"}), 404
+            image_hash, image = loaded
+        if image is not None:
+            content_type, byte_size = image.content_type, len(image.image_data)
+        else:
+            with db_pool.database_manager() as db_manager:
+                store = ImageStore(db_manager)
+                info = store.describe(image_hash)
+                if info is None:
+                    return jsonify({"error": "Image not found"}), 404
+                content_type, byte_size = info.content_type, info.byte_size
+                if byte_size <= cache.max_item_bytes:
+                    image = CachedImage(content_type=content_type,
+                                        image_data=b''.join(store.iter_chunks(image_hash)))
+                    cache.put(image_hash, image)
+
+        start, stop, status = 0, byte_size, 200
+        if_range = request.if_range
+        range_applies = (if_range.etag is None and if_range.date is None) or if_range.etag == image_hash
+        # Multi-range requests are answered with the whole image, which RFC 9110 allows
+        if request.range is not None and range_applies and len(request.range.ranges) == 1:
+            satisfiable = request.range.range_for_length(byte_size)
+            if satisfiable is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f'bytes */{byte_size}'
+                return response
+            start, stop = satisfiable
+            status = 206
+
+        if image is not None:
+            body = image.image_data[start:stop]
+        else:
+            def body():
+                # Too large for the LRU: held on a pooled connection only while it streams
+                with db_pool.database_manager() as db_manager:
+                    yield from ImageStore(db_manager).iter_chunks(image_hash, start, stop)
+            body = body()
+
+        response = Response(body, status=status, mimetype=content_type)
+        response.set_etag(image_hash)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Length'] = str(stop - start)
+        if status == 206:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{byte_size}'
+        return response
+
+    @blueprint.route('/images/<image_hash>', methods=['GET'])
+    def image_by_hash(image_hash):
+        if not IMAGE_HASH_PATTERN.match(image_hash):
+            return jsonify({"error": "Image not found"}), 404
+        return serve(image_hash, IMMUTABLE_CACHE_CONTROL)
+
+    @blueprint.route('/products/<product_id>/image', methods=['GET'])
+    @blueprint.route('/products/<product_id>/image/<size_name>', methods=['GET'])
+    def product_image(product_id, size_name=None):
+        if size_name is not None and size_name not in sizes:
+            return jsonify({"error": f"Unknown image size; expected one of {sorted(sizes)}"}), 400
+        result = resolve(product_id, size_name)
+        if result is None:
+            return jsonify({"error": "Product image not found"}), 404
+        image_hash, legacy = result
+        return serve(image_hash, PRODUCT_CACHE_CONTROL, product_id if legacy else None)
+
+    @blueprint.route('/images/cache/stats', methods=['GET'])
+    def image_cache_stats():
+        return jsonify(cache.stats()), 200
+
+    return blueprint
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import gzip
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from flask import Blueprint, jsonify, request
+
+from ConnectionPool import ConnectionPool
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Smaller bodies are not worth the CPU or the gzip header
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+
+# fields= name -> select expression. Image bytes are only read when asked for: inline
+# TBL_IMAGE data or the legacy PRODUCT_IMAGE, as base64. Large-object images come back
+# null there and are fetched through image_url, like every other client does.
+FIELDS: Dict[str, str] = {
+    "product_id": "p.PRODUCT_ID",
+    "product_name": "p.PRODUCT_NAME",
+    "product_description": "p.PRODUCT_DESCRIPTION",
+    "product_price": "p.PRODUCT_PRICE",
+    "product_type": "p.PRODUCT_TYPE",
+    "inventory_id": "p.INVENTORY_ID",
+    "image_hash": "p.IMAGE_HASH",
+    "image_url": "p.PRODUCT_ID",
+    "standard_weights": """(
+        SELECT json_object_agg(sw.STANDARD_TYPE, swp.STANDARD_WEIGHT)
+        FROM TBL_STANDARD_WEIGHT_PRODUCT swp
+        JOIN TBL_STANDARD_WEIGHT sw ON sw.STANDARD_WEIGHT_ID = swp.STANDARD_WEIGHT_ID
+        WHERE swp.PRODUCT_ID = p.PRODUCT_ID
+    )""",
+    "product_image": """COALESCE(p.PRODUCT_IMAGE, (
+        SELECT i.IMAGE_DATA FROM TBL_IMAGE i WHERE i.IMAGE_HASH = p.IMAGE_HASH
+    ))""",
+}
+DEFAULT_FIELDS = [name for name in FIELDS if name != "product_image"]
+
+
+def encode_cursor(product_id: str) -> str:
+    return base64.urlsafe_b64encode(product_id.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    product_id = base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode()
+    if not product_id:
+        raise ValueError("Empty cursor")
+    return product_id
+
+
+def _json_value(name: str, value):
+    if value is None:
+        return None
+    if name == "image_url":
+        return f"/products/{value}/image"
+    if name == "product_image":
+        return base64.b64encode(bytes(value)).decode()
+    if name == "image_hash":
+        return value.strip()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: float(weight) for key, weight in value.items()}
+    return value
+
+
+def create_product_list_blueprint(db_pool: ConnectionPool) -> Blueprint:
+    # Catalog listing for the UI. Pages are keyset-paginated on PRODUCT_ID: the cursor is
+    # the last id of the previous page, so every page is one index range scan (the primary
+    # key, or IX_PRODUCT_TYPE when filtered) whatever the catalog size or page number.
+    # There is deliberately no total count, which would scan the whole table.
+    blueprint = Blueprint('product_list', __name__)
+
+    @blueprint.route('/products', methods=['GET'])
+    def list_products():
+        fields: List[str] = DEFAULT_FIELDS
+        if request.args.get("fields"):
+            fields = [name.strip() for name in request.args["fields"].split(",") if name.strip()]
+            unknown = [name for name in fields if name not in FIELDS]
+            if unknown or not fields:
+                return jsonify({"error": f"Unknown fields {unknown}", "fields": list(FIELDS)}), 400
+        limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        product_type: Optional[str] = request.args.get("product_type")
+        after: Optional[str] = None
+        if request.args.get("cursor"):
+            try:
+                after = decode_cursor(request.args["cursor"])
+            except (binascii.Error, ValueError):
+                return jsonify({"error": "Invalid cursor"}), 400
+
+        # Built per request rather than with "%s IS NULL OR ..." so the planner always
+        # sees the exact predicate and picks the index range scan
+        conditions, params = [], []
+        if product_type is not None:
+            conditions.append("p.PRODUCT_TYPE = %s")
+            params.append(product_type)
+        if after is not None:
+            conditions.append("p.PRODUCT_ID > %s")
+            params.append(after)
+        # One extra row says whether there is a next page
+        params.append(limit + 1)
+        with db_pool.database_manager() as db_manager:
+            db_manager.cur.execute(f"""
+                SELECT p.PRODUCT_ID, {', '.join(FIELDS[name] for name in fields)}
+                FROM TBL_PRODUCT p
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                ORDER BY p.PRODUCT_ID
+                LIMIT %s
+            """, params)
+            rows = db_manager.cur.fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        products = [{name: _json_value(name, value) for name, value in zip(fields, row[1:])}
+                    for row in rows[:limit]]
+        return jsonify({"products": products, "next_cursor": next_cursor, "limit": limit}), 200
+
+    @blueprint.after_request
+    def compress(response):
+        # Pages of product JSON compress well; only this blueprint's responses are touched
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.accept_encodings or response.mimetype != 'application/json'):
+            return response
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    return blueprint
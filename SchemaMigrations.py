@@ -0,0 +1,328 @@
+import argparse
+import json
+import logging
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key, so two processes starting at once do not apply the same migration
+MIGRATION_LOCK_ID = 7_245_001
+DEFAULT_MIN_ROWS = 10000
+
+
+@dataclass(slots=True)
+class Migration:
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+
+# Every table, column and index this project reads or writes, in the order it appeared.
+# Statements are idempotent (IF NOT EXISTS) so databases set up by the UI or by the
+# older create_* helpers are adopted as they are. Append new versions; never edit old ones.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Catalog and inventory tables", (
+        """
+        CREATE TABLE IF NOT EXISTS TBL_STANDARD_WEIGHT (
+            STANDARD_WEIGHT_ID VARCHAR(36) PRIMARY KEY,
+            STANDARD_TYPE VARCHAR(32) NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS TBL_INVENTORY (
+            INVENTORY_ID VARCHAR(36) PRIMARY KEY,
+            TOTAL_WEIGHT NUMERIC(10, 2),
+            INVENTORY_VALUE NUMERIC(10, 2),
+            INVENTORY_EXPIRATION_DATE TIMESTAMP,
+            LOCATION VARCHAR(255)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS TBL_PRODUCT (
+            PRODUCT_ID VARCHAR(36) PRIMARY KEY,
+            PRODUCT_NAME VARCHAR(255) NOT NULL,
+            PRODUCT_DESCRIPTION TEXT,
+            PRODUCT_PRICE NUMERIC(10, 2),
+            PRODUCT_TYPE VARCHAR(64),
+            PRODUCT_IMAGE BYTEA,
+            INVENTORY_ID VARCHAR(36) REFERENCES TBL_INVENTORY (INVENTORY_ID)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS TBL_STANDARD_WEIGHT_PRODUCT (
+            STANDARD_WEIGHT_PRODUCT_ID VARCHAR(36) PRIMARY KEY,
+            STANDARD_WEIGHT NUMERIC(10, 2) NOT NULL,
+            STANDARD_WEIGHT_ID VARCHAR(36) NOT NULL REFERENCES TBL_STANDARD_WEIGHT (STANDARD_WEIGHT_ID),
+            PRODUCT_ID VARCHAR(36) NOT NULL REFERENCES TBL_PRODUCT (PRODUCT_ID)
+        )
+        """,
+        # DatabaseManager.get_standard_weight expects these two to exist
+        """
+        INSERT INTO TBL_STANDARD_WEIGHT (STANDARD_WEIGHT_ID, STANDARD_TYPE)
+        SELECT gen_random_uuid()::text, t.STANDARD_TYPE
+        FROM (VALUES ('FILLING'), ('SALAD')) AS t (STANDARD_TYPE)
+        WHERE NOT EXISTS (SELECT 1 FROM TBL_STANDARD_WEIGHT sw WHERE sw.STANDARD_TYPE = t.STANDARD_TYPE)
+        """,
+    )),
+    Migration(2, "Content-addressed image store and derivatives", (
+        """
+        CREATE TABLE IF NOT EXISTS TBL_IMAGE (
+            IMAGE_HASH CHAR(64) PRIMARY KEY,
+            CONTENT_TYPE VARCHAR(64) NOT NULL,
+            BYTE_SIZE BIGINT NOT NULL,
+            IMAGE_DATA BYTEA,
+            IMAGE_OID OID
+        )
+        """,
+        # Large images live in pg_largeobject (IMAGE_OID) and are streamed in chunks. Inline
+        # images are already compressed, so EXTERNAL storage lets substring() read slices of
+        # IMAGE_DATA without detoasting the whole value.
+        "ALTER TABLE TBL_IMAGE ADD COLUMN IF NOT EXISTS IMAGE_OID OID",
+        "ALTER TABLE TBL_IMAGE ALTER COLUMN IMAGE_DATA DROP NOT NULL",
+        "ALTER TABLE TBL_IMAGE ALTER COLUMN BYTE_SIZE TYPE BIGINT",
+        "ALTER TABLE TBL_IMAGE ALTER COLUMN IMAGE_DATA SET STORAGE EXTERNAL",
+        "ALTER TABLE TBL_PRODUCT ADD COLUMN IF NOT EXISTS IMAGE_HASH CHAR(64) REFERENCES TBL_IMAGE (IMAGE_HASH)",
+        """
+        CREATE TABLE IF NOT EXISTS TBL_PRODUCT_IMAGE_DERIVATIVE (
+            PRODUCT_ID VARCHAR(36) NOT NULL,
+            SIZE_NAME VARCHAR(32) NOT NULL,
+            WIDTH INTEGER NOT NULL,
+            HEIGHT INTEGER NOT NULL,
+            CONTENT_TYPE VARCHAR(64) NOT NULL,
+            IMAGE_HASH CHAR(64) NOT NULL REFERENCES TBL_IMAGE (IMAGE_HASH),
+            PRIMARY KEY (PRODUCT_ID, SIZE_NAME)
+        )
+        """,
+    )),
+    Migration(3, "Product fingerprints for sync imports", (
+        "ALTER TABLE TBL_PRODUCT ADD COLUMN IF NOT EXISTS FINGERPRINT CHAR(64)",
+    )),
+    Migration(4, "Weighing log", (
+        """
+        CREATE TABLE IF NOT EXISTS TBL_WEIGHING (
+            WEIGHING_ID VARCHAR(36) PRIMARY KEY,
+            SCALE_ID VARCHAR(64) NOT NULL,
+            PRODUCT_ID VARCHAR(36) NOT NULL,
+            WEIGHT NUMERIC(10, 2) NOT NULL,
+            WEIGHED_AT TIMESTAMP NOT NULL
+        )
+        """,
+    )),
+    Migration(5, "Applied inventory depletion batches", (
+        """
+        CREATE TABLE IF NOT EXISTS TBL_INVENTORY_DEPLETION_BATCH (
+            BATCH_ID VARCHAR(36) PRIMARY KEY,
+            APPLIED_AT TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+        """,
+    )),
+    Migration(6, "Indexes for the hot lookups", (
+        "CREATE INDEX IF NOT EXISTS IX_STANDARD_WEIGHT_TYPE ON TBL_STANDARD_WEIGHT (STANDARD_TYPE)",
+        "CREATE INDEX IF NOT EXISTS IX_STANDARD_WEIGHT_PRODUCT_PRODUCT ON TBL_STANDARD_WEIGHT_PRODUCT (PRODUCT_ID)",
+        # (PRODUCT_TYPE, PRODUCT_ID) also serves the ORDER BY PRODUCT_ID of a filtered listing
+        "CREATE INDEX IF NOT EXISTS IX_PRODUCT_TYPE ON TBL_PRODUCT (PRODUCT_TYPE, PRODUCT_ID)",
+        "CREATE INDEX IF NOT EXISTS IX_PRODUCT_INVENTORY ON TBL_PRODUCT (INVENTORY_ID)",
+        "CREATE INDEX IF NOT EXISTS IX_PRODUCT_NAME_TYPE ON TBL_PRODUCT (PRODUCT_NAME, PRODUCT_TYPE)",
+        # Image garbage collection asks whether anything still references a hash
+        "CREATE INDEX IF NOT EXISTS IX_PRODUCT_IMAGE_HASH ON TBL_PRODUCT (IMAGE_HASH)",
+        "CREATE INDEX IF NOT EXISTS IX_PRODUCT_IMAGE_DERIVATIVE_HASH ON TBL_PRODUCT_IMAGE_DERIVATIVE (IMAGE_HASH)",
+        "CREATE INDEX IF NOT EXISTS IX_WEIGHING_PRODUCT_TIME ON TBL_WEIGHING (PRODUCT_ID, WEIGHED_AT)",
+    )),
+]
+
+
+def create_version_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS TBL_SCHEMA_VERSION (
+                VERSION INTEGER PRIMARY KEY,
+                DESCRIPTION VARCHAR(255) NOT NULL,
+                APPLIED_AT TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn) -> List[int]:
+    create_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT VERSION FROM TBL_SCHEMA_VERSION ORDER BY VERSION")
+        versions = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    return versions
+
+
+def migrate(conn, target: Optional[int] = None) -> List[int]:
+    # Applies each missing migration up to target in its own transaction; returns their versions
+    create_version_table(conn)
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                cur.execute("SELECT 1 FROM TBL_SCHEMA_VERSION WHERE VERSION = %s", (migration.version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+                for statement in migration.statements:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO TBL_SCHEMA_VERSION (VERSION, DESCRIPTION) VALUES (%s, %s)",
+                            (migration.version, migration.description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied schema migration %d: %s", migration.version, migration.description)
+        applied.append(migration.version)
+    return applied
+
+
+@dataclass(slots=True)
+class HotQuery:
+    name: str
+    sql: str
+    params: tuple = ()
+
+
+SAMPLE_IDS = ['00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002']
+
+# The lookups DatabaseManager, the catalog and the UI routes run on every request or load.
+# Parameters are placeholders; only the shape of the plan matters.
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery("standard weight by type",
+             "SELECT STANDARD_WEIGHT_ID FROM TBL_STANDARD_WEIGHT WHERE STANDARD_TYPE = %s", ('FILLING',)),
+    HotQuery("standard weights by product", """
+        SELECT swp.PRODUCT_ID, sw.STANDARD_TYPE, swp.STANDARD_WEIGHT
+        FROM TBL_STANDARD_WEIGHT_PRODUCT swp
+        JOIN TBL_STANDARD_WEIGHT sw ON sw.STANDARD_WEIGHT_ID = swp.STANDARD_WEIGHT_ID
+        WHERE swp.PRODUCT_ID = ANY(%s)
+    """, (SAMPLE_IDS,)),
+    HotQuery("product by id",
+             "SELECT PRODUCT_NAME, PRODUCT_PRICE, IMAGE_HASH FROM TBL_PRODUCT WHERE PRODUCT_ID = %s", (SAMPLE_IDS[0],)),
+    HotQuery("products by type", """
+        SELECT PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE, INVENTORY_ID, IMAGE_HASH
+        FROM TBL_PRODUCT
+        WHERE PRODUCT_TYPE = %s
+        ORDER BY PRODUCT_ID
+        LIMIT 50
+    """, ('SAMPLE',)),
+    HotQuery("products page after cursor", """
+        SELECT p.PRODUCT_ID, p.PRODUCT_NAME, p.PRODUCT_PRICE, p.PRODUCT_TYPE
+        FROM TBL_PRODUCT p
+        WHERE p.PRODUCT_ID > %s
+        ORDER BY p.PRODUCT_ID
+        LIMIT 51
+    """, (SAMPLE_IDS[0],)),
+    HotQuery("products by inventory",
+             "SELECT PRODUCT_ID FROM TBL_PRODUCT WHERE INVENTORY_ID = ANY(%s)", (SAMPLE_IDS,)),
+    HotQuery("products by natural key", """
+        SELECT p.PRODUCT_ID, p.INVENTORY_ID, p.FINGERPRINT
+        FROM TBL_PRODUCT p
+        JOIN unnest(%s::text[], %s::text[]) AS k(PRODUCT_NAME, PRODUCT_TYPE)
+          ON p.PRODUCT_NAME = k.PRODUCT_NAME AND p.PRODUCT_TYPE = k.PRODUCT_TYPE
+    """, (['Sample'], ['SAMPLE'])),
+    HotQuery("inventory by id",
+             "SELECT TOTAL_WEIGHT, INVENTORY_VALUE FROM TBL_INVENTORY WHERE INVENTORY_ID = %s", (SAMPLE_IDS[0],)),
+    HotQuery("image by hash",
+             "SELECT CONTENT_TYPE, BYTE_SIZE, IMAGE_OID FROM TBL_IMAGE WHERE IMAGE_HASH = %s", ('0' * 64,)),
+    HotQuery("image derivative by product and size", """
+        SELECT d.IMAGE_HASH FROM TBL_PRODUCT_IMAGE_DERIVATIVE d WHERE d.PRODUCT_ID = %s AND d.SIZE_NAME = %s
+    """, (SAMPLE_IDS[0], 'thumbnail')),
+    HotQuery("products referencing image",
+             "SELECT 1 FROM TBL_PRODUCT WHERE IMAGE_HASH = %s LIMIT 1", ('0' * 64,)),
+    HotQuery("derivatives referencing image",
+             "SELECT 1 FROM TBL_PRODUCT_IMAGE_DERIVATIVE WHERE IMAGE_HASH = %s LIMIT 1", ('0' * 64,)),
+    HotQuery("weighings by product", """
+        SELECT WEIGHT, WEIGHED_AT FROM TBL_WEIGHING WHERE PRODUCT_ID = %s AND WEIGHED_AT >= NOW() - INTERVAL '1 day'
+    """, (SAMPLE_IDS[0],)),
+]
+
+
+@dataclass(slots=True)
+class SeqScanFinding:
+    query: str
+    table: str
+    table_rows: int
+
+
+def _seq_scanned_tables(plan: dict) -> List[str]:
+    tables = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        tables.extend(_seq_scanned_tables(child))
+    return tables
+
+
+def _table_rows(cur, table: str) -> int:
+    # The planner's estimate; tables never vacuumed or analyzed report -1 and are counted
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (table,))
+    estimate = cur.fetchone()[0]
+    if estimate >= 0:
+        return estimate
+    cur.execute(f'SELECT count(*) FROM "{table}"')
+    return cur.fetchone()[0]
+
+
+def check_index_coverage(conn, min_rows: int = DEFAULT_MIN_ROWS,
+                         queries: Optional[List[HotQuery]] = None) -> List[SeqScanFinding]:
+    # EXPLAINs each hot query and reports every sequential scan of a table holding more
+    # than min_rows rows. Small tables are left alone: a seq scan is the right plan there.
+    findings = []
+    with conn.cursor() as cur:
+        for query in queries or HOT_QUERIES:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query.sql, query.params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            for table in _seq_scanned_tables(plan[0]["Plan"]):
+                rows = _table_rows(cur, table)
+                if rows > min_rows:
+                    findings.append(SeqScanFinding(query=query.name, table=table, table_rows=rows))
+    conn.rollback()
+    return findings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate the DeliTelligenceDB schema and check index coverage")
+    parser.add_argument('command', choices=['migrate', 'status', 'check'])
+    parser.add_argument('--target', type=int, default=None, help="migrate up to this version only")
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS,
+                        help="sequential scans of tables larger than this fail the check")
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                            port=args.port)
+    try:
+        if args.command == 'migrate':
+            applied = migrate(conn, args.target)
+            print(f"Applied migrations {applied}" if applied else "Schema is up to date")
+        elif args.command == 'status':
+            applied = set(applied_versions(conn))
+            for migration in MIGRATIONS:
+                print(f"{'applied' if migration.version in applied else 'pending':>8}  "
+                      f"{migration.version:>3}  {migration.description}")
+        else:
+            findings = check_index_coverage(conn, args.min_rows)
+            for finding in findings:
+                print(f"SEQ SCAN  {finding.query}: {finding.table} ({finding.table_rows:,} rows)")
+            print(f"{len(HOT_QUERIES)} hot queries checked, {len(findings)} sequential scans above "
+                  f"{args.min_rows:,} rows")
+            return 1 if findings else 0
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
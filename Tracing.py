@@ -0,0 +1,165 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class _NullSpan:
+    # Shared no-op span handed out while tracing is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record("X", self.name, self.category, self.start, self.args, dur=end - self.start)
+        return False
+
+    def set(self, **args):
+        # Adds arguments learned while the span is open (row counts, byte sizes, ...)
+        self.args.update(args)
+
+
+class Tracer:
+    # Records spans as Chrome trace events (chrome://tracing, ui.perfetto.dev). Off by
+    # default: span() then returns a shared no-op, so instrumented code pays one
+    # attribute check. Events go to a bounded deque, whose append is thread-safe, and
+    # every thread (Flask workers, the BLE event loop, background writers) lands on one
+    # timeline keyed by thread id.
+    def __init__(self, max_events: int = 200000):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+
+    def enable(self, max_events: Optional[int] = None):
+        if max_events is not None and max_events != self.events.maxlen:
+            self.events = deque(self.events, maxlen=max_events)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events.clear()
+        self.origin = time.perf_counter_ns()
+
+    def span(self, name: str, category: str = 'app', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def instant(self, name: str, category: str = 'app', **args):
+        if self.enabled:
+            self._record("i", name, category, time.perf_counter_ns(), args)
+
+    def traced(self, name: Optional[str] = None, category: str = 'app'):
+        # Decorator for plain functions and coroutines; the check happens per call, so
+        # tracing can be switched on and off at runtime
+        def decorate(function):
+            span_name = name or function.__qualname__
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    with Span(self, span_name, category, {}):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, category, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def acquire(self, lock, name: str):
+        # `with tracer.acquire(lock, "operation_lock"):` in place of `with lock:`, recording the wait
+        return _TracedAcquire(self, lock, name)
+
+    def _record(self, phase: str, name: str, category: str, start: int, args: dict, dur: Optional[int] = None):
+        thread = threading.current_thread()
+        if thread.ident not in self.thread_names:
+            self.thread_names[thread.ident] = thread.name
+        event = {"name": name, "cat": category, "ph": phase, "ts": (start - self.origin) / 1000,
+                 "pid": self.pid, "tid": thread.ident}
+        if dur is not None:
+            event["dur"] = dur / 1000
+        if phase == "i":
+            event["s"] = "t"
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def export(self) -> dict:
+        events = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": ident, "args": {"name": thread_name}}
+                  for ident, thread_name in list(self.thread_names.items())]
+        events.extend(list(self.events))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.export(), f, default=str)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "events": len(self.events), "max_events": self.events.maxlen,
+                "threads": len(self.thread_names)}
+
+
+class _TracedAcquire:
+    __slots__ = ('tracer', 'lock', 'name')
+
+    def __init__(self, tracer: Tracer, lock, name: str):
+        self.tracer = tracer
+        self.lock = lock
+        self.name = name
+
+    def __enter__(self):
+        with self.tracer.span(f"wait {self.name}", 'lock'):
+            self.lock.acquire()
+        return self.lock
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        return False
+
+
+# Process-wide tracer; DELI_TRACE=1 switches it on at startup
+tracer = Tracer()
+if os.environ.get('DELI_TRACE') == '1':
+    tracer.enable()
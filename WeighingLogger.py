@@ -0,0 +1,273 @@
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import psycopg2
+
+from SchemaMigrations import migrate
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WeighingEvent:
+    weighing_id: str
+    scale_id: str
+    product_id: str
+    weight: float
+    weighed_at: datetime
+
+
+class WeighingLogger:
+    # Write-behind logger: request threads only enqueue, a single background thread
+    # batches events and COPYs them into TBL_WEIGHING. Batches that cannot reach the
+    # database are appended to a local JSON Lines spill file and replayed later.
+    def __init__(self, dbname, user, password, host, port, batch_size=500, flush_interval=1.0,
+                 max_queue_size=100000, spill_path='weighings_spill.jsonl', retry_interval=5.0):
+        self.connect_kwargs = dict(dbname=dbname, user=user, password=password, host=host, port=port)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.conn = None
+        self.next_connect_attempt = 0.0
+        self.next_replay_attempt = 0.0
+        self.spill_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.flushed_events = 0
+        self.spilled_events = 0
+        self.replayed_events = 0
+        self.lost_events = 0
+        self.flush_count = 0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def create_table(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def log(self, scale_id: str, product_id: str, weight: float, weighed_at: Optional[datetime] = None) -> WeighingEvent:
+        event = WeighingEvent(
+            weighing_id=str(uuid.uuid4()),
+            scale_id=scale_id,
+            product_id=product_id,
+            weight=weight,
+            weighed_at=weighed_at or datetime.now()
+        )
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Never block the caller; an overflowing queue goes straight to disk
+            logger.warning("Weighing queue full, spilling event to disk")
+            self._spill([event])
+        return event
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "flushed_events": self.flushed_events,
+                "spilled_events": self.spilled_events,
+                "replayed_events": self.replayed_events,
+                "lost_events": self.lost_events,
+                "flush_count": self.flush_count,
+                "last_flush_latency_ms": None if self.last_flush_latency is None else self.last_flush_latency * 1000,
+                "avg_flush_latency_ms": (self.total_flush_latency / self.flush_count * 1000) if self.flush_count else None,
+                "max_flush_latency_ms": self.max_flush_latency * 1000,
+                "spill_pending": self._spill_pending(),
+            }
+
+    def _spill_pending(self) -> bool:
+        return os.path.exists(self.spill_path) or os.path.exists(self.spill_path + '.replaying')
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            # Replayed on a timer rather than only when idle, or steady traffic would keep
+            # spilled weighings out of TBL_WEIGHING indefinitely
+            if self._spill_pending() and time.monotonic() >= self.next_replay_attempt:
+                self.next_replay_attempt = time.monotonic() + self.retry_interval
+                self._replay_spill()
+        # Drain whatever is left so a clean shutdown loses nothing
+        while True:
+            batch = self._collect_batch(block=False)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _collect_batch(self, block=True) -> List[WeighingEvent]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if block and remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _get_connection(self):
+        if self.conn is not None and not self.conn.closed:
+            return self.conn
+        if time.monotonic() < self.next_connect_attempt:
+            return None
+        try:
+            self.conn = psycopg2.connect(**self.connect_kwargs)
+        except psycopg2.Error as e:
+            logger.error(f"Weighing logger cannot reach the database: {e}")
+            self.conn = None
+            self.next_connect_attempt = time.monotonic() + self.retry_interval
+        return self.conn
+
+    def _copy_rows(self, conn, rows: List[WeighingEvent], skip_existing=False):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for event in rows:
+            writer.writerow((event.weighing_id, event.scale_id, event.product_id, event.weight,
+                             event.weighed_at.isoformat()))
+        buffer.seek(0)
+        with conn.cursor() as cur:
+            if skip_existing:
+                # Replayed rows may already have been committed by an earlier attempt
+                cur.execute("CREATE TEMP TABLE IF NOT EXISTS TMP_WEIGHING (LIKE TBL_WEIGHING) ON COMMIT DELETE ROWS")
+                cur.copy_expert(
+                    "COPY TMP_WEIGHING (WEIGHING_ID, SCALE_ID, PRODUCT_ID, WEIGHT, WEIGHED_AT) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cur.execute("INSERT INTO TBL_WEIGHING SELECT * FROM TMP_WEIGHING ON CONFLICT (WEIGHING_ID) DO NOTHING")
+            else:
+                cur.copy_expert(
+                    "COPY TBL_WEIGHING (WEIGHING_ID, SCALE_ID, PRODUCT_ID, WEIGHT, WEIGHED_AT) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+        conn.commit()
+
+    def _flush(self, batch: List[WeighingEvent]):
+        conn = self._get_connection()
+        if conn is None:
+            self._spill(batch)
+            return
+        start = time.perf_counter()
+        try:
+            self._copy_rows(conn, batch)
+        except psycopg2.Error as e:
+            logger.error(f"Error flushing {len(batch)} weighings: {e}")
+            self._drop_connection()
+            self._spill(batch)
+            return
+        latency = time.perf_counter() - start
+        with self.stats_lock:
+            self.flushed_events += len(batch)
+            self.flush_count += 1
+            self.last_flush_latency = latency
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def _drop_connection(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+        self.conn = None
+        self.next_connect_attempt = time.monotonic() + self.retry_interval
+
+    def _spill(self, batch: List[WeighingEvent]):
+        try:
+            with self.spill_lock:
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for event in batch:
+                        f.write(json.dumps({
+                            "weighing_id": event.weighing_id,
+                            "scale_id": event.scale_id,
+                            "product_id": event.product_id,
+                            "weight": event.weight,
+                            "weighed_at": event.weighed_at.isoformat(),
+                        }) + "\n")
+        except OSError as e:
+            # A full disk or a permissions problem must not take down the writer thread
+            # (or the request that overflowed the queue); the batch is lost, loudly
+            logger.error(f"Cannot spill {len(batch)} weighings to {self.spill_path}, dropping them: {e}")
+            with self.stats_lock:
+                self.lost_events += len(batch)
+            return
+        with self.stats_lock:
+            self.spilled_events += len(batch)
+
+    def _replay_spill(self):
+        conn = self._get_connection()
+        if conn is None:
+            return
+        replay_path = self.spill_path + '.replaying'
+        try:
+            with self.spill_lock:
+                if not os.path.exists(replay_path):
+                    os.replace(self.spill_path, replay_path)
+            batch = []
+            with open(replay_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        record["weight"] = float(record["weight"])
+                        record["weighed_at"] = datetime.fromisoformat(record["weighed_at"])
+                        event = WeighingEvent(**record)
+                    except (ValueError, TypeError, KeyError):
+                        # A torn line from a crash mid-write, or a row COPY would reject;
+                        # replaying it would fail every batch spilled alongside it
+                        logger.warning("Skipping unreadable spilled weighing in %s", replay_path)
+                        continue
+                    batch.append(event)
+                    if len(batch) >= self.batch_size:
+                        self._copy_rows(conn, batch, skip_existing=True)
+                        self._count_replayed(len(batch))
+                        batch = []
+            if batch:
+                self._copy_rows(conn, batch, skip_existing=True)
+                self._count_replayed(len(batch))
+            os.remove(replay_path)
+        except psycopg2.Error as e:
+            logger.error(f"Error replaying spilled weighings: {e}")
+            self._drop_connection()
+        except OSError as e:
+            # Left in place and retried on the next replay; rows already copied are skipped then
+            logger.error(f"Error replaying spilled weighings from {replay_path}: {e}")
+
+    def _count_replayed(self, count):
+        with self.stats_lock:
+            self.replayed_events += count
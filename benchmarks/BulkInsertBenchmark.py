@@ -0,0 +1,96 @@
+# Compares the row-at-a-time insert path used by ImageInjector_2.0.py against
+# DatabaseManager.bulk_insert on a local PostgreSQL.
+#
+#   python -m benchmarks.BulkInsertBenchmark --products 5000 --image-bytes 20000
+
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from DatabaseManager import DatabaseManager, Inventory, Product, StandardWeightProduct
+
+
+def build_rows(count: int, image_bytes: int, filling_standard_weight_id: str):
+    inventories, products, standard_weight_products = [], [], []
+    image = os.urandom(image_bytes)
+    for i in range(count):
+        inventory_id = str(uuid.uuid4())
+        product_id = str(uuid.uuid4())
+        inventories.append(Inventory(
+            inventory_id=inventory_id,
+            total_weight=1000.0,
+            inventory_value=4000.0,
+            inventory_expiration_date=datetime.now() + timedelta(days=90),
+            location='Benchmark'
+        ))
+        products.append(Product(
+            product_id=product_id,
+            product_name=f'Benchmark Product {i}',
+            product_description='Benchmark row',
+            product_price=1.00,
+            product_type='HOT_FOOD',
+            product_image=image,
+            inventory_id=inventory_id
+        ))
+        standard_weight_products.append(StandardWeightProduct(
+            standard_weight_product_id=str(uuid.uuid4()),
+            standard_weight=100.0,
+            standard_weight_id=filling_standard_weight_id,
+            product_id=product_id
+        ))
+    return inventories, products, standard_weight_products
+
+
+def load_row_by_row(db_manager: DatabaseManager, inventories, products, standard_weight_products):
+    for inventory, product, standard_weight_product in zip(inventories, products, standard_weight_products):
+        db_manager.insert_inventory(inventory)
+        db_manager.get_filling_standard_weight()
+        db_manager.insert_product(product, standard_weight_product)
+        db_manager.commit()
+
+
+def load_bulk(db_manager: DatabaseManager, inventories, products, standard_weight_products):
+    db_manager.bulk_insert(inventories, products, standard_weight_products)
+
+
+def cleanup(db_manager: DatabaseManager, inventories, products):
+    product_ids = [product.product_id for product in products]
+    inventory_ids = [inventory.inventory_id for inventory in inventories]
+    db_manager.cur.execute("DELETE FROM TBL_STANDARD_WEIGHT_PRODUCT WHERE PRODUCT_ID = ANY(%s)", (product_ids,))
+    db_manager.cur.execute("DELETE FROM TBL_PRODUCT WHERE PRODUCT_ID = ANY(%s)", (product_ids,))
+    db_manager.cur.execute("DELETE FROM TBL_INVENTORY WHERE INVENTORY_ID = ANY(%s)", (inventory_ids,))
+    db_manager.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row-by-row vs bulk catalog insert benchmark")
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--image-bytes', type=int, default=20000)
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                                 port=args.port)
+    try:
+        filling_standard_weight_id = db_manager.get_filling_standard_weight().standard_weight_id
+        for name, loader in (('row-by-row', load_row_by_row), ('bulk', load_bulk)):
+            rows = build_rows(args.products, args.image_bytes, filling_standard_weight_id)
+            start = time.perf_counter()
+            loader(db_manager, *rows)
+            elapsed = time.perf_counter() - start
+            cleanup(db_manager, rows[0], rows[1])
+            total_rows = sum(len(r) for r in rows)
+            print(f"{name:>10}: {args.products} products, {total_rows} rows in {elapsed:.2f}s "
+                  f"({total_rows / elapsed:,.0f} rows/sec)")
+    finally:
+        db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
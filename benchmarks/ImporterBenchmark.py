@@ -0,0 +1,149 @@
+# Runs each catalog loading strategy against the same synthetic catalog on a local
+# PostgreSQL and reports rows/sec, MB/sec of images and peak RSS. Every strategy runs
+# in a fresh process, so its peak RSS is not inflated by the ones before it.
+#
+#   python -m benchmarks.ImporterBenchmark --products 20000 --image-bytes 50000 --strategies row-by-row batched parallel
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmarks.SyntheticCatalog import IMAGE_FORMATS, SYNTHETIC_LOCATION, delete_catalog, generate_catalog
+from CatalogImport import ImportStats, import_manifest, import_manifest_parallel, read_manifest
+from ConnectionPool import ConnectionPool
+from DatabaseManager import Inventory, Product, ProductImage, StandardWeightProduct
+
+STRATEGIES = ['row-by-row', 'batched', 'prefetch', 'parallel', 'sync']
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 / 1024 if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def load_row_by_row(pool: ConnectionPool, manifest: str) -> ImportStats:
+    # What ImageInjector_2.0.insert_product_with_inventory does: one product, its inventory
+    # and standard weights per transaction, with the image inline in PRODUCT_IMAGE
+    stats = ImportStats(started=time.perf_counter())
+    with pool.database_manager() as db_manager:
+        filling_standard_weight_id = db_manager.get_filling_standard_weight().standard_weight_id
+        salad_standard_weight_id = db_manager.get_standard_weight("SALAD").standard_weight_id
+        for row in read_manifest(manifest, stats):
+            product_id = str(uuid.uuid4())
+            inventory_id = str(uuid.uuid4())
+            db_manager.insert_inventory(Inventory(inventory_id=inventory_id, total_weight=row.inventory_total_weight,
+                                                  inventory_value=row.inventory_value,
+                                                  inventory_expiration_date=row.inventory_expiration_date,
+                                                  location=row.inventory_location))
+            standard_weight_product = None
+            if row.standard_weight is not None:
+                standard_weight_product = StandardWeightProduct(
+                    standard_weight_product_id=str(uuid.uuid4()), standard_weight=row.standard_weight,
+                    standard_weight_id=filling_standard_weight_id, product_id=product_id)
+            db_manager.insert_product(Product(product_id=product_id, product_name=row.product_name,
+                                              product_description=row.product_description,
+                                              product_price=row.product_price, product_type=row.product_type,
+                                              product_image=ProductImage.from_path(row.image_path),
+                                              inventory_id=inventory_id),
+                                      standard_weight_product)
+            stats.rows += 2 + (standard_weight_product is not None)
+            if row.salad_weight is not None:
+                db_manager.cur.execute("""
+                    INSERT INTO TBL_STANDARD_WEIGHT_PRODUCT (STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT, STANDARD_WEIGHT_ID, PRODUCT_ID)
+                    VALUES (%s, %s, %s, %s)
+                """, (str(uuid.uuid4()), row.salad_weight, salad_standard_weight_id, product_id))
+                stats.rows += 1
+            db_manager.commit()
+            stats.products += 1
+            stats.image_bytes += os.path.getsize(row.image_path)
+    return stats
+
+
+def run_strategy(strategy: str, manifest: str, connect_kwargs: dict, batch_size: int, workers: int) -> dict:
+    pool = ConnectionPool(**connect_kwargs, min_size=1, max_size=max(workers, 1))
+    try:
+        with pool.database_manager() as db_manager:
+            db_manager.create_image_store_tables()
+            db_manager.create_sync_columns()
+        with pool.connection() as conn:
+            delete_catalog(conn)
+
+        start = time.perf_counter()
+        if strategy == 'row-by-row':
+            stats = load_row_by_row(pool, manifest)
+        elif strategy == 'parallel':
+            stats = import_manifest_parallel(pool, manifest, workers=workers, batch_size=batch_size,
+                                             progress_every=float('inf'))
+        else:
+            with pool.database_manager() as db_manager:
+                stats = import_manifest(db_manager, manifest, batch_size=batch_size,
+                                        readers=4 if strategy == 'prefetch' else 0, sync=strategy == 'sync',
+                                        progress_every=float('inf'))
+        elapsed = time.perf_counter() - start
+
+        with pool.connection() as conn:
+            delete_catalog(conn)
+    finally:
+        pool.close()
+    return {
+        "strategy": strategy,
+        "products": stats.products,
+        "rows": stats.rows,
+        "seconds": elapsed,
+        "rows_per_sec": stats.rows / elapsed,
+        "mb_per_sec": stats.image_bytes / 1_000_000 / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "failed_batches": stats.failed_batches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog loading strategy benchmark")
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--image-bytes', type=int, default=20000)
+    parser.add_argument('--image-format', choices=list(IMAGE_FORMATS) + ['mixed'], default='mixed')
+    parser.add_argument('--duplicate-images', type=float, default=0.1)
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4, help="connections for the parallel strategy")
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args()
+    connect_kwargs = dict(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                          port=args.port)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = generate_catalog(directory, args.products, args.image_bytes, args.image_format,
+                                    args.duplicate_images, location=SYNTHETIC_LOCATION)
+        context = multiprocessing.get_context('spawn')
+        for strategy in args.strategies:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(run_strategy, strategy, manifest, connect_kwargs,
+                                               args.batch_size, args.workers).result())
+
+    print(f"{args.products} products, {args.image_bytes}-byte {args.image_format} images, "
+          f"{args.duplicate_images:.0%} duplicated")
+    print(f"{'strategy':>12} {'rows':>9} {'seconds':>8} {'rows/sec':>10} {'MB/sec':>8} {'peak RSS MB':>12} {'failed':>7}")
+    for result in results:
+        print(f"{result['strategy']:>12} {result['rows']:>9} {result['seconds']:>8.2f} {result['rows_per_sec']:>10,.0f} "
+              f"{result['mb_per_sec']:>8.1f} {result['peak_rss_mb']:>12.1f} {result['failed_batches']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Times InventoryAnalytics on synthetic inventory: loading the columns, computing the
+# whole dashboard, and applying incremental updates, against a plain Python loop over
+# the same rows. No database is needed.
+#
+#   python -m benchmarks.InventoryAnalyticsBenchmark --rows 1000000
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.SyntheticCatalog import load_templates
+from InventoryAnalytics import EPOCH, InventoryAnalytics
+
+LOCATIONS = ['Warehouse A', 'Warehouse B', 'Deli Counter', 'Hot Counter', 'Cold Room', 'Freezer']
+
+
+def build_rows(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    templates = load_templates()
+    now = (datetime.now() - EPOCH).total_seconds()
+    rows = []
+    for i in range(count):
+        template = rng.choice(templates)
+        total_weight = rng.uniform(200, 5000)
+        price = float(template['product_price'])
+        standard_weight = float(template['standard_weight'])
+        rows.append((f'inventory-{i}', rng.choice(LOCATIONS), template['product_type'], total_weight,
+                     total_weight / standard_weight * price * rng.uniform(0.8, 1.2),
+                     now + rng.uniform(-5, 180) * 86400, price, standard_weight))
+    return rows
+
+
+def python_dashboard(rows, expiring_within_days: float, now: datetime) -> dict:
+    # The same core figures computed row by row, as a baseline
+    now = (now - EPOCH).total_seconds()
+    cutoff = now + expiring_within_days * 86400
+    value_by_type = defaultdict(float)
+    value_by_location = defaultdict(float)
+    value_by_type_location = defaultdict(float)
+    weight_by_location = defaultdict(float)
+    expiring_value = 0.0
+    for _, location, product_type, weight, value, expiration, price, standard_weight in rows:
+        value_by_type[product_type] += value
+        value_by_location[location] += value
+        value_by_type_location[(product_type, location)] += value
+        weight_by_location[location] += weight
+        if expiration is not None and now <= expiration <= cutoff:
+            expiring_value += value
+    return {"value_by_product_type": value_by_type, "expiring_value": expiring_value}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized inventory analytics benchmark")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--updates', type=int, default=1000, help="rows changed per incremental refresh")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows, build_time = timed(build_rows, args.rows)
+    print(f"built {args.rows:,} synthetic inventory rows in {build_time:.1f}s")
+
+    analytics = InventoryAnalytics(capacity=args.rows)
+    _, load_time = timed(analytics.upsert, rows)
+    print(f"load into columns:        {load_time * 1000:9.1f} ms")
+
+    now = datetime.now()
+    dashboard_times = [timed(analytics.dashboard, 3.0, now)[1] for _ in range(args.repeat)]
+    print(f"full dashboard:           {min(dashboard_times) * 1000:9.1f} ms (best of {args.repeat})")
+    _, python_time = timed(python_dashboard, rows, 3.0, now)
+    print(f"python loop (5 figures):  {python_time * 1000:9.1f} ms")
+
+    rng = random.Random(1)
+    changed = [rows[rng.randrange(len(rows))] for _ in range(args.updates)]
+    changed = [(row[0], row[1], row[2], row[3] * 0.9, row[4] * 0.9, row[5], row[6], row[7]) for row in changed]
+    _, update_time = timed(analytics.upsert, changed)
+    removed = [row[0] for row in changed[:args.updates // 10]]
+    _, remove_time = timed(analytics.remove, removed)
+    print(f"update {args.updates:,} rows:        {update_time * 1000:9.2f} ms")
+    print(f"remove {len(removed):,} rows:          {remove_time * 1000:9.2f} ms")
+    print(f"dashboard after updates:  {timed(analytics.dashboard, 3.0, now)[1] * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Latency of the lookups and writes a counter tablet makes against the embedded SQLite
+# backend (SQLiteDatabaseManager), including the outbox triggers LocalSync drains. No
+# database server is needed; the file is created in a temporary directory.
+#
+#   python -m benchmarks.LocalStoreBenchmark --products 10000 --operations 2000
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from DatabaseManager import Inventory, Product, StandardWeightProduct
+from LocalDatabase import SQLiteDatabaseManager
+
+
+def seed(db: SQLiteDatabaseManager, count: int) -> list:
+    db.cur.execute("INSERT INTO TBL_STANDARD_WEIGHT (STANDARD_WEIGHT_ID, STANDARD_TYPE) VALUES (%s, %s), (%s, %s)",
+                   (str(uuid.uuid4()), 'FILLING', str(uuid.uuid4()), 'SALAD'))
+    filling = db.get_standard_weight('FILLING')
+    expiration_date = datetime.now() + timedelta(days=30)
+    inventories, products, weights = [], [], []
+    for i in range(count):
+        inventory_id, product_id = str(uuid.uuid4()), str(uuid.uuid4())
+        inventories.append(Inventory(inventory_id=inventory_id, total_weight=1000.0, inventory_value=4000.0,
+                                     inventory_expiration_date=expiration_date, location='Benchmark'))
+        products.append(Product(product_id=product_id, product_name=f'Product {i}', product_description='Benchmark row',
+                                product_price=1.00, product_type=f'TYPE_{i % 20}', product_image=None,
+                                inventory_id=inventory_id))
+        weights.append(StandardWeightProduct(standard_weight_product_id=str(uuid.uuid4()), standard_weight=100.0,
+                                             standard_weight_id=filling.standard_weight_id, product_id=product_id))
+    db.bulk_insert(inventories, products, weights)
+    return [product.product_id for product in products]
+
+
+def timed(operation, repeats: int) -> list:
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies.sort()
+    print(f"  {name:<32} p50 {statistics.median(latencies):7.3f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SQLite backend read and write latency")
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteDatabaseManager(os.path.join(directory, 'local.sqlite'))
+        product_ids = seed(db, args.products)
+        print(f"{args.products} products, {db.pending_changes()} outbox entries after seeding")
+
+        def product_by_id(i):
+            db.cur.execute("SELECT PRODUCT_NAME, PRODUCT_PRICE, IMAGE_HASH FROM TBL_PRODUCT WHERE PRODUCT_ID = %s",
+                           (product_ids[i % len(product_ids)],))
+            db.cur.fetchone()
+
+        def standard_weights(i):
+            db.cur.execute("""
+                SELECT swp.PRODUCT_ID, sw.STANDARD_TYPE, swp.STANDARD_WEIGHT
+                FROM TBL_STANDARD_WEIGHT_PRODUCT swp
+                JOIN TBL_STANDARD_WEIGHT sw ON sw.STANDARD_WEIGHT_ID = swp.STANDARD_WEIGHT_ID
+                WHERE swp.PRODUCT_ID = ANY(%s)
+            """, (product_ids[i % len(product_ids):i % len(product_ids) + 5],))
+            db.cur.fetchall()
+
+        def weighing(i):
+            db.cur.execute("""
+                INSERT INTO TBL_WEIGHING (WEIGHING_ID, SCALE_ID, PRODUCT_ID, WEIGHT, WEIGHED_AT)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (str(uuid.uuid4()), 'benchmark', product_ids[i % len(product_ids)], 100.0, datetime.now()))
+            db.commit()
+
+        def price_change(i):
+            db.cur.execute("UPDATE TBL_PRODUCT SET PRODUCT_PRICE = %s WHERE PRODUCT_ID = %s",
+                           (1.0 + i / 100, product_ids[i % len(product_ids)]))
+            db.commit()
+
+        report("product by id", timed(product_by_id, args.operations))
+        report("standard weights of 5 products", timed(standard_weights, args.operations))
+        report("log weighing (commit)", timed(weighing, args.operations))
+        report("update product (commit)", timed(price_change, args.operations))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Compares the memory held by a list of loaded products with the original models
+# (dict-backed dataclasses with the image bytes inline) against the slotted models
+# with lazy ProductImage handles. No database server is needed, but psycopg2 must be
+# installed since the models are imported from DatabaseManager.
+#
+#   python -m benchmarks.ProductMemoryBenchmark --products 100000 --image-bytes 2000
+
+import argparse
+import gc
+import os
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from DatabaseManager import Inventory, Product, ProductImage, StandardWeightProduct
+
+
+# The models as they were before slots and lazy images
+@dataclass
+class DictProduct:
+    product_id: str
+    product_name: str
+    product_description: str
+    product_price: float
+    product_type: str
+    product_image: bytes
+    inventory_id: Optional[str] = None
+    standard_weight_products: List['DictStandardWeightProduct'] = None
+
+
+@dataclass
+class DictStandardWeightProduct:
+    standard_weight_product_id: str
+    standard_weight: float
+    standard_weight_id: str
+    product_id: str
+
+
+@dataclass
+class DictInventory:
+    inventory_id: str
+    total_weight: float
+    inventory_value: float
+    inventory_expiration_date: datetime
+    location: str
+    products: List[DictProduct] = None
+
+
+def build(count: int, image_bytes: int, slotted: bool):
+    product_cls, weight_cls, inventory_cls = ((Product, StandardWeightProduct, Inventory) if slotted else
+                                              (DictProduct, DictStandardWeightProduct, DictInventory))
+    filling_standard_weight_id = str(uuid.uuid4())
+    expiration_date = datetime.now() + timedelta(days=30)
+    inventories = []
+    for i in range(count):
+        product_id = str(uuid.uuid4())
+        inventory_id = str(uuid.uuid4())
+        if slotted:
+            image = ProductImage.from_path(f'catalog/images/{i}.jpg')
+        else:
+            image = os.urandom(image_bytes)
+        product = product_cls(product_id=product_id, product_name=f'Product {i}', product_description='Benchmark row',
+                              product_price=1.00, product_type='HOT_FOOD', product_image=image,
+                              inventory_id=inventory_id)
+        product.standard_weight_products = [weight_cls(standard_weight_product_id=str(uuid.uuid4()),
+                                                       standard_weight=100.0,
+                                                       standard_weight_id=filling_standard_weight_id,
+                                                       product_id=product_id)]
+        inventories.append(inventory_cls(inventory_id=inventory_id, total_weight=1000.0, inventory_value=4000.0,
+                                         inventory_expiration_date=expiration_date, location='Benchmark',
+                                         products=[product]))
+    return inventories
+
+
+def measure(count: int, image_bytes: int, slotted: bool) -> int:
+    gc.collect()
+    tracemalloc.start()
+    inventories = build(count, image_bytes, slotted)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del inventories
+    return held
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory footprint of loaded products, before and after")
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--image-bytes', type=int, default=2000)
+    args = parser.parse_args()
+
+    before = measure(args.products, args.image_bytes, slotted=False)
+    after = measure(args.products, args.image_bytes, slotted=True)
+    images = args.products * args.image_bytes
+    print(f"{args.products} products with {args.image_bytes}-byte images")
+    print(f"  dict dataclasses, inline images: {before / 1024 / 1024:8.1f} MB "
+          f"({(before - images) / args.products:,.0f} bytes/product excluding image bytes)")
+    print(f"  slotted dataclasses, lazy images: {after / 1024 / 1024:7.1f} MB "
+          f"({after / args.products:,.0f} bytes/product)")
+    print(f"  {before / after:.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Measures how CatalogImport.import_manifest_parallel scales with the number of
+# database connections on a local PostgreSQL.
+#
+#   python -m benchmarks.ShardedLoadBenchmark --products 20000 --workers 1 2 4 8
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.SyntheticCatalog import delete_catalog, generate_catalog
+from CatalogImport import import_manifest_parallel
+from ConnectionPool import ConnectionPool
+
+BENCHMARK_LOCATION = 'Sharded Benchmark'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel sharded catalog load benchmark")
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--image-bytes', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--dbname', default='DeliTelligenceDB')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='lemon')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = generate_catalog(directory, args.products, args.image_bytes, location=BENCHMARK_LOCATION)
+        results = []
+        for workers in args.workers:
+            pool = ConnectionPool(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                                  port=args.port, min_size=workers, max_size=workers)
+            try:
+                with pool.database_manager() as db_manager:
+                    db_manager.create_image_store_tables()
+                with pool.connection() as conn:
+                    delete_catalog(conn, BENCHMARK_LOCATION)
+                start = time.perf_counter()
+                stats = import_manifest_parallel(pool, manifest, workers=workers, batch_size=args.batch_size,
+                                                 progress_every=float('inf'))
+                elapsed = time.perf_counter() - start
+                with pool.connection() as conn:
+                    delete_catalog(conn, BENCHMARK_LOCATION)
+            finally:
+                pool.close()
+            results.append((workers, stats.products / elapsed, stats.failed_batches))
+
+    baseline = results[0][1]
+    print(f"{'workers':>8} {'products/sec':>14} {'speedup':>8} {'failed':>7}")
+    for workers, rate, failed in results:
+        print(f"{workers:>8} {rate:>14,.0f} {rate / baseline:>7.2f}x {failed:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Generates synthetic product catalogs for the loader benchmarks: a CatalogImport
+# manifest plus one image file per product, modelled on the products in
+# catalog/products.csv (their types, prices, FILLING and SALAD standard weights).
+#
+#   python -m benchmarks.SyntheticCatalog /tmp/catalog --products 100000 --image-bytes 50000 --image-format mixed
+
+import argparse
+import csv
+import io
+import os
+import random
+from typing import List, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SYNTHETIC_LOCATION = 'Synthetic Catalog'
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'catalog', 'products.csv')
+MANIFEST_COLUMNS = ['product_name', 'standard_weight', 'product_description', 'product_price', 'product_type',
+                    'image_path', 'inventory_location', 'inventory_total_weight', 'inventory_value',
+                    'expiration_days', 'salad_weight']
+IMAGE_FORMATS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'webp': '.webp',
+    'gif': '.gif',
+}
+# Rough encoded bytes per pixel of random noise, used to size decodable images
+NOISE_BYTES_PER_PIXEL = {'jpeg': 1.2, 'png': 3.0, 'webp': 1.0, 'gif': 1.0}
+
+
+def _signature(image_format: str, size: int) -> bytes:
+    if image_format == 'jpeg':
+        return b'\xff\xd8\xff'
+    if image_format == 'png':
+        return b'\x89PNG\r\n\x1a\n'
+    if image_format == 'webp':
+        return b'RIFF' + (size - 8).to_bytes(4, 'little') + b'WEBP'
+    return b'GIF89a'
+
+
+def make_image(image_format: str, image_bytes: int, rng: random.Random, decodable: bool = False) -> bytes:
+    # By default only the format signature is real and the rest is random, which is all the
+    # loader sniffs. decodable=True encodes random noise with Pillow so derivatives can be built.
+    if not decodable:
+        header = _signature(image_format, image_bytes)
+        return header + rng.randbytes(max(image_bytes - len(header), 0))
+    if Image is None:
+        raise ImportError("Pillow is required for decodable synthetic images (pip install pillow)")
+    side = max(int((image_bytes / NOISE_BYTES_PER_PIXEL[image_format]) ** 0.5), 1)
+    image = Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3))
+    if image_format == 'gif':
+        image = image.convert('P')
+    output = io.BytesIO()
+    image.save(output, format=image_format.upper())
+    return output.getvalue()
+
+
+def load_templates(path: str = TEMPLATES_PATH) -> List[dict]:
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def generate_catalog(directory: str, products: int, image_bytes: int = 20000, image_format: str = 'jpeg',
+                     duplicate_images: float = 0.0, decodable: bool = False, location: str = SYNTHETIC_LOCATION,
+                     seed: Optional[int] = 0, manifest_name: str = 'manifest.csv') -> str:
+    # image_format is one of IMAGE_FORMATS or 'mixed'; duplicate_images is the fraction of
+    # products that reuse an earlier product's image file, to exercise deduplication
+    rng = random.Random(seed)
+    templates = load_templates()
+    formats = list(IMAGE_FORMATS) if image_format == 'mixed' else [image_format]
+    image_dir = os.path.join(directory, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    image_names: List[str] = []
+
+    path = os.path.join(directory, manifest_name)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_COLUMNS)
+        for i in range(products):
+            template = rng.choice(templates)
+            if image_names and rng.random() < duplicate_images:
+                image_name = rng.choice(image_names)
+            else:
+                chosen_format = formats[i % len(formats)]
+                image_name = os.path.join('images', f'{i}{IMAGE_FORMATS[chosen_format]}')
+                with open(os.path.join(directory, image_name), 'wb') as image:
+                    image.write(make_image(chosen_format, image_bytes, rng, decodable))
+                image_names.append(image_name)
+
+            standard_weight = round(float(template['standard_weight']) * rng.uniform(0.9, 1.1), 1)
+            salad_weight = (round(float(template['salad_weight']) * rng.uniform(0.9, 1.1), 1)
+                            if template['salad_weight'] else '')
+            price = round(float(template['product_price']) * rng.uniform(0.8, 1.25), 2)
+            total_weight = round(rng.uniform(200, 5000), 1)
+            writer.writerow([f"{template['product_name']} {i}", standard_weight, template['product_description'],
+                             price, template['product_type'], image_name, location, total_weight,
+                             round(total_weight / standard_weight * price, 2), rng.randint(0, 180), salad_weight])
+    return path
+
+
+def delete_catalog(conn, location: str = SYNTHETIC_LOCATION):
+    # Removes every product loaded into `location`, with its rows and no longer referenced images
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE SYNTHETIC_PRODUCTS ON COMMIT DROP AS
+            SELECT p.PRODUCT_ID, p.INVENTORY_ID, p.IMAGE_HASH
+            FROM TBL_PRODUCT p JOIN TBL_INVENTORY i ON i.INVENTORY_ID = p.INVENTORY_ID
+            WHERE i.LOCATION = %s
+        """, (location,))
+        cur.execute("""
+            CREATE TEMP TABLE SYNTHETIC_IMAGES ON COMMIT DROP AS
+            SELECT IMAGE_HASH FROM SYNTHETIC_PRODUCTS WHERE IMAGE_HASH IS NOT NULL
+            UNION
+            SELECT IMAGE_HASH FROM TBL_PRODUCT_IMAGE_DERIVATIVE WHERE PRODUCT_ID IN (SELECT PRODUCT_ID FROM SYNTHETIC_PRODUCTS)
+        """)
+        cur.execute("DELETE FROM TBL_STANDARD_WEIGHT_PRODUCT WHERE PRODUCT_ID IN (SELECT PRODUCT_ID FROM SYNTHETIC_PRODUCTS)")
+        cur.execute("DELETE FROM TBL_PRODUCT_IMAGE_DERIVATIVE WHERE PRODUCT_ID IN (SELECT PRODUCT_ID FROM SYNTHETIC_PRODUCTS)")
+        cur.execute("DELETE FROM TBL_PRODUCT WHERE PRODUCT_ID IN (SELECT PRODUCT_ID FROM SYNTHETIC_PRODUCTS)")
+        cur.execute("DELETE FROM TBL_INVENTORY WHERE INVENTORY_ID IN (SELECT INVENTORY_ID FROM SYNTHETIC_PRODUCTS)")
+        cur.execute("""
+            WITH deleted AS (
+                DELETE FROM TBL_IMAGE
+                WHERE IMAGE_HASH IN (SELECT IMAGE_HASH FROM SYNTHETIC_IMAGES)
+                AND NOT EXISTS (SELECT 1 FROM TBL_PRODUCT p WHERE p.IMAGE_HASH = TBL_IMAGE.IMAGE_HASH)
+                AND NOT EXISTS (SELECT 1 FROM TBL_PRODUCT_IMAGE_DERIVATIVE d WHERE d.IMAGE_HASH = TBL_IMAGE.IMAGE_HASH)
+                RETURNING IMAGE_OID
+            )
+            SELECT lo_unlink(IMAGE_OID) FROM deleted WHERE IMAGE_OID IS NOT NULL
+        """)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog and manifest")
+    parser.add_argument('directory')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--image-bytes', type=int, default=20000)
+    parser.add_argument('--image-format', choices=list(IMAGE_FORMATS) + ['mixed'], default='jpeg')
+    parser.add_argument('--duplicate-images', type=float, default=0.0,
+                        help="fraction of products sharing an earlier product's image")
+    parser.add_argument('--decodable', action='store_true',
+                        help="encode real images with Pillow so --derivatives can process them")
+    parser.add_argument('--location', default=SYNTHETIC_LOCATION)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = generate_catalog(args.directory, args.products, args.image_bytes, args.image_format,
+                            args.duplicate_images, args.decodable, args.location, args.seed)
+    print(f"Wrote {args.products} products to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@
 # Clone the Resource to use it
 import asyncio
 import binascii
+import contextlib
 import functools
 import logging
 import operator
@@ -11,6 +12,21 @@ import threading
 from itertools import cycle
 from bleak import BleakScanner, BleakClient
 
+try:
+    from Tracing import tracer
+except ImportError:
+    # setup.py installs this package without the repo's Tracing module; spans are then no-ops
+    class _NoTracer:
+        enabled = False
+
+        def span(self, name, category='app', **args):
+            return contextlib.nullcontext()
+
+        def traced(self, name=None, category='app'):
+            return lambda function: function
+
+    tracer = _NoTracer()
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -27,7 +43,11 @@ class AsyncioEventLoopThread(threading.Thread):
 
     def run_coro(self, coro, wait_for_result=True):
         if wait_for_result:
-            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+            if not tracer.enabled:
+                return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+            # Covers the handoff to the event loop thread as well as the command itself
+            with tracer.span(f"run_coro {coro.__qualname__}", 'scale'):
+                return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
         else:
             return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
@@ -82,6 +102,7 @@ class DecentScale(AsyncioEventLoopThread):
 
         return wrapper
 
+    @tracer.traced(category='scale')
     async def _find_address(self):
         device = await BleakScanner.find_device_by_filter(
             lambda d, ad: d.name and d.name == 'Decent Scale', timeout=self.timeout
@@ -92,6 +113,7 @@ class DecentScale(AsyncioEventLoopThread):
             logger.error('Error: Scale not found. Trying again...')
             return None
 
+    @tracer.traced(category='scale')
     async def _connect(self, address):
         self.client = BleakClient(address)
         if not self.running:
@@ -107,6 +129,7 @@ class DecentScale(AsyncioEventLoopThread):
         self.connected = False
         return False
 
+    @tracer.traced(category='scale')
     async def _disconnect(self):
         try:
             await self.client.disconnect()
@@ -116,30 +139,41 @@ class DecentScale(AsyncioEventLoopThread):
             logger.error(f"Error: {e}\nTrying again...")
 
     async def __send(self, cmd):
-        await self.client.write_gatt_char(self.CHAR_WRITE, cmd)
-        if self.fix_dropped_command:
-            await asyncio.sleep(self.dropped_command_sleep)
+        with tracer.span("write_gatt_char", 'ble', command=cmd.hex()):
             await self.client.write_gatt_char(self.CHAR_WRITE, cmd)
-        await asyncio.sleep(0.2)
-
+        if self.fix_dropped_command:
+            with tracer.span("dropped command sleep", 'scale'):
+                await asyncio.sleep(self.dropped_command_sleep)
+            with tracer.span("write_gatt_char (repeat)", 'ble', command=cmd.hex()):
+                await self.client.write_gatt_char(self.CHAR_WRITE, cmd)
+        with tracer.span("command settle sleep", 'scale'):
+            await asyncio.sleep(0.2)
+
+    @tracer.traced(category='scale')
     async def _tare(self):
         await self.__send(next(self.tare_commands))
 
+    @tracer.traced(category='scale')
     async def _led_on(self):
         await self.__send(self.led_on_command)
 
+    @tracer.traced(category='scale')
     async def _led_off(self):
         await self.__send(self.led_off_command)
 
+    @tracer.traced(category='scale')
     async def _start_time(self):
         await self.__send(self.start_time_command)
 
+    @tracer.traced(category='scale')
     async def _stop_time(self):
         await self.__send(self.stop_time_command)
 
+    @tracer.traced(category='scale')
     async def _reset_time(self):
         await self.__send(self.reset_time_command)
 
+    @tracer.traced(category='ble')
     def notification_handler(self, sender, data):
         logger.debug(f"Received Notification: {binascii.hexlify(data)}")
 
@@ -172,11 +206,13 @@ class DecentScale(AsyncioEventLoopThread):
         self.weight = weight
         logger.debug(f"Weight updated: {self.weight} g")
 
+    @tracer.traced(category='scale')
     async def _enable_notification(self):
         await self.client.start_notify(self.CHAR_READ, self.notification_handler)
         await asyncio.sleep(1)
         logger.info("Notifications enabled")
 
+    @tracer.traced(category='scale')
     async def _disable_notification(self):
         await self.client.stop_notify(self.CHAR_READ)
         self.weight = None
@@ -0,0 +1,78 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from CatalogImport import ImportStats, parse_row, read_manifest
+
+ROW = {
+    'product_name': 'Tuna Mayo',
+    'standard_weight': '80',
+    'product_description': 'Filling',
+    'product_price': '1.50',
+    'product_type': 'FILLING',
+    'image_path': 'images/tuna.jpg',
+    'inventory_location': 'Counter',
+    'inventory_total_weight': '2000',
+    'inventory_value': '30',
+    'inventory_expiration_date': '2026-11-01T00:00:00',
+}
+
+
+def test_parse_row_converts_types_and_resolves_image_path():
+    row = parse_row(dict(ROW), '/manifests')
+    assert row.standard_weight == 80.0
+    assert row.product_price == 1.5
+    assert row.inventory_expiration_date == datetime(2026, 11, 1)
+    assert row.image_path == os.path.join('/manifests', 'images/tuna.jpg')
+    assert row.salad_weight is None
+
+
+def test_parse_row_keeps_absolute_and_windows_paths():
+    assert parse_row(dict(ROW, image_path='/srv/tuna.jpg'), '/manifests').image_path == '/srv/tuna.jpg'
+    assert parse_row(dict(ROW, image_path='C:\\images\\tuna.jpg'), '/manifests').image_path == 'C:\\images\\tuna.jpg'
+
+
+def test_parse_row_expiration_days_and_blank_weights():
+    record = dict(ROW, standard_weight='', salad_weight='', expiration_days='2')
+    del record['inventory_expiration_date']
+    before = datetime.now()
+    row = parse_row(record)
+    assert row.standard_weight is None and row.salad_weight is None
+    assert (row.inventory_expiration_date - before).days == 2
+
+
+def _write(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_read_manifest_csv(tmp_path):
+    header = ','.join(ROW)
+    rows = [','.join(ROW.values()), ','.join(dict(ROW, product_name='Egg', product_price='cheap').values())]
+    stats = ImportStats()
+    manifest = list(read_manifest(_write(tmp_path / 'products.csv', '\n'.join([header] + rows) + '\n'), stats))
+    assert [row.product_name for row in manifest] == ['Tuna Mayo']
+    assert manifest[0].image_path == os.path.join(str(tmp_path), 'images/tuna.jpg')
+    assert stats.skipped == 1
+
+
+def test_read_manifest_jsonl_skips_blank_lines(tmp_path):
+    text = json.dumps(ROW) + '\n\n' + json.dumps(dict(ROW, product_name='Egg', salad_weight=40)) + '\n'
+    manifest = list(read_manifest(_write(tmp_path / 'products.jsonl', text)))
+    assert [row.product_name for row in manifest] == ['Tuna Mayo', 'Egg']
+    assert manifest[1].salad_weight == 40.0
+
+
+def test_read_manifest_yaml_list_and_documents(tmp_path):
+    yaml = pytest.importorskip('yaml')
+    as_list = list(read_manifest(_write(tmp_path / 'list.yaml', yaml.safe_dump([ROW, dict(ROW, product_name='Egg')]))))
+    as_documents = list(read_manifest(_write(tmp_path / 'docs.yml', yaml.safe_dump_all([ROW, dict(ROW, product_name='Egg')]))))
+    assert [row.product_name for row in as_list] == ['Tuna Mayo', 'Egg']
+    assert [row.product_name for row in as_documents] == ['Tuna Mayo', 'Egg']
+
+
+def test_read_manifest_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        list(read_manifest(_write(tmp_path / 'products.txt', 'x')))
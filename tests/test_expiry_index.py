@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta
+
+from ExpiryIndex import ExpiryEntry, ExpiryIndex, SortedKeys
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def entry(inventory_id, hours, location='Counter', weight=1000.0, value=10.0):
+    return ExpiryEntry(inventory_id=inventory_id, location=location, expires_at=NOW + timedelta(hours=hours),
+                       total_weight=weight, inventory_value=value)
+
+
+def test_sorted_keys_matches_sorted_list_across_bucket_splits():
+    rng = random.Random(7)
+    keys = SortedKeys(load=4)
+    expected = []
+    for i in range(300):
+        key = (NOW + timedelta(minutes=rng.randrange(1000)), f'inv{i}')
+        keys.add(key)
+        expected.append(key)
+    for key in rng.sample(expected, 120):
+        keys.remove(key)
+        expected.remove(key)
+    keys.remove((NOW, 'never-added'))
+    expected.sort()
+    assert len(keys) == len(expected)
+    assert list(keys.irange()) == expected
+    assert keys.first() == expected[0]
+    middle = expected[len(expected) // 2]
+    assert list(keys.irange(middle)) == [key for key in expected if key >= middle]
+
+
+def test_sorted_keys_from_sorted():
+    expected = sorted((NOW + timedelta(minutes=i % 17), f'inv{i}') for i in range(50))
+    keys = SortedKeys.from_sorted(expected, load=8)
+    keys.add((NOW - timedelta(days=1), 'earliest'))
+    assert list(keys.irange()) == [(NOW - timedelta(days=1), 'earliest')] + expected
+
+
+def test_queries_order_across_locations():
+    index = ExpiryIndex()
+    for inventory_id, hours, location in [('a', 5, 'Counter'), ('b', 1, 'Fridge'), ('c', 3, 'Counter'),
+                                          ('d', -2, 'Fridge')]:
+        index.upsert(entry(inventory_id, hours, location))
+    assert [e.inventory_id for e in index.next_expiring(10)] == ['d', 'b', 'c', 'a']
+    assert [e.inventory_id for e in index.next_expiring(10, location='Counter')] == ['c', 'a']
+    assert [e.inventory_id for e in index.next_expiring(2, after=NOW)] == ['b', 'c']
+    assert [e.inventory_id for e in index.expiring_between(NOW, NOW + timedelta(hours=4))] == ['b', 'c']
+
+
+def test_upsert_moves_and_consume_removes():
+    index = ExpiryIndex()
+    index.upsert(entry('a', 5))
+    index.upsert(entry('b', 3))
+    index.upsert(entry('a', 1, location='Fridge'))
+    assert [e.inventory_id for e in index.next_expiring(10)] == ['a', 'b']
+    assert index.locations.keys() == {'Counter', 'Fridge'}
+    index.consume('a', 1000.0)
+    assert [e.inventory_id for e in index.next_expiring(10)] == ['b']
+    assert 'Fridge' not in index.locations
+    remaining = index.consume('b', 250.0)
+    assert remaining.total_weight == 750.0 and remaining.inventory_value == 7.5
+
+
+def test_sweep_announces_each_stage_once():
+    index = ExpiryIndex(warn_before=timedelta(hours=2))
+    index.upsert(entry('soon', 1))
+    index.upsert(entry('later', 10))
+    index.upsert(entry('gone', -1))
+    first = index.sweep(NOW)
+    assert sorted((event.kind, event.entry.inventory_id) for event in first) == [
+        ('expired', 'gone'), ('expiring_soon', 'soon')]
+    assert index.sweep(NOW + timedelta(minutes=1)) == []
+    second = index.sweep(NOW + timedelta(hours=1, minutes=1))
+    assert [(event.kind, event.entry.inventory_id) for event in second] == [('expired', 'soon')]
+    assert [event.sequence for event in index.events_since(0)] == [1, 2, 3]
+
+
+def test_reload_or_upsert_behind_watermark_does_not_repeat_events():
+    index = ExpiryIndex(warn_before=timedelta(hours=2))
+    index.upsert(entry('soon', 1))
+    assert len(index.sweep(NOW)) == 1
+    # Same expiry re-upserted (a refresh): already announced at this stage
+    index.upsert(entry('soon', 1))
+    assert index.sweep(NOW + timedelta(minutes=1)) == []
+    # A new expiry date is a new item as far as announcements go
+    index.upsert(entry('soon', 1.5))
+    assert [event.kind for event in index.sweep(NOW + timedelta(minutes=2))] == ['expiring_soon']
+    # Upserted behind the watermark: picked up from pending rather than missed
+    index.upsert(entry('late-entry', -3))
+    assert [(event.kind, event.entry.inventory_id) for event in index.sweep(NOW + timedelta(minutes=3))] == [
+        ('expired', 'late-entry')]
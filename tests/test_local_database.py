@@ -0,0 +1,92 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg2
+import pytest
+
+from DatabaseManager import Inventory, Product, StandardWeightProduct
+from LocalDatabase import SQLiteDatabaseManager, to_local, translate
+
+
+def test_translate_plain_placeholders():
+    assert translate("SELECT * FROM T WHERE A = %s AND B = %s", ('a', 2)) == (
+        "SELECT * FROM T WHERE A = ? AND B = ?", ['a', 2])
+
+
+def test_translate_without_params_leaves_percent_alone():
+    assert translate("SELECT '100%%'", None) == ("SELECT '100%%'", [])
+    assert translate("SELECT '100%%' WHERE A = %s", (1,)) == ("SELECT '100%' WHERE A = ?", [1])
+
+
+def test_translate_any_expands_list_parameters():
+    query, bound = translate("SELECT * FROM T WHERE ID = ANY(%s) AND KIND = %s", (['x', 'y', 'z'], 'k'))
+    assert query == "SELECT * FROM T WHERE ID IN (?, ?, ?) AND KIND = ?"
+    assert bound == ['x', 'y', 'z', 'k']
+    assert translate("SELECT * FROM T WHERE NOT ID = any( %s )", ([],)) == (
+        "SELECT * FROM T WHERE NOT ID IN ()", [])
+
+
+def test_translate_substring_and_octet_length():
+    query, bound = translate("SELECT substring(IMAGE_DATA FROM %s FOR %s), octet_length(IMAGE_DATA) FROM TBL_IMAGE",
+                             (1, 1024))
+    assert query == "SELECT substr(IMAGE_DATA, ?, ?), length(IMAGE_DATA) FROM TBL_IMAGE"
+    assert bound == [1, 1024]
+
+
+def test_to_local_converts_postgres_types():
+    assert to_local(psycopg2.Binary(b'\x00\x01')) == b'\x00\x01'
+    assert to_local(memoryview(b'ab')) == b'ab'
+    assert to_local(Decimal('1.25')) == 1.25
+    assert to_local(datetime(2026, 10, 19, 12, 30)) == '2026-10-19 12:30:00'
+    assert to_local(date(2026, 10, 19)) == '2026-10-19'
+    assert to_local('text') == 'text'
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'local.sqlite'))
+    yield db
+    db.close()
+
+
+def seed(db):
+    db.cur.execute("INSERT INTO TBL_STANDARD_WEIGHT (STANDARD_WEIGHT_ID, STANDARD_TYPE) VALUES (%s, %s)",
+                   ('sw-filling', 'FILLING'))
+    inventory = Inventory(inventory_id='i1', total_weight=1000.0, inventory_value=20.0,
+                          inventory_expiration_date=datetime(2026, 11, 1), location='Counter')
+    product = Product(product_id='p1', product_name='Tuna Mayo', product_description='Filling', product_price=1.5,
+                      product_type='FILLING', product_image=None, inventory_id='i1')
+    weight = StandardWeightProduct(standard_weight_product_id='swp1', standard_weight=80.0,
+                                   standard_weight_id='sw-filling', product_id='p1')
+    db.bulk_insert([inventory], [product], [weight])
+    return inventory, product, weight
+
+
+def test_bulk_insert_and_inherited_queries(db):
+    seed(db)
+    assert db.get_standard_weight('FILLING').standard_weight_id == 'sw-filling'
+    db.cur.execute("SELECT PRODUCT_NAME FROM TBL_PRODUCT WHERE PRODUCT_ID = ANY(%s)", (['p1', 'missing'],))
+    assert db.cur.fetchall() == [('Tuna Mayo',)]
+
+
+def test_writes_are_recorded_once_per_row_in_the_outbox(db):
+    seed(db)
+    db.commit()
+    inserted = db.pending_changes()
+    # Inventory, product and standard weight product; TBL_STANDARD_WEIGHT is pull-only
+    assert inserted == 3
+    for price in (1.6, 1.7, 1.8):
+        db.cur.execute("UPDATE TBL_PRODUCT SET PRODUCT_PRICE = %s WHERE PRODUCT_ID = %s", (price, 'p1'))
+    db.commit()
+    assert db.pending_changes() == inserted
+
+
+def test_bulk_upsert_keeps_standard_weight_ids(db):
+    inventory, product, weight = seed(db)
+    weight.standard_weight = 90.0
+    db.bulk_upsert([inventory], [product], [weight])
+    db.cur.execute("SELECT STANDARD_WEIGHT_PRODUCT_ID, STANDARD_WEIGHT FROM TBL_STANDARD_WEIGHT_PRODUCT")
+    assert db.cur.fetchall() == [('swp1', 90.0)]
+    db.bulk_upsert([inventory], [product], [])
+    db.cur.execute("SELECT COUNT(*) FROM TBL_STANDARD_WEIGHT_PRODUCT")
+    assert db.cur.fetchone() == (0,)
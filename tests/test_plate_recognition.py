@@ -0,0 +1,105 @@
+import itertools
+import math
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from PlateRecognition import CombinationIndex, PlateRecognizer
+
+ITEMS = [('tuna', 'Tuna', 80.0, 8.0), ('egg', 'Egg', 60.0, 6.0), ('ham', 'Ham', 45.0, 4.5)]
+
+
+def brute_force(items, weight, tolerance, max_items, max_count, item_penalty):
+    # Every plate scored directly, for comparison with the index
+    scored = []
+    for counts in itertools.product(range(max_count + 1), repeat=len(items)):
+        if not 0 < sum(counts) <= max_items:
+            continue
+        total = sum(item[2] * count for item, count in zip(items, counts))
+        variance = sum(item[3] ** 2 * count for item, count in zip(items, counts))
+        if abs(total - weight) <= tolerance:
+            score = -0.5 * (weight - total) ** 2 / variance - 0.5 * math.log(variance) - item_penalty * sum(counts)
+            scored.append((score, {item[0]: count for item, count in zip(items, counts) if count}))
+    return sorted(scored, key=lambda pair: -pair[0])
+
+
+def plate(match):
+    return {item.product_id: item.count for item in match.items}
+
+
+def test_index_enumerates_every_plate():
+    index = CombinationIndex(ITEMS, max_items=4, max_count=2, max_combinations=1000)
+    expected = sum(1 for counts in itertools.product(range(3), repeat=3) if 0 < sum(counts) <= 4)
+    assert len(index) == expected
+
+
+@pytest.mark.parametrize('weight', [45.0, 125.0, 140.0, 205.0, 260.0])
+def test_match_agrees_with_brute_force(weight):
+    index = CombinationIndex(ITEMS, max_items=6, max_count=3, max_combinations=10000)
+    matches = index.match(weight, tolerance=20.0, limit=3, item_penalty=0.5)
+    expected = brute_force(ITEMS, weight, 20.0, 6, 3, 0.5)
+    assert [plate(match) for match in matches] == [combination for _, combination in expected[:3]]
+    assert all(abs(match.difference) <= 20.0 for match in matches)
+    assert matches[0].probability >= matches[-1].probability
+    assert sum(match.probability for match in index.match(weight, 20.0, 1000, 0.5)) == pytest.approx(1.0)
+
+
+def test_match_outside_every_window_is_empty():
+    index = CombinationIndex(ITEMS, max_items=2, max_count=1, max_combinations=100)
+    assert index.match(1000.0, tolerance=10.0, limit=5, item_penalty=0.5) == []
+
+
+def test_pruned_window_keeps_the_best_plate():
+    items = [(f'p{i}', f'P{i}', 30.0 + i * 7.3, 3.0 + i * 0.7) for i in range(12)]
+    index = CombinationIndex(items, max_items=6, max_count=3, max_combinations=500000)
+    for weight in (95.0, 180.0, 333.0, 410.0):
+        full = index.match(weight, weight * 0.05, 1, 0.5, max_window=len(index))
+        pruned = index.match(weight, weight * 0.05, 1, 0.5, max_window=64)
+        assert plate(pruned[0]) == plate(full[0])
+
+
+def test_too_many_combinations_is_a_value_error():
+    with pytest.raises(ValueError):
+        CombinationIndex(ITEMS, max_items=6, max_count=3, max_combinations=10)
+
+
+class Catalog:
+    def __init__(self, weights):
+        self.products = {product_id: SimpleNamespace(product_name=product_id.title(),
+                                                     standard_weights={'FILLING': weight})
+                         for product_id, weight in weights.items()}
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def get(self, product_id):
+        return self.products.get(product_id)
+
+
+def test_recognizer_caches_and_rebuilds_in_the_background():
+    catalog = Catalog({'tuna': 80.0, 'egg': 60.0})
+    recognizer = PlateRecognizer(catalog)
+    index = recognizer.index_for(['tuna', 'egg'])
+    assert recognizer.index_for(['egg', 'tuna']) is index
+
+    catalog.products['tuna'].standard_weights['FILLING'] = 100.0
+    for listener in catalog.listeners:
+        listener({'tuna'})
+    deadline = time.monotonic() + 5
+    while recognizer.index_for(['tuna', 'egg']) is index and time.monotonic() < deadline:
+        time.sleep(0.01)
+    rebuilt = recognizer.index_for(['tuna', 'egg'])
+    assert rebuilt is not index
+    assert dict((item[0], item[2]) for item in rebuilt.items)['tuna'] == 100.0
+    assert plate(recognizer.recognize(200.0, ['tuna', 'egg'])[0]) == {'tuna': 2}
+    stats = recognizer.stats()
+    assert (stats["builds"], stats["rebuilds"], stats["invalidations"]) == (1, 1, 1)
+
+
+def test_recognizer_caps_candidates():
+    catalog = Catalog({f'p{i}': 50.0 + i for i in range(5)})
+    recognizer = PlateRecognizer(catalog, max_candidates=4)
+    with pytest.raises(ValueError):
+        recognizer.recognize(100.0, list(catalog.products))
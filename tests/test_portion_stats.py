@@ -0,0 +1,120 @@
+import json
+import math
+import random
+import statistics
+
+import pytest
+
+from PortionStats import PortionStats, PortionStatsEngine, QuantileSketch, RunningStats
+
+
+def running(values):
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    return stats
+
+
+def test_running_stats_merge_matches_one_stream():
+    rng = random.Random(3)
+    left = [rng.gauss(100, 12) for _ in range(500)]
+    right = [rng.gauss(130, 5) for _ in range(300)]
+    merged = running(left)
+    merged.merge(running(right))
+    merged.merge(RunningStats())
+    assert merged.count == 800
+    assert merged.mean == pytest.approx(statistics.fmean(left + right))
+    assert merged.stddev == pytest.approx(statistics.stdev(left + right))
+    assert (merged.minimum, merged.maximum) == (min(left + right), max(left + right))
+
+
+def test_running_stats_single_value_has_no_variance():
+    assert running([5.0]).variance is None
+
+
+def test_quantile_sketch_tracks_exact_quantiles():
+    rng = random.Random(5)
+    values = [rng.uniform(0, 1000) for _ in range(20000)]
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    ordered = sorted(values)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(ordered[int(q * len(ordered))], abs=10)
+    assert len(sketch.centroids) < 200
+
+
+def test_quantile_sketch_merge_matches_combined_stream():
+    rng = random.Random(9)
+    a_values = [rng.gauss(80, 10) for _ in range(5000)]
+    b_values = [rng.gauss(120, 10) for _ in range(5000)]
+    a, b = QuantileSketch(), QuantileSketch()
+    for value in a_values:
+        a.add(value)
+    for value in b_values:
+        b.add(value)
+    a.merge(b)
+    ordered = sorted(a_values + b_values)
+    assert a.count == 10000
+    assert a.quantile(0.5) == pytest.approx(ordered[5000], abs=2)
+    assert a.quantile(0.9) == pytest.approx(ordered[9000], abs=2)
+
+
+def test_quantile_sketch_empty():
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_portion_stats_round_trip_through_json():
+    stats = PortionStats(product_id='p1', standard_type='FILLING', standard_weight=80.0, price_per_gram=0.02)
+    for weight in (70, 85, 90, 78, 100):
+        stats.add(weight)
+    restored = PortionStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+    assert restored.summary() == stats.summary()
+    assert restored.over_count == 3
+    assert restored.over_grams == pytest.approx(5 + 10 + 20)
+    assert restored.over_cost == pytest.approx(35 * 0.02)
+    assert restored.under_grams == pytest.approx(10 + 2)
+
+
+def test_engine_round_trip_and_merge():
+    a, b = PortionStatsEngine(), PortionStatsEngine()
+    for weight in (80, 82, 84):
+        a.record('p1', weight)
+    for weight in (90, 100):
+        b.record('p1', weight)
+    b.record('p2', 40, 'SALAD')
+    a.merge(PortionStatsEngine.from_dict(json.loads(json.dumps(b.to_dict()))))
+    merged = a.get('p1')
+    assert merged["count"] == 5
+    assert merged["mean"] == pytest.approx(statistics.fmean([80, 82, 84, 90, 100]))
+    assert a.get('p2', 'SALAD')["count"] == 1
+    assert a.get('p2') is None
+
+
+@pytest.mark.parametrize('document', [
+    {},
+    {"compression": 100},
+    {"compression": "many", "stats": []},
+    {"compression": 100, "stats": 5},
+    {"compression": 100, "stats": [{"product_id": "p1"}]},
+    {"compression": 100, "stats": [{"product_id": 1, "standard_type": "FILLING"}]},
+])
+def test_engine_from_dict_rejects_malformed_documents(document):
+    with pytest.raises(ValueError):
+        PortionStatsEngine.from_dict(document)
+
+
+def test_engine_from_dict_rejects_bad_values():
+    engine = PortionStatsEngine()
+    engine.record('p1', 80)
+    document = engine.to_dict()
+    bad_weights = json.loads(json.dumps(document))
+    bad_weights["stats"][0]["weights"] = ["a", 1, 1, 1, 1]
+    bad_sketch = json.loads(json.dumps(document))
+    bad_sketch["stats"][0]["sketch"]["compression"] = 0
+    short_over = json.loads(json.dumps(document))
+    short_over["stats"][0]["over"] = [1, 2]
+    for bad in (bad_weights, bad_sketch, short_over):
+        with pytest.raises(ValueError):
+            PortionStatsEngine.from_dict(bad)
+    assert math.isfinite(PortionStatsEngine.from_dict(document).get('p1')["mean"])
@@ -0,0 +1,104 @@
+import contextlib
+import hashlib
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from DatabaseManager import StoredImage
+from ImageStore import ImageStore
+from LocalDatabase import SQLiteDatabaseManager
+from ProductImageAPI import IMMUTABLE_CACHE_CONTROL, ImageCache, create_image_blueprint
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+IMAGE_HASH = hashlib.sha256(PNG).hexdigest()
+
+
+class SinglePool:
+    # The blueprint only needs database_manager(); every request shares one SQLite store
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    @contextlib.contextmanager
+    def database_manager(self, timeout=None):
+        yield self.db_manager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'images.sqlite'))
+    ImageStore(db).put(StoredImage(image_hash=IMAGE_HASH, content_type='image/png', image_data=PNG,
+                                   byte_size=len(PNG)))
+    db.cur.execute("INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, IMAGE_HASH) VALUES (%s, %s, %s)",
+                   ('p1', 'Tuna Mayo', IMAGE_HASH))
+    db.cur.execute("INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_IMAGE) VALUES (%s, %s, %s)",
+                   ('legacy', 'Egg', PNG[::-1]))
+    db.commit()
+    yield db
+    db.close()
+
+
+def client(db, **kwargs):
+    app = flask.Flask(__name__)
+    app.register_blueprint(create_image_blueprint(SinglePool(db), **kwargs))
+    return app.test_client()
+
+
+def test_image_by_hash_sets_etag_and_immutable_caching(db):
+    response = client(db).get(f'/images/{IMAGE_HASH}')
+    assert response.status_code == 200
+    assert response.data == PNG
+    assert response.get_etag() == (IMAGE_HASH, False)
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_if_none_match_returns_304(db):
+    response = client(db).get(f'/images/{IMAGE_HASH}', headers={'If-None-Match': f'"{IMAGE_HASH}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_single_range(db):
+    response = client(db).get(f'/images/{IMAGE_HASH}', headers={'Range': 'bytes=8-15'})
+    assert response.status_code == 206
+    assert response.data == PNG[8:16]
+    assert response.headers['Content-Range'] == f'bytes 8-15/{len(PNG)}'
+
+
+def test_unsatisfiable_range_returns_416(db):
+    response = client(db).get(f'/images/{IMAGE_HASH}', headers={'Range': f'bytes={len(PNG) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(PNG)}'
+
+
+def test_if_range_with_stale_etag_sends_whole_image(db):
+    response = client(db).get(f'/images/{IMAGE_HASH}', headers={'Range': 'bytes=0-3', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == PNG
+
+
+def test_ranges_streamed_for_images_too_large_to_cache(db):
+    app = client(db, cache=ImageCache(max_item_bytes=16))
+    response = app.get(f'/images/{IMAGE_HASH}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == PNG[100:200]
+
+
+def test_product_image_and_unknown_size(db):
+    app = client(db)
+    response = app.get('/products/p1/image')
+    assert response.status_code == 200
+    assert response.get_etag() == (IMAGE_HASH, False)
+    assert app.get('/products/p1/image/huge').status_code == 400
+    assert app.get('/products/missing/image').status_code == 404
+    assert app.get('/images/not-a-hash').status_code == 404
+
+
+def test_legacy_image_hash_survives_a_new_process(db):
+    legacy_hash = client(db).get('/products/legacy/image').get_etag()[0]
+    assert legacy_hash == hashlib.sha256(PNG[::-1]).hexdigest()
+    # A fresh blueprint has an empty LRU, like a restarted server
+    response = client(db).get(f'/images/{legacy_hash}')
+    assert response.status_code == 200
+    assert response.data == PNG[::-1]
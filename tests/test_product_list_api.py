@@ -0,0 +1,99 @@
+import contextlib
+import gzip
+import json
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from LocalDatabase import SQLiteDatabaseManager
+from ProductListAPI import create_product_list_blueprint, decode_cursor, encode_cursor
+
+# standard_weights uses json_object_agg, which only PostgreSQL has
+FIELDS = 'product_id,product_name,product_type,product_price,image_url'
+
+
+class SinglePool:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    @contextlib.contextmanager
+    def database_manager(self, timeout=None):
+        yield self.db_manager
+
+
+@pytest.fixture
+def client(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'products.sqlite'))
+    for i in range(7):
+        db.cur.execute("""
+            INSERT INTO TBL_PRODUCT (PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRODUCT_PRICE, PRODUCT_TYPE)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (f'p{i}', f'Product {i}', 'x' * 400, 1.0 + i, 'SALAD' if i % 3 == 0 else 'FILLING'))
+    db.commit()
+    app = flask.Flask(__name__)
+    app.register_blueprint(create_product_list_blueprint(SinglePool(db)))
+    yield app.test_client()
+    db.close()
+
+
+def pages(client, query):
+    cursor, seen = None, []
+    while True:
+        response = client.get(f'/products?{query}' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        body = response.get_json()
+        seen.append([product["product_id"] for product in body["products"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('5f0c-ä')) == '5f0c-ä'
+
+
+def test_keyset_pages_cover_every_product_once(client):
+    assert pages(client, f'fields={FIELDS}&limit=3') == [['p0', 'p1', 'p2'], ['p3', 'p4', 'p5'], ['p6']]
+
+
+def test_exact_multiple_of_the_page_size_has_no_empty_last_page(client):
+    assert pages(client, f'fields={FIELDS}&limit=7') == [['p0', 'p1', 'p2', 'p3', 'p4', 'p5', 'p6']]
+
+
+def test_product_type_filter_pages(client):
+    assert pages(client, f'fields={FIELDS}&limit=2&product_type=SALAD') == [['p0', 'p3'], ['p6']]
+
+
+def test_field_projection_and_values(client):
+    body = client.get('/products?fields=product_name,image_url,product_price&limit=1').get_json()
+    assert body["products"] == [{"product_name": "Product 0", "image_url": "/products/p0/image",
+                                 "product_price": 1.0}]
+    assert body["limit"] == 1
+
+
+@pytest.mark.parametrize('query', ['cursor=***', 'cursor=_w', 'fields=product_name,password', 'fields=,'])
+def test_bad_requests(client, query):
+    assert client.get(f'/products?{query}').status_code == 400
+
+
+def test_empty_cursor_is_the_first_page(client):
+    body = client.get(f'/products?fields={FIELDS}&limit=2&cursor=').get_json()
+    assert [product["product_id"] for product in body["products"]] == ['p0', 'p1']
+
+
+def test_limit_is_clamped(client):
+    assert client.get(f'/products?fields={FIELDS}&limit=0').get_json()["limit"] == 1
+    assert client.get(f'/products?fields={FIELDS}&limit=100000').get_json()["limit"] == 500
+
+
+def test_large_pages_are_gzipped_when_accepted(client):
+    query = '/products?fields=product_id,product_description&limit=7'
+    plain = client.get(query)
+    assert 'Content-Encoding' not in plain.headers
+    compressed = client.get(query, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    small = client.get('/products?fields=product_id&limit=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers